@@ -0,0 +1,302 @@
+import asyncio
+import logging
+import math
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Callable, Iterator
+
+from metrics import metrics
+from resilience import Overloaded
+
+logger = logging.getLogger(__name__)
+
+BACKGROUND_SESSION = "background"
+POLL_INTERVAL = 0.25
+# weight of the latest call in the moving average of the time a call holds its slot
+HOLD_SMOOTHING = 0.2
+
+
+class AdmissionRejected(Overloaded):
+
+    def __init__(self, name: str, estimated_wait: float):
+        super().__init__(f"{name} is overloaded, estimated wait {estimated_wait:.1f}s", name, estimated_wait)
+        self.estimated_wait = estimated_wait
+
+
+@dataclass(frozen=True)
+class QueuePosition:
+    name: str
+    position: int
+    estimated_wait: float
+
+
+@dataclass(frozen=True)
+class AdmissionSession:
+    session_id: str
+    on_wait: Callable[[QueuePosition], None] | None = None
+
+
+# set per Streamlit session, tasks on the background loop inherit it from the submitting thread
+current_session: ContextVar[AdmissionSession | None] = ContextVar("admission_session", default=None)
+
+
+@contextmanager
+def admission_session(session_id: str, on_wait: Callable[[QueuePosition], None] | None = None) -> Iterator[None]:
+    token = current_session.set(AdmissionSession(session_id, on_wait))
+    try:
+        yield
+    finally:
+        current_session.reset(token)
+
+
+@dataclass
+class AdmissionStats:
+    admitted: int = 0
+    shed: int = 0
+    timed_out: int = 0
+    queued: int = 0
+    in_flight: int = 0
+    max_queued: int = 0
+    average_hold: float = 0.0
+
+
+class TokenBucket:
+
+    def __init__(self, rate: float, burst: int, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+        self._tokens = float(burst)
+        self._updated = clock()
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def available(self) -> float:
+        self._refill()
+        return self._tokens
+
+    def try_take(self) -> bool:
+        self._refill()
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    def time_until(self, tokens: float) -> float:
+        # seconds until the given number of tokens has been refilled
+        missing = tokens - self.available()
+        return max(0.0, missing / self.rate) if self.rate > 0 else math.inf
+
+
+@dataclass(eq=False)
+class _Waiter:
+    session_id: str
+    deadline: float
+    notify: Callable[[], None]
+    granted: bool = False
+    last_position: int = field(default=0)
+
+
+class AdmissionController:
+    # process-wide limiter for one upstream service: a token bucket for the request rate, a cap on calls in
+    # flight, and one FIFO queue per session which are served round-robin, so no session can starve the others
+
+    def __init__(
+        self,
+        name: str,
+        rate: float = 5.0,
+        burst: int = 10,
+        max_in_flight: int = 32,
+        deadline: float = 20.0,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.name = name
+        self.deadline = deadline
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._queues: dict[str, deque[_Waiter]] = {}
+        self._stats = AdmissionStats()
+        self.configure(rate=rate, burst=burst, max_in_flight=max_in_flight, deadline=deadline)
+
+    def configure(
+        self,
+        rate: float | None = None,
+        burst: int | None = None,
+        max_in_flight: int | None = None,
+        deadline: float | None = None
+    ):
+        with self._lock:
+            bucket = getattr(self, "_bucket", None)
+            self._bucket = TokenBucket(
+                rate if rate is not None else bucket.rate,
+                burst if burst is not None else bucket.burst,
+                self._clock
+            )
+            if max_in_flight is not None:
+                self.max_in_flight = max_in_flight
+            if deadline is not None:
+                self.deadline = deadline
+
+    def stats(self) -> AdmissionStats:
+        with self._lock:
+            return AdmissionStats(**{**vars(self._stats), "queued": sum(map(len, self._queues.values()))})
+
+    def _position(self, waiter: _Waiter) -> int:
+        # rank of the waiter in round-robin order: sessions ahead in the rotation get one more turn in its round
+        sessions = list(self._queues)
+        own = self._queues[waiter.session_id]
+        index = own.index(waiter)
+        rotation = sessions.index(waiter.session_id)
+        ahead = index
+        for position, session_id in enumerate(sessions):
+            if session_id != waiter.session_id:
+                ahead += min(len(self._queues[session_id]), index + 1 if position < rotation else index)
+        return ahead + 1
+
+    def _estimate_wait(self, position: int) -> float:
+        rate_wait = self._bucket.time_until(position)
+        free_slots = self.max_in_flight - self._stats.in_flight
+        if position <= free_slots:
+            return rate_wait
+        # every round of max_in_flight calls ahead takes about one average hold time
+        rounds = math.ceil((position - free_slots) / self.max_in_flight)
+        return max(rate_wait, rounds * self._stats.average_hold)
+
+    def _dispatch(self):
+        while self._queues and self._stats.in_flight < self.max_in_flight and self._bucket.try_take():
+            session_id = next(iter(self._queues))
+            queue = self._queues.pop(session_id)
+            waiter = queue.popleft()
+            if queue:
+                # the session goes to the back of the rotation
+                self._queues[session_id] = queue
+            waiter.granted = True
+            self._stats.in_flight += 1
+            self._stats.admitted += 1
+            waiter.notify()
+
+    def _enqueue(self, session_id: str, notify: Callable[[], None]) -> _Waiter:
+        with self._lock:
+            waiter = _Waiter(session_id=session_id, deadline=self._clock() + self.deadline, notify=notify)
+            self._queues.setdefault(session_id, deque()).append(waiter)
+            self._dispatch()
+            if waiter.granted:
+                return waiter
+
+            # calls which would not get through in time are shed right away instead of hanging until the deadline
+            estimated_wait = self._estimate_wait(self._position(waiter))
+            if estimated_wait > self.deadline:
+                self._remove(waiter)
+                self._stats.shed += 1
+                metrics.increment("admission_shed", upstream=self.name)
+                raise AdmissionRejected(self.name, estimated_wait)
+
+            self._stats.max_queued = max(self._stats.max_queued, sum(map(len, self._queues.values())))
+            return waiter
+
+    def _remove(self, waiter: _Waiter):
+        queue = self._queues.get(waiter.session_id)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            if not queue:
+                del self._queues[waiter.session_id]
+
+    def _abandon(self, waiter: _Waiter):
+        with self._lock:
+            if waiter.granted:
+                self._stats.in_flight -= 1
+            else:
+                self._remove(waiter)
+            self._dispatch()
+
+    def _release(self, held: float):
+        with self._lock:
+            self._stats.in_flight -= 1
+            if self._stats.average_hold:
+                held = HOLD_SMOOTHING * held + (1 - HOLD_SMOOTHING) * self._stats.average_hold
+            self._stats.average_hold = held
+            self._dispatch()
+
+    def _poll(self, waiter: _Waiter, session: AdmissionSession | None) -> float | None:
+        # returns the time to wait before polling again, None once the waiter is admitted
+        with self._lock:
+            self._dispatch()
+            if waiter.granted:
+                return None
+
+            now = self._clock()
+            if now >= waiter.deadline:
+                self._remove(waiter)
+                self._stats.timed_out += 1
+                metrics.increment("admission_timeouts", upstream=self.name)
+                raise AdmissionRejected(self.name, self.deadline)
+
+            position = self._position(waiter)
+            estimated_wait = self._estimate_wait(position)
+            # without a free token the next one is waited for, otherwise a released slot wakes the waiter up
+            token_wait = self._bucket.time_until(1) or POLL_INTERVAL
+            interval = max(0.01, min(POLL_INTERVAL, waiter.deadline - now, token_wait))
+
+        if session is not None and session.on_wait is not None and position != waiter.last_position:
+            waiter.last_position = position
+            try:
+                session.on_wait(QueuePosition(self.name, position, estimated_wait))
+            except Exception as e:
+                logger.warning(f"could not report queue position: {e}")
+        return interval
+
+    @contextmanager
+    def admit(self) -> Iterator[None]:
+        session = current_session.get()
+        admitted = threading.Event()
+        waiter = self._enqueue(session.session_id if session else BACKGROUND_SESSION, admitted.set)
+        started = self._clock()
+        if not waiter.granted:
+            try:
+                while not waiter.granted and (interval := self._poll(waiter, session)) is not None:
+                    admitted.wait(interval)
+            except BaseException:
+                self._abandon(waiter)
+                raise
+            metrics.observe("admission_wait_seconds", self._clock() - started, upstream=self.name)
+
+        admitted_at = self._clock()
+        try:
+            yield
+        finally:
+            self._release(self._clock() - admitted_at)
+
+    @asynccontextmanager
+    async def aadmit(self) -> AsyncIterator[None]:
+        session = current_session.get()
+        loop = asyncio.get_running_loop()
+        admitted = asyncio.Event()
+        waiter = self._enqueue(
+            session.session_id if session else BACKGROUND_SESSION,
+            lambda: loop.call_soon_threadsafe(admitted.set)
+        )
+        started = self._clock()
+        if not waiter.granted:
+            try:
+                while not waiter.granted and (interval := self._poll(waiter, session)) is not None:
+                    try:
+                        await asyncio.wait_for(admitted.wait(), interval)
+                    except TimeoutError:
+                        pass
+            except BaseException:
+                self._abandon(waiter)
+                raise
+            metrics.observe("admission_wait_seconds", self._clock() - started, upstream=self.name)
+
+        admitted_at = self._clock()
+        try:
+            yield
+        finally:
+            self._release(self._clock() - admitted_at)
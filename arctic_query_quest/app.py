@@ -1,38 +1,294 @@
 import logging
-import time
+from concurrent.futures import Future
+from dataclasses import dataclass
 
 import streamlit as st
-from streamlit_js_eval import streamlit_js_eval
-from streamlit_lottie import st_lottie
 
-from arctic import ArcticClient, ArcticQuiz
-from common import AppState, load_model, read
-from prompt import PromptGenerator, get_difficulty_by_name
-from tts import SpeechClient
+from admission import admission_session
+from arctic import QUIZ_EVENT, ArcticQuiz
+from attempts import AttemptEvent, AttemptRegistry, QuizAttempt, new_attempt_id
+from common import (
+    LOADING_ANIMATION,
+    MODEL_BACKGROUNDS,
+    OVERVIEW,
+    START_ANIMATION,
+    AppState,
+    get_model_name,
+    image,
+    load_model,
+    lottie,
+    read,
+    reload_page,
+    session_id,
+    static_url
+)
+from corpus import QuizCorpus
+from event_loop import background_loop
+from generator import QuizGenerator, QuizSpeech
+from pool import PooledQuiz, QuizPool
+from prompt import get_difficulty_by_name
+from registry import registry
+from resilience import Overloaded
+from resources import QUIZ_ATTEMPTS, QUIZ_CORPUS, QUIZ_GENERATOR, QUIZ_POOL
+from session_store import ANSWERS_AUDIO, EXPLANATION_AUDIO, QUESTION_AUDIO, session_store
 
 logger = logging.getLogger(__name__)
 
+SPEECH_TIMEOUT = 10.0
+# longest a script run follows a quiz attempt, queueing, retries and the fallback generation included
+ATTEMPT_TIMEOUT = 180.0
+ATTEMPT_PARAM = "attempt"
+
+QUIZ_PROGRESS = {
+    "pool": (10, "Exploring the Arctic for you 🏔️..."),
+    "generation": (20, "Generating a quiz for you 🤖..."),
+    "question": (40, "Writing down the question ✍️..."),
+    "answers": (60, "Thinking about answers 💡..."),
+    "speech": (85, "Generating speech 💬..."),
+    "ready": (100, "Get ready for the Arctic Query Quiz 🏔️..."),
+}
+
+# events of a quiz attempt, replayed to every script run which shows the attempt
+EVENT_PROGRESS = "progress"
+EVENT_QUEUE = "queue"
+EVENT_DELTA = "delta"
+EVENT_QUESTION = "question"
+EVENT_RESET = "reset"
+
+
+@dataclass(frozen=True)
+class QuizResult:
+    pooled_quiz: PooledQuiz
+    quiz_speech: Future[QuizSpeech]
+    quiz_id: int
+    streamed: bool
+    # generated for this attempt, not served from the pool or the corpus
+    generated: bool
+
 
 class ArcticQueryQuest:
 
     def __init__(self):
-        self.prompt_generator: PromptGenerator = PromptGenerator()
-        self.arctic_client: ArcticClient = ArcticClient()
-        self.tts_client: SpeechClient = SpeechClient(
-            st.secrets.gcp.project_id,
-            st.secrets.gcp.private_key_id,
-            st.secrets.gcp.private_key,
-            st.secrets.gcp.client_email,
-            st.secrets.gcp.client_id,
-            st.secrets.gcp.client_x509_cert_url
+        self.attempts: AttemptRegistry = registry.get(QUIZ_ATTEMPTS)
+        self.placeholder = st.empty()
+        self.restore_attempt()
+
+    @property
+    def quiz_generator(self) -> QuizGenerator:
+        # created on first use, the START page does not need the generation stack
+        return registry.get(QUIZ_GENERATOR)
+
+    @staticmethod
+    def progress(progress_bar, stage: str):
+        value, text = QUIZ_PROGRESS[stage]
+        progress_bar.progress(value, text=text)
+
+    def restore_attempt(self):
+        # a browser refresh starts a new session, the attempt id in the URL leads it back to the quiz it showed
+        attempt_id = st.query_params.get(ATTEMPT_PARAM)
+        if attempt_id is None or st.session_state.quiz_attempt is not None:
+            return
+
+        attempt = self.attempts.get(attempt_id)
+        if attempt is None or attempt.future.done() and attempt.future.exception() is not None:
+            del st.query_params[ATTEMPT_PARAM]
+            return
+
+        logger.info(f"restoring quiz attempt {attempt_id}")
+        st.session_state.quiz_attempt = attempt_id
+        st.session_state.db_model = attempt.db_model
+        st.session_state.difficulty = attempt.difficulty.name.capitalize()
+        st.session_state.app_state = AppState.QUIZ
+
+    def stream(self, attempt: QuizAttempt) -> tuple[PooledQuiz, Future[QuizSpeech]]:
+        prompt = self.quiz_generator.prompt(attempt.db_model, attempt.difficulty)
+        speech_future: Future[bytes] | None = None
+        generated_quiz: ArcticQuiz | None = None
+
+        try:
+            for event in self.quiz_generator.arctic_client.stream_quiz(prompt):
+                if event.field == QUIZ_EVENT:
+                    generated_quiz = event.value
+                elif event.field == "question" and event.complete:
+                    # start speech synthesis while answers and explanation are still generated
+                    speech_future = background_loop.submit(
+                        self.quiz_generator.tts_client.asynthesize_chunked(event.value)
+                    )
+                    attempt.emit(EVENT_QUESTION)
+                elif event.field == "question" and event.delta:
+                    attempt.emit(EVENT_DELTA, event.delta)
+
+            # a rejected quiz falls back to regular generation like any other streaming failure
+            self.quiz_generator.verify(attempt.db_model, generated_quiz)
+        except BaseException:
+            # the quiz is never shown, like the prediction its question audio is stopped instead of paid for
+            if speech_future is not None:
+                speech_future.cancel()
+            raise
+        if speech_future is None:
+            # the stream never reported a complete question, e.g. a field order the parser did not expect
+            speech_future = background_loop.submit(
+                self.quiz_generator.tts_client.asynthesize_chunked(generated_quiz.question)
+            )
+        # answers and explanation are synthesized while the question audio is still being finished
+        quiz_speech = self.quiz_generator.speech(PooledQuiz(quiz=generated_quiz, speech_question=b""))
+        attempt.emit(EVENT_PROGRESS, "speech")
+        try:
+            speech_question = speech_future.result()
+        except Overloaded as e:
+            # the quiz is worth more than its audio
+            logger.warning(f"serving quiz without question audio: {e}")
+            speech_question = b""
+        return PooledQuiz(quiz=generated_quiz, speech_question=speech_question), quiz_speech
+
+    def produce(self, attempt: QuizAttempt, session_id: str, seen_quizzes: frozenset[int]) -> QuizResult:
+        # runs in the background, independent of the script run which started it and marks the quiz as seen
+        with admission_session(session_id, on_wait=lambda queue_position: attempt.emit(EVENT_QUEUE, queue_position)):
+            db_model, difficulty = attempt.db_model, attempt.difficulty
+            attempt.emit(EVENT_PROGRESS, "pool")
+            quiz_pool: QuizPool = registry.get(QUIZ_POOL)
+            corpus: QuizCorpus = registry.get(QUIZ_CORPUS)
+            quiz_id: int | None = None
+            quiz_speech: Future[QuizSpeech] | None = None
+            streamed = generated = False
+
+            # a near-duplicate only for this session, other sessions can still be served with it
+            duplicates: list[PooledQuiz] = []
+            pooled_quiz = quiz_pool.get(db_model, difficulty)
+            while pooled_quiz is not None and corpus.find_duplicate(db_model, pooled_quiz.quiz) in seen_quizzes:
+                duplicates.append(pooled_quiz)
+                # bounded, the pool may hold nothing else this session has not seen
+                if len(duplicates) >= quiz_pool.high_watermark:
+                    pooled_quiz = None
+                    break
+                pooled_quiz = quiz_pool.get(db_model, difficulty)
+            if duplicates:
+                logger.info(f"returning {len(duplicates)} pooled quizzes, the session has seen near-identical ones")
+                quiz_pool.put_back(db_model, difficulty, duplicates)
+
+            # stored quizzes are served before paying for a live generation, pooled quizzes join the corpus once served
+            if pooled_quiz is None and (corpus_quiz := corpus.sample(db_model, difficulty, seen_quizzes)):
+                quiz_id, pooled_quiz = corpus_quiz.id, corpus_quiz.pooled_quiz
+
+            if pooled_quiz is None:
+                attempt.emit(EVENT_PROGRESS, "generation")
+                try:
+                    pooled_quiz, quiz_speech = self.stream(attempt)
+                    streamed = generated = True
+                except Overloaded as e:
+                    # rather a quiz the session has seen before than waiting for upstream capacity
+                    attempt.emit(EVENT_RESET)
+                    if (corpus_quiz := corpus.sample(db_model, difficulty)) is None:
+                        raise
+                    logger.warning(f"serving a stored quiz again, no live generation possible: {e}")
+                    quiz_id, pooled_quiz = corpus_quiz.id, corpus_quiz.pooled_quiz
+                except Exception as e:
+                    logger.warning(f"streaming quiz generation failed, falling back: {e}")
+                    attempt.emit(EVENT_RESET)
+                    pooled_quiz = self.quiz_generator.generate(db_model, difficulty)
+                    generated = True
+
+            if quiz_id is None:
+                quiz_id = corpus.add(db_model, difficulty, pooled_quiz)
+
+            if quiz_speech is None:
+                quiz_speech = self.quiz_generator.speech(pooled_quiz)
+
+            return QuizResult(
+                pooled_quiz=pooled_quiz,
+                quiz_speech=quiz_speech,
+                quiz_id=quiz_id,
+                streamed=streamed,
+                generated=generated
+            )
+
+    def follow(self, attempt: QuizAttempt, progress_bar, loading_placeholder, question_placeholder) -> QuizResult:
+        # renders the events of the attempt, a rerun replays them before following the ones still to come
+        events = attempt.events(timeout=ATTEMPT_TIMEOUT)
+        reset = False
+
+        def question_deltas(first_delta: str):
+            nonlocal reset
+            yield first_delta
+            for next_event in events:
+                if next_event.kind == EVENT_DELTA:
+                    yield next_event.value
+                elif next_event.kind == EVENT_QUESTION:
+                    self.progress(progress_bar, "answers")
+                    return
+                elif next_event.kind == EVENT_RESET:
+                    reset = True
+                    return
+                else:
+                    self.show(next_event, progress_bar)
+
+        for event in events:
+            if event.kind == EVENT_DELTA:
+                loading_placeholder.empty()
+                self.progress(progress_bar, "question")
+                with question_placeholder.container():
+                    st.markdown("## :speech_balloon: Question")
+                    with st.chat_message("assistant"):
+                        st.write_stream(question_deltas(event.value))
+            elif event.kind == EVENT_QUESTION:
+                self.progress(progress_bar, "answers")
+            elif event.kind == EVENT_RESET:
+                reset = True
+            else:
+                self.show(event, progress_bar)
+
+            if reset:
+                question_placeholder.empty()
+                reset = False
+
+        return attempt.future.result()
+
+    def show(self, event: AttemptEvent, progress_bar):
+        if event.kind == EVENT_PROGRESS:
+            self.progress(progress_bar, event.value)
+        elif event.kind == EVENT_QUEUE:
+            progress_bar.progress(
+                QUIZ_PROGRESS["generation"][0],
+                text=f"The Arctic is busy, you are number {event.value.position} in the queue "
+                     f"(about {event.value.estimated_wait:.0f}s) ⏳..."
+            )
+
+    def start_attempt(self) -> tuple[QuizAttempt, bool]:
+        if st.session_state.quiz_attempt is None:
+            st.session_state.quiz_attempt = new_attempt_id()
+
+        current_session = session_id()
+        # a snapshot, the production runs on a worker thread
+        seen_quizzes = frozenset(st.session_state.seen_quizzes)
+        return self.attempts.start(
+            st.session_state.quiz_attempt,
+            get_model_name(),
+            get_difficulty_by_name(st.session_state.difficulty),
+            lambda attempt: self.produce(attempt, current_session, seen_quizzes)
         )
 
-        self.placeholder = st.empty()
+    @staticmethod
+    def resolve_speech(quiz_speech: Future[QuizSpeech] | None) -> QuizSpeech | None:
+        if quiz_speech is None:
+            return None
+
+        try:
+            return quiz_speech.result(timeout=SPEECH_TIMEOUT)
+        except Exception as e:
+            logger.warning(f"could not synthesize answers and explanation: {e}")
+            return None
 
     def set_state(self, state: AppState):
         logger.info(f"switching state to {state}")
         self.placeholder.empty()
         st.session_state.app_state = state
+        if state == AppState.QUIZ:
+            # every quiz gets a new attempt, reruns of the same quiz keep it
+            st.session_state.quiz_attempt = new_attempt_id()
+            st.query_params[ATTEMPT_PARAM] = st.session_state.quiz_attempt
+        else:
+            st.session_state.quiz_attempt = None
+            st.query_params.pop(ATTEMPT_PARAM, None)
 
     def start(self):
         with self.placeholder.container():
@@ -53,14 +309,8 @@ class ArcticQueryQuest:
 
                     st.session_state.db_model = db_model
 
-                    model_backgrounds = {
-                        "Shop": "https://files.janz.sh/arctic/model-shop.jpg",
-                        "Game": "https://files.janz.sh/arctic/model-game.jpg",
-                        "Books": "https://files.janz.sh/arctic/model-books.jpg"
-                    }
-
-                    if background := model_backgrounds.get(db_model, ""):
-                        st.html(f"<style>.stRadio {{ background: url({background}); }}</style>")
+                    if background := MODEL_BACKGROUNDS.get(db_model):
+                        st.html(f"<style>.stRadio {{ background: url({static_url(background)}); }}</style>")
 
                     difficulty = st.select_slider(
                         label=":star: Select difficulty level:",
@@ -68,7 +318,7 @@ class ArcticQueryQuest:
                     )
                     st.session_state.difficulty = difficulty
                 with col2:
-                    st_lottie("https://lottie.host/fe98088d-45bc-4b23-b45c-5b9d97dfab74/h8Y01cq58s.json", width=350)
+                    lottie(START_ANIMATION, width=350)
 
             with tab_about:
                 col1, col2 = st.columns(2)
@@ -78,7 +328,7 @@ class ArcticQueryQuest:
 
                 with col2:
                     with st.expander("Open to see a system overview..."):
-                        st.image("images/overview.png", use_column_width=True)
+                        image(OVERVIEW, use_column_width=True)
 
             model = load_model()
             with st.expander(f"Open to see selected database model (`{st.session_state.db_model}`)..."):
@@ -87,8 +337,22 @@ class ArcticQueryQuest:
             with st.container(border=True):
                 st.button(":video_game: Start the Quest!", on_click=self.set_state, args=(AppState.QUIZ,))
 
-    def answer(self, generated_quiz: ArcticQuiz, user_answer: int):
-        st.session_state.generated_quiz = generated_quiz
+    @staticmethod
+    def keep_speech(current_session: str, generated_quiz: ArcticQuiz, speech: QuizSpeech):
+        # a late synthesis must not attach its audio to the next quiz of the session
+        session_store.set_audio(current_session, ANSWERS_AUDIO, speech.answers, quiz=generated_quiz)
+        session_store.set_audio(current_session, EXPLANATION_AUDIO, speech.explanation, quiz=generated_quiz)
+
+    @staticmethod
+    def keep_speech_when_done(current_session: str, generated_quiz: ArcticQuiz, quiz_speech: Future[QuizSpeech]):
+        # the explanation is played on the EVALUATE page, also when speech synthesis outlasts the quiz page
+        def keep(future: Future[QuizSpeech]):
+            if future.exception() is None:
+                ArcticQueryQuest.keep_speech(current_session, generated_quiz, future.result())
+
+        quiz_speech.add_done_callback(keep)
+
+    def answer(self, user_answer: int):
         st.session_state.user_answer = user_answer
         self.set_state(AppState.EVALUATE)
 
@@ -110,65 +374,105 @@ class ArcticQueryQuest:
 
             loading_placeholder = st.empty()
             with loading_placeholder.container():
-                st_lottie("https://lottie.host/44ed2dbd-c55b-49c5-9031-873c231768b2/TmmqUQG5Bt.json", width=400)
+                lottie(LOADING_ANIMATION, width=400)
 
-            time.sleep(2)
+            question_placeholder = st.empty()
+            streamed = False
+            quiz_speech: Future[QuizSpeech] | None = None
 
             try:
-                progress_bar.progress(20, text="Generating a quiz for you 🤖...")
-                prompt = self.prompt_generator.generate_prompt(
-                    model=model,
-                    difficulty=get_difficulty_by_name(st.session_state.difficulty),
-                )
-
-                generated_quiz = self.arctic_client.invoke(prompt)
-
-                progress_bar.progress(60, text="Generating speech 💬...")
-                speech_question = self.tts_client.synthesize(generated_quiz.question)
+                # reruns attach to the attempt they belong to, a quiz is generated once per attempt
+                attempt, reused = self.start_attempt()
+                result = self.follow(attempt, progress_bar, loading_placeholder, question_placeholder)
+                if reused:
+                    logger.info(f"reused quiz attempt {attempt.attempt_id}")
+                    if result.generated:
+                        # pooled and stored quizzes cost no upstream calls in the first place
+                        self.attempts.record_saved(self.quiz_generator.upstream_calls(result.pooled_quiz.quiz))
+
+                st.session_state.seen_quizzes.add(result.quiz_id)
+                generated_quiz = result.pooled_quiz.quiz
+                streamed = result.streamed
+                quiz_speech = result.quiz_speech
+                # the session keeps the quiz and its audio in the bounded session store, not in its state
+                session_store.set_quiz(session_id(), generated_quiz)
+                if result.pooled_quiz.speech_question:
+                    session_store.set_audio(session_id(), QUESTION_AUDIO, result.pooled_quiz.speech_question)
+                self.keep_speech_when_done(session_id(), generated_quiz, quiz_speech)
+
+                self.progress(progress_bar, "ready")
+                loading_placeholder.empty()
 
-                progress_bar.progress(100, text="Get ready for the Arctic Query Quiz 🏔️...")
-                time.sleep(1)
+            except Overloaded as e:
+                logger.warning(f"quiz generation short-circuited: {e}")
+                loading_placeholder.empty()
+                st.warning(
+                    f"The Arctic is a bit overcrowded right now 🥶 - please try again in {e.retry_after:.0f} seconds.",
+                    icon="🚧"
+                )
+                st.button(":repeat: Try again", on_click=self.set_state, args=(AppState.QUIZ,))
 
+            except TimeoutError as e:
+                logger.warning(f"gave up following the quiz attempt: {e}")
                 loading_placeholder.empty()
+                st.warning("The Arctic takes too long to answer 🥶 - please try again.", icon="🚧")
+                st.button(":repeat: Try again", on_click=self.set_state, args=(AppState.QUIZ,))
 
             except Exception as e:
                 logger.error(f"error in quiz generation: {e}")
                 st.markdown(f"An error occurred: {e}")
                 st.divider()
                 st.markdown("Don't Worry, Be Happy - reload the page and try again!")
-                st.button(":repeat: Reload", on_click=lambda: streamlit_js_eval(js_expressions="parent.window.location.reload()"))
+                st.button(":repeat: Reload", on_click=reload_page)
 
             if generated_quiz:
-                st.markdown("## :speech_balloon: Question")
-                with st.chat_message("assistant"):
-                    st.markdown(generated_quiz.question)
+                if not streamed:
+                    with question_placeholder.container():
+                        st.markdown("## :speech_balloon: Question")
+                        with st.chat_message("assistant"):
+                            st.markdown(generated_quiz.question)
 
-                st.audio(speech_question, format="audio/mpeg", autoplay=True)
+                if speech_question := session_store.audio(session_id(), QUESTION_AUDIO):
+                    st.audio(speech_question, format="audio/mpeg", autoplay=True)
 
                 st.markdown("## :bulb: Answers")
                 with st.chat_message("assistant"):
                     st.markdown(f"1) {generated_quiz.answer_1}")
                     st.markdown(f"2) {generated_quiz.answer_2}")
                     st.markdown(f"3) {generated_quiz.answer_3}")
+                    answers_audio = st.empty()
 
                 st.markdown("Choose wisely:")
                 col1, col2, col3 = st.columns(3)
                 with col1:
-                    st.button(":one:", on_click=self.answer, args=(generated_quiz, 1,), use_container_width=True)
+                    st.button(":one:", on_click=self.answer, args=(1,), use_container_width=True)
                 with col2:
-                    st.button(":two:", on_click=self.answer, args=(generated_quiz, 2,), use_container_width=True)
+                    st.button(":two:", on_click=self.answer, args=(2,), use_container_width=True)
                 with col3:
-                    st.button(":three:", on_click=self.answer, args=(generated_quiz, 3,), use_container_width=True)
+                    st.button(":three:", on_click=self.answer, args=(3,), use_container_width=True)
+
+                # the buttons are already shown while the answers are still being synthesized
+                if speech := self.resolve_speech(quiz_speech):
+                    # the done callback may run only after the result is returned, so it is kept here as well
+                    self.keep_speech(session_id(), generated_quiz, speech)
+                    if speech_answers := session_store.audio(session_id(), ANSWERS_AUDIO):
+                        answers_audio.audio(speech_answers, format="audio/mpeg")
 
     def evaluate(self):
         with self.placeholder.container():
-            generated_quiz: ArcticQuiz = st.session_state.generated_quiz
-            user_answer = st.session_state.user_answer
-            correct_answer = generated_quiz.correct_answer
-
             st.html("<h1 class='arctic'>🏔️ Arctic Query Quest</h1>")
             st.divider()
 
+            generated_quiz: ArcticQuiz | None = session_store.quiz(session_id())
+            if generated_quiz is None:
+                # evicted after the session was idle for too long
+                st.warning("This quiz has melted away 🫠 - start a new one!")
+                st.button(":arrow_left: Back to start!", on_click=self.set_state, args=(AppState.START,))
+                return
+
+            user_answer = st.session_state.user_answer
+            correct_answer = generated_quiz.correct_answer
+
             if user_answer == correct_answer:
                 st.success(f"Answer {user_answer} is correct 🎉")
                 st.balloons()
@@ -187,5 +491,7 @@ class ArcticQueryQuest:
             correct_answer_text = getattr(generated_quiz, f"answer_{correct_answer}")
             st.markdown(f"**The correct answer is**: {correct_answer_text}")
             st.markdown(f"**Because**: {generated_quiz.explanation}")
+            if explanation := session_store.audio(session_id(), EXPLANATION_AUDIO):
+                st.audio(explanation, format="audio/mpeg", autoplay=True)
             st.divider()
             st.button(":arrow_left: Back to start!", on_click=self.set_state, args=(AppState.START,))
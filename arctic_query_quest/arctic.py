@@ -1,12 +1,28 @@
+import asyncio
 import json
 import logging
-import re
-from functools import wraps
-from time import sleep
+import threading
+import time
+from collections import deque
+from contextlib import aclosing, closing
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, AsyncIterator, Iterator
 
-from langchain_community.llms.replicate import Replicate
 from pydantic import BaseModel
 
+from admission import AdmissionController
+from event_loop import background_loop
+from hedging import HedgeCancelled, Hedger
+from json_stream import DEFAULT_MAX_LENGTH, JsonStreamExtractor
+from metrics import metrics
+from resilience import CircuitBreaker, RetryPolicy, resilient
+from tokens import OutputBudget, TokenCounter
+
+if TYPE_CHECKING:
+    import httpx
+
+    from replicate_stream import StreamedPrediction
+
 logger = logging.getLogger(__name__)
 
 SYSTEM_PROMPT = """
@@ -16,6 +32,23 @@ and questions are clear and concise, and you provide helpful examples to illustr
 
 PROMPT_TEMPLATE = f"<|im_start|>system\n{SYSTEM_PROMPT}<|im_end|>\n<|im_start|>user\n{{prompt}}<|im_end|>\n\n<|im_start|>assistant\n"
 STOP_SEQUENCE = "<|im_end|>"
+ARCTIC_MODEL = "snowflake/snowflake-arctic-instruct"
+
+HTTP_POOL_LIMITS = {"max_connections": 50, "max_keepalive_connections": 20, "keepalive_expiry": 120.0}
+MAX_ASYNC_CONCURRENCY = 256
+DEFAULT_MAX_NEW_TOKENS = 7000
+RECENT_CALLS = 100
+
+# upper bounds per reply field, before there are observed reply sizes
+REPLY_PREAMBLE_TOKENS = 32
+REPLY_FIELD_TOKENS = {"question": 120, "explanation": 200}
+DEFAULT_STRING_FIELD_TOKENS = 80
+DEFAULT_FIELD_TOKENS = 4
+
+ARCTIC_RETRY_POLICY = RetryPolicy(max_attempts=8)
+replicate_breaker = CircuitBreaker("replicate")
+# a whole stream holds its slot, retries are admitted like any other call
+replicate_admission = AdmissionController("replicate", rate=5.0, burst=10, max_in_flight=32, deadline=20.0)
 
 
 class ArcticQuiz(BaseModel):
@@ -27,24 +60,156 @@ class ArcticQuiz(BaseModel):
     explanation: str
 
 
-def retry(max_retries: int) -> callable:
-    def decorator(func) -> callable:
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            for _ in range(max_retries):
-                try:
-                    return func(*args, **kwargs)
-                except BaseException as e:
-                    logger.error(f"error in {func.__name__}: {e}")
-                    if _ < max_retries - 1:
-                        logger.warning(f"retrying {func.__name__}...")
-                        sleep(1)
-                    else:
-                        raise e
+@dataclass
+class BatchStats:
+    requested: int
+    generated: int
+    seconds: float
+    # estimates, the prompt is counted locally and every streamed chunk is taken for one token, not the billed usage
+    estimated_input_tokens: int
+    estimated_output_tokens: int
+
+    @property
+    def dropped(self) -> int:
+        return self.requested - self.generated
+
+    @property
+    def quizzes_per_second(self) -> float:
+        return self.generated / self.seconds if self.seconds else 0.0
+
+    @property
+    def estimated_tokens_per_quiz(self) -> float:
+        total = self.estimated_input_tokens + self.estimated_output_tokens
+        return total / self.generated if self.generated else 0.0
+
+
+@dataclass
+class QuizBatch:
+    quizzes: list[ArcticQuiz]
+    stats: BatchStats
+
+
+@dataclass
+class StreamUsage:
+    chunks: int = 0
+    prediction_id: str | None = None
+    # latency of creating the prediction, of the first token and of the whole stream
+    created_seconds: float = 0.0
+    time_to_first_token: float | None = None
+    seconds: float = 0.0
+    canceled: bool = False
+
+    @property
+    def tokens_per_second(self) -> float:
+        if self.time_to_first_token is None or self.chunks < 2 or self.seconds <= self.time_to_first_token:
+            return 0.0
+        return (self.chunks - 1) / (self.seconds - self.time_to_first_token)
+
+
+def quiz_reply_tokens(token_counter: TokenCounter) -> int:
+    # a short preamble and the JSON object of a single quiz, following the template of the prompt
+    skeleton = json.dumps({name: "" for name in ArcticQuiz.model_fields}, indent=4)
+    return REPLY_PREAMBLE_TOKENS + token_counter.count(skeleton) + sum(
+        REPLY_FIELD_TOKENS.get(name, DEFAULT_STRING_FIELD_TOKENS if field.annotation is str else DEFAULT_FIELD_TOKENS)
+        for name, field in ArcticQuiz.model_fields.items()
+    )
+
+
+class QuizStreamEvent(BaseModel):
+    field: str
+    delta: str = ""
+    value: Any = None
+    complete: bool = False
+    # timing and token counts of the prediction, on the final quiz event
+    usage: StreamUsage | None = None
+
+
+STREAMED_FIELDS = ("question",)
+QUIZ_EVENT = "quiz"
+
+
+def _decode_partial_string(raw: str) -> str:
+    # drop a dangling escape sequence which is not complete yet
+    backslashes = len(raw) - len(raw.rstrip("\\"))
+    if backslashes % 2:
+        raw = raw[:-1]
+    if (unicode_escape := raw.rfind("\\u")) != -1 and len(raw) - unicode_escape < 6:
+        raw = raw[:unicode_escape]
+
+    try:
+        return _decode_string(raw)
+    except json.JSONDecodeError:
+        return raw
+
+
+def _decode_string(raw: str) -> str:
+    return json.loads(f'"{raw}"', strict=False)
+
+
+class QuizFieldScanner:
+
+    def __init__(self):
+        self.extractor = JsonStreamExtractor()
+        self.completed: dict[str, Any] = {}
+        self.emitted: dict[str, int] = {}
+
+    @property
+    def complete(self) -> bool:
+        return self.extractor.complete
+
+    @property
+    def text(self) -> str:
+        return self.extractor.text
+
+    def feed(self, chunk: str) -> list[QuizStreamEvent]:
+        self.extractor.feed(chunk)
+        events = []
+
+        if (open_member := self.extractor.open_member) and open_member[0] in STREAMED_FIELDS:
+            events.extend(self._deltas(open_member[0], _decode_partial_string(open_member[1])))
+
+        for name, raw in self.extractor.members.items():
+            if name in self.completed or name not in ArcticQuiz.model_fields:
+                continue
+
+            value = _decode_member(name, raw)
+            if name in STREAMED_FIELDS:
+                events.extend(self._deltas(name, value))
+
+            self.completed[name] = value
+            events.append(QuizStreamEvent(field=name, value=value, complete=True))
+
+        if self.complete and (missing := ArcticQuiz.model_fields.keys() - self.completed.keys()):
+            raise ValueError(f"quiz JSON is missing fields {sorted(missing)}: {self.text}")
+
+        return events
+
+    def _deltas(self, name: str, value: str) -> list[QuizStreamEvent]:
+        emitted = self.emitted.get(name, 0)
+        if len(value) <= emitted:
+            return []
+
+        self.emitted[name] = len(value)
+        return [QuizStreamEvent(field=name, delta=value[emitted:])]
+
 
-        return wrapper
+def _decode_member(name: str, raw: str) -> Any:
+    # fail fast on values which can never validate as ArcticQuiz field
+    annotation = ArcticQuiz.model_fields[name].annotation
+    try:
+        value = json.loads(raw, strict=False)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"invalid JSON value for {name}: {raw}") from e
 
-    return decorator
+    if annotation is str and not isinstance(value, str):
+        raise ValueError(f"expected a string for {name}: {raw}")
+    if annotation is int:
+        try:
+            value = int(value)
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"expected an integer for {name}: {raw}") from e
+
+    return value
 
 
 class ArcticClient:
@@ -55,43 +220,293 @@ class ArcticClient:
             top_p: float = 1.0,
             temperature: float = 0.7,
             min_new_tokens: int = 0,
-            max_new_tokens: int = 7000,
+            max_new_tokens: int = DEFAULT_MAX_NEW_TOKENS,
             presence_penalty: float = 0.8,
-            frequency_penalty: float = 0.2
+            frequency_penalty: float = 0.2,
+            hedger: Hedger | None = None,
+            pool_limits: "httpx.Limits | None" = None,
+            max_async_concurrency: int = MAX_ASYNC_CONCURRENCY,
+            token_counter: TokenCounter | None = None,
+            output_budget: OutputBudget | None = None
     ):
-        self.llm = Replicate(
-            model="snowflake/snowflake-arctic-instruct",
-            model_kwargs={
-                "top_k": top_k,
-                "top_p": top_p,
-                "temperature": temperature,
-                "min_new_tokens": min_new_tokens,
-                "max_new_tokens": max_new_tokens,
-                "stop_sequences": STOP_SEQUENCE,
-                "prompt_template": PROMPT_TEMPLATE,
-                "presence_penalty": presence_penalty,
-                "frequency_penalty": frequency_penalty
-            }
+        self.hedger = hedger
+        self.token_counter = token_counter or TokenCounter(tokenizer_name=None)
+        # without a budget every prediction may use up to max_new_tokens
+        self.output_budget = output_budget
+        # the HTTP stack is slow to import, it is only loaded once a client is created
+        import httpx
+
+        from replicate_stream import ReplicateStreamClient
+
+        # one pooled keep-alive HTTP session per client, shared by all predictions, the async session is bound to
+        # the shared background event loop on first use
+        self.client = self.async_client = ReplicateStreamClient(
+            pool_limits=pool_limits or httpx.Limits(**HTTP_POOL_LIMITS)
         )
+        self.max_async_concurrency = max_async_concurrency
+        self._async_slots: asyncio.Semaphore | None = None
+        self.closed = False
+        # timing and token counts of the latest predictions, newest last
+        self.recent_calls: deque[StreamUsage] = deque(maxlen=RECENT_CALLS)
+        self.model_kwargs = {
+            "top_k": top_k,
+            "top_p": top_p,
+            "temperature": temperature,
+            "min_new_tokens": min_new_tokens,
+            "max_new_tokens": max_new_tokens,
+            "stop_sequences": STOP_SEQUENCE,
+            "prompt_template": PROMPT_TEMPLATE,
+            "presence_penalty": presence_penalty,
+            "frequency_penalty": frequency_penalty
+        }
+
+    def healthy(self) -> bool:
+        # a broken connection pool is replaced by rebuilding the client, an upstream outage is left to the breaker
+        return not self.closed and self.client.healthy()
+
+    def close(self):
+        self.closed = True
+        self.client.close()
+        if background_loop.running:
+            background_loop.submit(self.async_client.aclose())
 
     @staticmethod
     def _extract_json(text: str) -> str:
-        regex = r"^.*(\{.+\}).*$"
-        matches = re.search(regex, text, re.MULTILINE | re.DOTALL)
-        if not matches or len(matches.groups()) != 1:
-            raise ValueError(f"text contains none or too many JSON objects: {text}")
+        extractor = JsonStreamExtractor(max_preamble=len(text))
+        if not extractor.feed(text):
+            raise ValueError(f"text contains no complete JSON object: {text}")
 
-        return matches.group(1)
+        return extractor.text
 
     def _parse_output(self, text: str) -> ArcticQuiz:
-        json_text = self._extract_json(text)
-        return ArcticQuiz.model_validate(json.loads(json_text.lstrip().rstrip()))
+        with metrics.span("parse"):
+            json_text = self._extract_json(text)
+            return ArcticQuiz.model_validate(json.loads(json_text.lstrip().rstrip(), strict=False))
+
+    def max_new_tokens(self, count: int = 1) -> int:
+        if self.output_budget is None:
+            return self.model_kwargs["max_new_tokens"]
+        return self.output_budget.limit(count)
+
+    def _input(self, prompt: str, max_new_tokens: int | None) -> dict[str, Any]:
+        max_new_tokens = max_new_tokens or self.max_new_tokens()
+        metrics.observe("max_new_tokens", max_new_tokens)
+        return {**self.model_kwargs, "prompt": prompt, "max_new_tokens": max_new_tokens}
+
+    def _observe_reply(self, usage: StreamUsage, complete: bool, count: int = 1):
+        metrics.observe("reply_tokens", usage.chunks / count)
+        if self.output_budget is None:
+            return
+
+        if complete:
+            self.output_budget.observe(usage.chunks, count)
+        else:
+            # the stream ended before the reply was complete, most likely at the token limit
+            self.output_budget.truncated()
+
+    def _create_prediction(self, prompt: str, max_new_tokens: int | None = None) -> "StreamedPrediction":
+        return self.client.create(ARCTIC_MODEL, input=self._input(prompt, max_new_tokens))
+
+    def _stream(
+        self,
+        prompt: str,
+        usage: StreamUsage | None = None,
+        max_new_tokens: int | None = None
+    ) -> Iterator[str]:
+        with replicate_admission.admit():
+            yield from self._stream_prediction(prompt, usage, max_new_tokens)
+
+    def _record_start(self, usage: StreamUsage, prediction: "StreamedPrediction"):
+        usage.prediction_id = prediction.id
+        usage.created_seconds = prediction.created_seconds
+
+    def _record_token(self, usage: StreamUsage, started: float):
+        if usage.time_to_first_token is None:
+            usage.time_to_first_token = time.perf_counter() - started
+            metrics.observe("stage_seconds", usage.time_to_first_token, stage="time_to_first_token")
+        # Replicate streams one token per output event
+        usage.chunks += 1
+
+    def _record_end(self, usage: StreamUsage, started: float, finished: bool):
+        usage.seconds = time.perf_counter() - started
+        usage.canceled = not finished
+        metrics.observe("stage_seconds", usage.seconds, stage="generation")
+        if usage.tokens_per_second:
+            metrics.observe("tokens_per_second", usage.tokens_per_second)
+        self.recent_calls.append(usage)
+        logger.debug(
+            f"prediction {usage.prediction_id}: {usage.chunks} tokens in {usage.seconds:.2f}s, "
+            f"created in {usage.created_seconds:.2f}s, first token after {usage.time_to_first_token or 0:.2f}s"
+        )
+
+    def _stream_prediction(
+        self,
+        prompt: str,
+        usage: StreamUsage | None = None,
+        max_new_tokens: int | None = None
+    ) -> Iterator[str]:
+        usage = usage if usage is not None else StreamUsage()
+        started = time.perf_counter()
+
+        prediction = self._create_prediction(prompt, max_new_tokens)
+        self._record_start(usage, prediction)
+        finished = False
+        try:
+            with closing(self.client.stream(prediction)) as outputs:
+                for output in outputs:
+                    self._record_token(usage, started)
+                    yield output
+            finished = True
+        finally:
+            self._record_end(usage, started, finished)
+            if not finished:
+                # stop the generation upstream as soon as the reply is not consumed anymore
+                logger.info(f"canceling prediction {prediction.id}")
+                # a failed cancel must not replace the error that ended the stream
+                try:
+                    self.client.cancel(prediction)
+                except Exception as e:
+                    logger.warning(f"could not cancel prediction {prediction.id}: {e}")
+
+    async def _acreate_prediction(self, prompt: str, max_new_tokens: int | None = None) -> "StreamedPrediction":
+        return await self.async_client.acreate(ARCTIC_MODEL, input=self._input(prompt, max_new_tokens))
+
+    async def _astream(
+        self,
+        prompt: str,
+        usage: StreamUsage | None = None,
+        max_new_tokens: int | None = None
+    ) -> AsyncIterator[str]:
+        chunks = self._astream_prediction(prompt, usage, max_new_tokens)
+        async with replicate_admission.aadmit(), aclosing(chunks):
+            async for chunk in chunks:
+                yield chunk
+
+    async def _astream_prediction(
+        self,
+        prompt: str,
+        usage: StreamUsage | None = None,
+        max_new_tokens: int | None = None
+    ) -> AsyncIterator[str]:
+        usage = usage if usage is not None else StreamUsage()
+        started = time.perf_counter()
+
+        prediction = await self._acreate_prediction(prompt, max_new_tokens)
+        self._record_start(usage, prediction)
+        finished = False
+        try:
+            async with aclosing(self.async_client.astream(prediction)) as outputs:
+                async for output in outputs:
+                    self._record_token(usage, started)
+                    yield output
+            finished = True
+        finally:
+            self._record_end(usage, started, finished)
+            if not finished:
+                logger.info(f"canceling prediction {prediction.id}")
+                # shielded, so a cancelled task still stops the generation upstream
+                try:
+                    await asyncio.shield(self.async_client.acancel(prediction))
+                except Exception as e:
+                    logger.warning(f"could not cancel prediction {prediction.id}: {e}")
+
+    def _slots(self) -> asyncio.Semaphore:
+        # created lazily, a semaphore must be created on the loop it is used with
+        if self._async_slots is None:
+            self._async_slots = asyncio.Semaphore(self.max_async_concurrency)
+        return self._async_slots
+
+    @resilient(ARCTIC_RETRY_POLICY, breaker=replicate_breaker)
+    async def ainvoke(self, prompt: str, max_new_tokens: int | None = None) -> ArcticQuiz:
+        async with self._slots():
+            scanner = QuizFieldScanner()
+            usage = StreamUsage()
+            async with aclosing(self._astream(prompt, usage, max_new_tokens)) as chunks:
+                async for chunk in chunks:
+                    scanner.feed(chunk)
+                    if scanner.complete:
+                        break
+
+            self._observe_reply(usage, scanner.complete)
+            return self._parse_output(scanner.text)
+
+    @resilient(ARCTIC_RETRY_POLICY, breaker=replicate_breaker)
+    def invoke(self, prompt: str, max_new_tokens: int | None = None) -> ArcticQuiz:
+        if self.hedger is None:
+            return self._generate(prompt, max_new_tokens=max_new_tokens)
+
+        return self.hedger.run(lambda cancel: self._generate(prompt, cancel, max_new_tokens))
+
+    def _generate(
+        self,
+        prompt: str,
+        cancel: threading.Event | None = None,
+        max_new_tokens: int | None = None
+    ) -> ArcticQuiz:
+        scanner = QuizFieldScanner()
+        usage = StreamUsage()
+        with closing(self._stream(prompt, usage, max_new_tokens)) as chunks:
+            for chunk in chunks:
+                if cancel is not None and cancel.is_set():
+                    raise HedgeCancelled()
+                scanner.feed(chunk)
+                if scanner.complete:
+                    break
+
+        self._observe_reply(usage, scanner.complete)
+        return self._parse_output(scanner.text)
+
+    @staticmethod
+    def _parse_batch(items: list[str]) -> list[ArcticQuiz]:
+        quizzes = []
+        for item in items:
+            try:
+                quizzes.append(ArcticQuiz.model_validate(json.loads(item, strict=False)))
+            except ValueError as e:
+                logger.warning(f"dropping invalid quiz from batch: {e}")
+
+        return quizzes
+
+    @resilient(ARCTIC_RETRY_POLICY, breaker=replicate_breaker)
+    def invoke_batch(self, prompt: str, count: int, max_new_tokens: int | None = None) -> QuizBatch:
+        started = time.monotonic()
+        usage = StreamUsage()
+        extractor = JsonStreamExtractor(root="[", max_length=DEFAULT_MAX_LENGTH * count)
+
+        with closing(self._stream(prompt, usage, max_new_tokens or self.max_new_tokens(count))) as chunks:
+            for chunk in chunks:
+                if extractor.feed(chunk):
+                    break
+
+        self._observe_reply(usage, extractor.complete, count)
+        if not extractor.complete:
+            raise ValueError(f"text contains no complete JSON array: {extractor.text}")
+
+        quizzes = self._parse_batch(extractor.items)
+        if not quizzes:
+            raise ValueError(f"batch contains no valid quiz: {extractor.text}")
+
+        stats = BatchStats(
+            requested=count,
+            generated=len(quizzes),
+            seconds=time.monotonic() - started,
+            estimated_input_tokens=self.token_counter.count(prompt),
+            estimated_output_tokens=usage.chunks
+        )
+        logger.info(
+            f"generated {stats.generated}/{stats.requested} quizzes in {stats.seconds:.1f}s "
+            f"({stats.quizzes_per_second:.2f} quizzes/s, ~{stats.estimated_tokens_per_quiz:.0f} tokens/quiz estimated)"
+        )
+        return QuizBatch(quizzes=quizzes, stats=stats)
 
-    @retry(max_retries=8)
-    def invoke(self, prompt: str) -> ArcticQuiz:
-        chunks = []
-        for chunk in self.llm.stream(prompt):
-            chunks.append(chunk)
+    def stream_quiz(self, prompt: str, max_new_tokens: int | None = None) -> Iterator[QuizStreamEvent]:
+        scanner = QuizFieldScanner()
+        usage = StreamUsage()
+        with replicate_breaker.guard(), closing(self._stream(prompt, usage, max_new_tokens)) as chunks:
+            for chunk in chunks:
+                yield from scanner.feed(chunk)
+                if scanner.complete:
+                    break
 
-        output = "".join(chunks)
-        return self._parse_output(output)
+        self._observe_reply(usage, scanner.complete)
+        yield QuizStreamEvent(field=QUIZ_EVENT, value=self._parse_output(scanner.text), complete=True, usage=usage)
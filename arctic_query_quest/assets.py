@@ -0,0 +1,162 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable
+
+from jinja2 import Template
+from jinja2.sandbox import SandboxedEnvironment
+
+logger = logging.getLogger(__name__)
+
+TEMPLATES_GLOB = "templates/**/*.jinja"
+MODELS_GLOB = "models/*.sql"
+ANIMATIONS_GLOB = "animations/*.json"
+WATCHED_DIRECTORIES = ("templates", "models", "animations")
+DEFAULT_CHECK_INTERVAL = 2.0
+
+
+@dataclass
+class _Asset:
+    data: bytes
+    digest: str
+    mtime_ns: int
+    # text, compiled template or parsed JSON, built once per file version
+    derived: dict[str, Any] = field(default_factory=dict)
+
+
+class AssetRegistry:
+
+    def __init__(self, base_path: str = ".", check_interval: float = DEFAULT_CHECK_INTERVAL):
+        self.base_path = Path(base_path)
+        self.check_interval = check_interval
+        self.version = 0
+
+        self._environment = SandboxedEnvironment()
+        self._lock = threading.RLock()
+        self._assets: dict[str, _Asset] = {}
+        self._checked_at = 0.0
+        self._observer = None
+
+    def preload(self):
+        with self._lock:
+            for pattern in (TEMPLATES_GLOB, MODELS_GLOB, ANIMATIONS_GLOB):
+                for path in sorted(self.base_path.glob(pattern)):
+                    self._load(path.relative_to(self.base_path).as_posix())
+
+    def data(self, path: str) -> bytes:
+        return self._get(path).data
+
+    def digest(self, path: str) -> str:
+        return self._get(path).digest
+
+    def text(self, path: str) -> str:
+        return self._derived(path, "text", lambda asset: asset.data.decode("utf-8"))
+
+    def template(self, path: str) -> Template:
+        return self._derived(path, "template", lambda asset: self._environment.from_string(asset.data.decode("utf-8")))
+
+    def json(self, path: str) -> Any:
+        # shared by all sessions, callers must not modify it
+        return self._derived(path, "json", lambda asset: json.loads(asset.data))
+
+    def _derived(self, path: str, name: str, build: Callable[[_Asset], Any]) -> Any:
+        asset = self._get(path)
+        if name not in asset.derived:
+            with self._lock:
+                if name not in asset.derived:
+                    asset.derived[name] = build(asset)
+        return asset.derived[name]
+
+    def refresh(self) -> bool:
+        changed = False
+        with self._lock:
+            self._checked_at = time.monotonic()
+            for path in list(self._assets):
+                changed |= self._refresh(path)
+        return changed
+
+    def invalidate(self, path: str):
+        with self._lock:
+            if path in self._assets and self._refresh(path):
+                logger.info(f"reloaded asset {path}")
+
+    def watch(self):
+        from watchdog.events import FileSystemEventHandler
+        from watchdog.observers import Observer
+
+        registry = self
+
+        class Handler(FileSystemEventHandler):
+
+            def on_any_event(self, event):
+                if event.is_directory:
+                    return
+                for path in (event.src_path, getattr(event, "dest_path", "")):
+                    if path:
+                        registry.invalidate(Path(path).resolve().relative_to(registry.base_path.resolve()).as_posix())
+
+        with self._lock:
+            if self._observer is not None:
+                return
+            self._observer = Observer()
+            for directory in WATCHED_DIRECTORIES:
+                if not (self.base_path / directory).is_dir():
+                    continue
+                self._observer.schedule(Handler(), str(self.base_path / directory), recursive=True)
+            self._observer.daemon = True
+            self._observer.start()
+
+    def stop_watching(self):
+        with self._lock:
+            observer, self._observer = self._observer, None
+        if observer is not None:
+            observer.stop()
+            observer.join()
+
+    def _get(self, path: str) -> _Asset:
+        # without a file watcher fall back to cheap, throttled mtime checks
+        if self._observer is None and time.monotonic() - self._checked_at >= self.check_interval:
+            self.refresh()
+
+        if (asset := self._assets.get(path)) is not None:
+            return asset
+
+        with self._lock:
+            if path not in self._assets:
+                self._load(path)
+            return self._assets[path]
+
+    def _load(self, path: str) -> _Asset:
+        file = self.base_path / path
+        mtime_ns = file.stat().st_mtime_ns
+        data = file.read_bytes()
+        asset = _Asset(data=data, digest=hashlib.sha256(data).hexdigest(), mtime_ns=mtime_ns)
+        self._assets[path] = asset
+        return asset
+
+    def _refresh(self, path: str) -> bool:
+        asset = self._assets[path]
+        try:
+            mtime_ns = (self.base_path / path).stat().st_mtime_ns
+        except FileNotFoundError:
+            return False
+
+        if mtime_ns == asset.mtime_ns:
+            return False
+
+        previous_digest = asset.digest
+        reloaded = self._load(path)
+        if reloaded.digest == previous_digest:
+            # touched but unchanged, keep the compiled template and everything else built from it
+            reloaded.derived = asset.derived
+            return False
+
+        self.version += 1
+        return True
+
+
+assets = AssetRegistry()
@@ -0,0 +1,153 @@
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Iterator
+
+from metrics import metrics
+from prompt import Difficulty
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ATTEMPTS = 1000
+DEFAULT_TTL = 900.0
+DEFAULT_MAX_WORKERS = 16
+
+
+def new_attempt_id() -> str:
+    return uuid.uuid4().hex
+
+
+@dataclass(frozen=True)
+class AttemptEvent:
+    kind: str
+    value: Any = None
+
+
+@dataclass
+class AttemptStats:
+    started: int = 0
+    reused: int = 0
+    calls_saved: int = 0
+    active: int = 0
+
+
+class QuizAttempt:
+    # one quiz attempt of a session, produced once in the background and replayed to every script run showing it
+
+    def __init__(self, attempt_id: str, db_model: str, difficulty: Difficulty):
+        self.attempt_id = attempt_id
+        self.db_model = db_model
+        self.difficulty = difficulty
+        self.created_at = time.monotonic()
+        self.future: Future = Future()
+        self._condition = threading.Condition()
+        self._events: list[AttemptEvent] = []
+
+    def emit(self, kind: str, value: Any = None):
+        with self._condition:
+            self._events.append(AttemptEvent(kind, value))
+            self._condition.notify_all()
+
+    def finish(self, result: Any = None, error: BaseException | None = None):
+        with self._condition:
+            if error is not None:
+                self.future.set_exception(error)
+            else:
+                self.future.set_result(result)
+            self._condition.notify_all()
+
+    def events(self, timeout: float | None = None) -> Iterator[AttemptEvent]:
+        # all events so far, followed by new ones until the attempt is finished or the timeout is over
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        index = 0
+        while True:
+            with self._condition:
+                while index >= len(self._events) and not self.future.done():
+                    remaining = deadline - time.monotonic() if deadline is not None else None
+                    if remaining is not None and remaining <= 0:
+                        raise TimeoutError(f"quiz attempt {self.attempt_id} is not finished after {timeout:.0f}s")
+                    self._condition.wait(remaining)
+                if index >= len(self._events):
+                    return
+                pending = self._events[index:]
+            index += len(pending)
+            yield from pending
+
+
+class AttemptRegistry:
+
+    def __init__(
+        self,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        ttl: float = DEFAULT_TTL,
+        max_workers: int = DEFAULT_MAX_WORKERS
+    ):
+        self.max_attempts = max_attempts
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._attempts: OrderedDict[str, QuizAttempt] = OrderedDict()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="attempt")
+        self._stats = AttemptStats()
+
+    def get(self, attempt_id: str) -> QuizAttempt | None:
+        with self._lock:
+            self._expire()
+            return self._attempts.get(attempt_id)
+
+    def start(
+        self,
+        attempt_id: str,
+        db_model: str,
+        difficulty: Difficulty,
+        produce: Callable[[QuizAttempt], Any]
+    ) -> tuple[QuizAttempt, bool]:
+        # single flight per attempt: a rerun attaches to the running or finished production instead of starting over
+        with self._lock:
+            self._expire()
+            if (attempt := self._attempts.get(attempt_id)) is not None:
+                self._stats.reused += 1
+                return attempt, True
+
+            attempt = QuizAttempt(attempt_id, db_model, difficulty)
+            self._attempts[attempt_id] = attempt
+            self._stats.started += 1
+
+        def run():
+            try:
+                attempt.finish(produce(attempt))
+            except BaseException as e:
+                attempt.finish(error=e)
+
+        self._executor.submit(run)
+        return attempt, False
+
+    def record_saved(self, calls: int):
+        with self._lock:
+            self._stats.calls_saved += calls
+        metrics.increment("upstream_calls_saved", calls)
+
+    def stats(self) -> AttemptStats:
+        with self._lock:
+            return AttemptStats(
+                started=self._stats.started,
+                reused=self._stats.reused,
+                calls_saved=self._stats.calls_saved,
+                active=sum(not attempt.future.done() for attempt in self._attempts.values())
+            )
+
+    def _expire(self):
+        now = time.monotonic()
+        while self._attempts:
+            attempt = next(iter(self._attempts.values()))
+            # running attempts are never dropped, they are about to be shown
+            expired = len(self._attempts) > self.max_attempts or now - attempt.created_at > self.ttl
+            if not expired or not attempt.future.done():
+                return
+            self._attempts.popitem(last=False)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,177 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = ".cache/audio"
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_MEMORY_MAX_BYTES = 16 * 1024 * 1024
+FILE_SUFFIX = ".mp3"
+
+
+@dataclass
+class AudioCacheStats:
+    memory_hits: int = 0
+    disk_hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    bytes_stored: int = 0
+    entries: int = 0
+
+    @property
+    def hits(self) -> int:
+        return self.memory_hits + self.disk_hits
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+def cache_key(*parts: bytes) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(len(part).to_bytes(8, "big"))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+class AudioCache:
+
+    def __init__(
+        self,
+        directory: str = DEFAULT_CACHE_DIR,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        memory_max_bytes: int = DEFAULT_MEMORY_MAX_BYTES
+    ):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.memory_max_bytes = memory_max_bytes
+
+        self._lock = threading.Lock()
+        self._memory: OrderedDict[str, bytes] = OrderedDict()
+        self._memory_bytes = 0
+        self._index: OrderedDict[str, int] = OrderedDict()
+        self._disk_bytes = 0
+        self._stats = AudioCacheStats()
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._load_index()
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            if (audio := self._memory.get(key)) is not None:
+                self._memory.move_to_end(key)
+                self._touch(key)
+                self._stats.memory_hits += 1
+                return audio
+
+        path = self._path(key)
+        try:
+            audio = path.read_bytes()
+        except FileNotFoundError:
+            with self._lock:
+                self._forget(key)
+                self._stats.misses += 1
+            return None
+
+        with self._lock:
+            if key not in self._index:
+                # written by another process sharing the cache directory
+                self._index[key] = len(audio)
+                self._disk_bytes += len(audio)
+            self._touch(key)
+            self._remember(key, audio)
+            self._stats.disk_hits += 1
+
+        return audio
+
+    def put(self, key: str, audio: bytes):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as tmp_file:
+                tmp_file.write(audio)
+            os.replace(tmp_path, path)
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+
+        with self._lock:
+            self._forget(key)
+            self._index[key] = len(audio)
+            self._disk_bytes += len(audio)
+            self._remember(key, audio)
+            self._evict()
+
+    def stats(self) -> AudioCacheStats:
+        with self._lock:
+            return AudioCacheStats(
+                memory_hits=self._stats.memory_hits,
+                disk_hits=self._stats.disk_hits,
+                misses=self._stats.misses,
+                evictions=self._stats.evictions,
+                bytes_stored=self._disk_bytes,
+                entries=len(self._index)
+            )
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}{FILE_SUFFIX}"
+
+    def _load_index(self):
+        entries = []
+        for path in self.directory.glob(f"*/*{FILE_SUFFIX}"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, path.stem, stat.st_size))
+
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self._disk_bytes += size
+
+        self._evict()
+
+    def _touch(self, key: str):
+        if key in self._index:
+            self._index.move_to_end(key)
+            try:
+                os.utime(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def _remember(self, key: str, audio: bytes):
+        if len(audio) > self.memory_max_bytes:
+            return
+
+        if (previous := self._memory.pop(key, None)) is not None:
+            self._memory_bytes -= len(previous)
+        self._memory[key] = audio
+        self._memory_bytes += len(audio)
+
+        while self._memory_bytes > self.memory_max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def _forget(self, key: str):
+        if (size := self._index.pop(key, None)) is not None:
+            self._disk_bytes -= size
+        if (audio := self._memory.pop(key, None)) is not None:
+            self._memory_bytes -= len(audio)
+
+    def _evict(self):
+        while self._disk_bytes > self.max_bytes and self._index:
+            key = next(iter(self._index))
+            self._forget(key)
+            self._path(key).unlink(missing_ok=True)
+            self._stats.evictions += 1
+            logger.debug(f"evicted audio cache entry {key}")
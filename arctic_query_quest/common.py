@@ -1,10 +1,13 @@
 import base64
 import logging
+import uuid
 from enum import Enum
-from pathlib import Path
 
 import streamlit as st
-from streamlit_js_eval import streamlit_js_eval
+
+from assets import assets
+from metrics import metrics
+from session_store import session_store
 
 
 class AppState(Enum):
@@ -14,11 +17,11 @@ class AppState(Enum):
 
 
 def read(path: str) -> str:
-    return Path(path).read_text()
+    return assets.text(path)
 
 
 def apply_style():
-    st.html(f"<style>{Path('style.css').read_text()}</style>")
+    st.html(f"<style>{read('style.css')}</style>")
 
 
 def configure():
@@ -30,19 +33,23 @@ def init_state():
         "score": 0,
         "app_state": AppState.START,
         "db_model": None,
-        "generated_quiz": None,
         "user_answer": None,
         "difficulty": None,
+        "seen_quizzes": set(),
+        "quiz_attempt": None,
     }
 
     for key, default in state_defaults.items():
         if key not in st.session_state:
             st.session_state[key] = default
 
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+
 
 def menu():
     with st.sidebar:
-        st.image("images/logo.png", use_column_width=True)
+        image(LOGO, use_column_width=True)
 
         st.markdown(f"""
         🏅 Your score: `{st.session_state.score}`\n
@@ -73,6 +80,55 @@ def menu():
         st.divider()
         st.html("<h3 class='arctic'>🧪 Debugging</h3>")
         st.markdown(f"Current app state: `{st.session_state.app_state.value}`")
+        st.markdown(f"Upstream calls saved on reruns: `{metrics.counter('upstream_calls_saved'):.0f}`")
+        stats = session_store.stats()
+        st.markdown(
+            f"Session memory: `{session_store.session_bytes(session_id()) / 1024:.0f} KiB`, "
+            f"all `{stats.sessions}` sessions: `{stats.resident_bytes / 1024 / 1024:.1f} MiB` "
+            f"(`{stats.deduplicated_bytes / 1024 / 1024:.1f} MiB` shared)"
+        )
+        if st.toggle("Show metrics", key="show_metrics"):
+            render_metrics()
+
+
+def session_id() -> str:
+    # unique per session, unlike the script run context it also tells sessions of AppTest apart
+    return st.session_state.session_id
+
+
+def render_metrics():
+    snapshot = metrics.snapshot()
+
+    stages = [
+        {
+            "stage": "/".join(histogram["labels"].values()) or histogram["name"],
+            "count": histogram["count"],
+            **{q: round(histogram[q] * 1000, 1) for q in ("p50", "p95", "p99")}
+        }
+        for histogram in snapshot["histograms"] if histogram["name"] == "stage_seconds"
+    ]
+    if stages:
+        st.caption("Stage latency (ms)")
+        st.dataframe(stages, hide_index=True, use_container_width=True)
+
+    for histogram in snapshot["histograms"]:
+        if histogram["name"] == "tokens_per_second":
+            st.caption(f"Tokens/s: p50 `{histogram['p50']:.1f}`, p95 `{histogram['p95']:.1f}`")
+
+    counters = [*snapshot["counters"], *snapshot["gauges"]]
+    if counters:
+        st.caption("Counters")
+        st.dataframe(
+            [{"name": item["name"], "labels": ", ".join(item["labels"].values()), "value": item["value"]} for item in counters],
+            hide_index=True,
+            use_container_width=True
+        )
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button("JSON", metrics.to_json(), file_name="metrics.json", mime="application/json")
+    with col2:
+        st.download_button("Prometheus", metrics.to_prometheus(), file_name="metrics.prom", mime="text/plain")
 
 
 def init_page():
@@ -82,15 +138,36 @@ def init_page():
     menu()
 
 
-def load_model() -> str:
-    model_files = {
-        "Shop": "models/shop.sql",
-        "Game": "models/game.sql",
-        "Books": "models/books.sql",
-    }
+MODEL_FILES = {
+    "Shop": "models/shop.sql",
+    "Game": "models/game.sql",
+    "Books": "models/books.sql",
+}
+
+DEFAULT_MODEL = "Shop"
 
-    model = st.session_state.db_model
-    return read(model_files.get(model, "models/shop.sql"))
+# bundled with the app, nothing is fetched from other hosts while a page is rendered
+LOGO = "images/logo.png"
+OVERVIEW = "images/overview.png"
+# exported once from lottie.host with `make animations`
+START_ANIMATION = "animations/start.json"
+LOADING_ANIMATION = "animations/loading.json"
+# served by Streamlit's static file handler, see server.enableStaticServing
+STATIC_PATH = "arctic_query_quest/static"
+MODEL_BACKGROUNDS = {
+    "Shop": "model-shop.jpg",
+    "Game": "model-game.jpg",
+    "Books": "model-books.jpg",
+}
+
+
+def get_model_name(model: str | None = None) -> str:
+    model = model or st.session_state.db_model
+    return model if model in MODEL_FILES else DEFAULT_MODEL
+
+
+def load_model(model: str | None = None) -> str:
+    return read(MODEL_FILES[get_model_name(model)])
 
 
 def render_link_with_svg_icon(link, text, svg):
@@ -101,7 +178,45 @@ def render_link_with_svg_icon(link, text, svg):
     st.write(html, unsafe_allow_html=True)
 
 
+# animations reported as not exported, reported once per process
+_missing_animations: set[str] = set()
+
+
+def lottie(animation: str, width: int):
+    try:
+        animation_data = assets.json(animation)
+    except FileNotFoundError:
+        # the page is rendered without the animation
+        if animation not in _missing_animations:
+            _missing_animations.add(animation)
+            logging.warning(f"animation {animation} is not bundled, run `make animations` to export it")
+        return
+
+    # streamlit_lottie is slow to import, it is only loaded once an animation is shown
+    from streamlit_lottie import st_lottie
+
+    st_lottie(animation_data, width=width)
+
+
+def image(path: str, **kwargs):
+    # read once per process, Streamlit serves equal bytes under the same media URL
+    st.image(assets.data(path), **kwargs)
+
+
+def static_url(name: str) -> str:
+    # the version changes with the content, so browsers can cache the file for good
+    return f"app/static/{name}?v={assets.digest(f'{STATIC_PATH}/{name}')[:12]}"
+
+
+def reload_page():
+    from streamlit_js_eval import streamlit_js_eval
+
+    streamlit_js_eval(js_expressions="parent.window.location.reload()")
+
+
 def console_log(text):
+    from streamlit_js_eval import streamlit_js_eval
+
     try:
         text = text.replace("`", "\\`")
         streamlit_js_eval(js_expressions=f"console.log(`{text}`)")
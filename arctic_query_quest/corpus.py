@@ -0,0 +1,190 @@
+import hashlib
+import logging
+import random
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from arctic import ArcticQuiz
+from pool import PooledQuiz
+from prompt import Difficulty
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CORPUS_PATH = ".cache/corpus.sqlite"
+FINGERPRINT_BITS = 64
+BANDS = 8
+BAND_BITS = FINGERPRINT_BITS // BANDS
+# with 8 bands, fingerprints within a distance of 7 bits share at least one band (pigeonhole principle)
+DEFAULT_MAX_DISTANCE = BANDS - 1
+TOKEN_PATTERN = re.compile(r"\w+")
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS quiz (
+    id INTEGER PRIMARY KEY,
+    db_model TEXT NOT NULL,
+    difficulty TEXT NOT NULL,
+    question TEXT NOT NULL,
+    quiz TEXT NOT NULL,
+    speech_question BLOB NOT NULL,
+    fingerprint INTEGER NOT NULL,
+    {", ".join(f"band_{band} INTEGER NOT NULL" for band in range(BANDS))},
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS quiz_bucket ON quiz (db_model, difficulty);
+{"".join(f"CREATE INDEX IF NOT EXISTS quiz_band_{band} ON quiz (db_model, band_{band});" for band in range(BANDS))}
+"""
+
+
+def simhash(text: str) -> int:
+    weights = [0] * FINGERPRINT_BITS
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        value = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(FINGERPRINT_BITS):
+            weights[bit] += 1 if value >> bit & 1 else -1
+
+    return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+
+def hamming_distance(first: int, second: int) -> int:
+    return (first ^ second).bit_count()
+
+
+def fingerprint(quiz: ArcticQuiz) -> int:
+    return simhash(" ".join((quiz.question, quiz.answer_1, quiz.answer_2, quiz.answer_3)))
+
+
+def _bands(value: int) -> list[int]:
+    return [value >> (band * BAND_BITS) & ((1 << BAND_BITS) - 1) for band in range(BANDS)]
+
+
+def _to_signed(value: int) -> int:
+    # SQLite integers are signed 64 bit
+    return value - (1 << FINGERPRINT_BITS) if value >= 1 << (FINGERPRINT_BITS - 1) else value
+
+
+def _to_unsigned(value: int) -> int:
+    return value + (1 << FINGERPRINT_BITS) if value < 0 else value
+
+
+@dataclass(frozen=True)
+class CorpusQuiz:
+    id: int
+    pooled_quiz: PooledQuiz
+
+
+@dataclass
+class CorpusStats:
+    inserts: int = 0
+    duplicates: int = 0
+    samples: int = 0
+    exhausted: int = 0
+    entries: int = 0
+
+
+class QuizCorpus:
+
+    def __init__(self, path: str = DEFAULT_CORPUS_PATH, max_distance: int = DEFAULT_MAX_DISTANCE):
+        if not 0 <= max_distance < BANDS:
+            raise ValueError(f"max_distance must be between 0 and {BANDS - 1} to be found by the band index")
+
+        self.path = path
+        self.max_distance = max_distance
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode = WAL")
+        self._connection.executescript(SCHEMA)
+        self._stats = CorpusStats()
+
+        # ids per bucket are kept in memory, sampling never scans the table
+        self._ids: dict[tuple[str, str], list[int]] = {}
+        for quiz_id, db_model, difficulty in self._connection.execute("SELECT id, db_model, difficulty FROM quiz"):
+            self._ids.setdefault((db_model, difficulty), []).append(quiz_id)
+
+    def find_duplicate(self, db_model: str, quiz: ArcticQuiz) -> int | None:
+        with self._lock:
+            return self._find_duplicate(db_model, fingerprint(quiz))
+
+    def _find_duplicate(self, db_model: str, value: int) -> int | None:
+        bands = _bands(value)
+        candidates = self._connection.execute(
+            f"SELECT id, fingerprint FROM quiz WHERE db_model = ? AND ({' OR '.join(f'band_{band} = ?' for band in range(BANDS))})",
+            (db_model, *bands)
+        )
+        for quiz_id, candidate in candidates:
+            if hamming_distance(value, _to_unsigned(candidate)) <= self.max_distance:
+                return quiz_id
+
+        return None
+
+    def add(self, db_model: str, difficulty: Difficulty, pooled_quiz: PooledQuiz) -> int:
+        # returns the id of the new quiz, or of the near-duplicate which is already stored
+        value = fingerprint(pooled_quiz.quiz)
+        with self._lock:
+            if (duplicate := self._find_duplicate(db_model, value)) is not None:
+                self._stats.duplicates += 1
+                return duplicate
+
+            with self._connection:
+                cursor = self._connection.execute(
+                    f"INSERT INTO quiz (db_model, difficulty, question, quiz, speech_question, fingerprint, "
+                    f"{', '.join(f'band_{band}' for band in range(BANDS))}, created_at) "
+                    f"VALUES (?, ?, ?, ?, ?, ?, {', '.join('?' * BANDS)}, ?)",
+                    (
+                        db_model,
+                        difficulty.name,
+                        pooled_quiz.quiz.question,
+                        pooled_quiz.quiz.model_dump_json(),
+                        pooled_quiz.speech_question,
+                        _to_signed(value),
+                        *_bands(value),
+                        time.time()
+                    )
+                )
+
+            self._ids.setdefault((db_model, difficulty.name), []).append(cursor.lastrowid)
+            self._stats.inserts += 1
+            return cursor.lastrowid
+
+    def sample(self, db_model: str, difficulty: Difficulty, exclude: set[int] = frozenset()) -> CorpusQuiz | None:
+        with self._lock:
+            ids = self._ids.get((db_model, difficulty.name), [])
+            candidates = [quiz_id for quiz_id in ids if quiz_id not in exclude]
+            if not candidates:
+                self._stats.exhausted += 1
+                return None
+
+            quiz_id = random.choice(candidates)
+            quiz_json, speech_question = self._connection.execute(
+                "SELECT quiz, speech_question FROM quiz WHERE id = ?", (quiz_id,)
+            ).fetchone()
+            self._stats.samples += 1
+
+        return CorpusQuiz(
+            id=quiz_id,
+            pooled_quiz=PooledQuiz(quiz=ArcticQuiz.model_validate_json(quiz_json), speech_question=speech_question)
+        )
+
+    def count(self, db_model: str, difficulty: Difficulty) -> int:
+        with self._lock:
+            return len(self._ids.get((db_model, difficulty.name), []))
+
+    def stats(self) -> CorpusStats:
+        with self._lock:
+            return CorpusStats(
+                inserts=self._stats.inserts,
+                duplicates=self._stats.duplicates,
+                samples=self._stats.samples,
+                exhausted=self._stats.exhausted,
+                entries=sum(len(ids) for ids in self._ids.values())
+            )
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
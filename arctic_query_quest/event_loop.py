@@ -0,0 +1,99 @@
+import asyncio
+import atexit
+import concurrent.futures
+import contextvars
+import logging
+import threading
+from typing import Any, Coroutine, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class BackgroundLoop:
+
+    def __init__(self, name: str = "async-engine"):
+        self.name = name
+        self._lock = threading.Lock()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread: threading.Thread | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._loop is not None and self._loop.is_running()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        if self._loop is not None:
+            return self._loop
+
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                started = threading.Event()
+
+                def run():
+                    asyncio.set_event_loop(loop)
+                    loop.call_soon(started.set)
+                    loop.run_forever()
+
+                self._thread = threading.Thread(target=run, name=self.name, daemon=True)
+                self._thread.start()
+                started.wait()
+                self._loop = loop
+                logger.info(f"started event loop {self.name}")
+
+        return self._loop
+
+    def submit(self, coroutine: Coroutine[Any, Any, T]) -> concurrent.futures.Future[T]:
+        # context variables of the submitting thread (e.g. the session of a call) are carried over to the task
+        context = contextvars.copy_context()
+
+        async def run_in_context() -> T:
+            for variable, value in context.items():
+                variable.set(value)
+            return await coroutine
+
+        # cancelling the returned future cancels the task on the loop as well
+        return asyncio.run_coroutine_threadsafe(run_in_context(), self.loop)
+
+    def run(self, coroutine: Coroutine[Any, Any, T], timeout: float | None = None) -> T:
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("blocking on the event loop from within the loop would deadlock")
+
+        future = self.submit(coroutine)
+        try:
+            return future.result(timeout)
+        except BaseException:
+            # timeouts and interrupted Streamlit script runs must not leave generations running upstream
+            future.cancel()
+            raise
+
+    def stop(self, timeout: float | None = 5.0):
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+
+        if loop is None:
+            return
+
+        async def shutdown():
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await loop.shutdown_asyncgens()
+
+        try:
+            asyncio.run_coroutine_threadsafe(shutdown(), loop).result(timeout)
+        except Exception as e:
+            logger.error(f"could not shut down event loop {self.name}: {e}")
+
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout)
+        loop.close()
+
+
+background_loop = BackgroundLoop()
+atexit.register(background_loop.stop)
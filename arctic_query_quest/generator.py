@@ -0,0 +1,181 @@
+import asyncio
+import logging
+from concurrent.futures import Future
+from dataclasses import dataclass
+
+from arctic import ArcticClient, ArcticQuiz
+from common import load_model
+from event_loop import background_loop
+from metrics import metrics
+from pool import PooledQuiz
+from prompt import Difficulty, PromptGenerator
+from prompt_optimizer import PromptOptimizer
+from resilience import RetryPolicy, resilient
+from tts import SpeechClient, join_mp3, split_sentences
+from verifier import QuizRejected, QuizVerifier
+
+logger = logging.getLogger(__name__)
+
+# rejected quizzes are parse errors for the retry logic, regenerate almost immediately, upstream errors have
+# already been retried by the Arctic client
+REJECTION_RETRY_POLICY = RetryPolicy(max_attempts=3)
+
+
+@dataclass(frozen=True)
+class QuizSpeech:
+    answers: bytes
+    explanation: bytes
+
+
+class QuizGenerator:
+
+    def __init__(
+        self,
+        prompt_generator: PromptGenerator,
+        arctic_client: ArcticClient,
+        tts_client: SpeechClient,
+        verifier: QuizVerifier | None = None,
+        prompt_optimizer: PromptOptimizer | None = None
+    ):
+        self.prompt_generator = prompt_generator
+        self.arctic_client = arctic_client
+        self.tts_client = tts_client
+        self.verifier = verifier
+        self.prompt_optimizer = prompt_optimizer
+
+    def _model(self, db_model: str, difficulty: Difficulty) -> str:
+        if self.prompt_optimizer is None:
+            return load_model(db_model)
+        return self.prompt_optimizer.compact(db_model, load_model(db_model), difficulty)
+
+    def prompt(self, db_model: str, difficulty: Difficulty) -> str:
+        with metrics.span("prompt_build"):
+            return self.prompt_generator.generate_prompt(
+                model=self._model(db_model, difficulty),
+                difficulty=difficulty,
+            )
+
+    def verify(self, db_model: str, generated_quiz: ArcticQuiz):
+        if self.verifier is None:
+            return
+
+        try:
+            self.verifier.ensure_valid(db_model, generated_quiz)
+        except QuizRejected:
+            metrics.increment("quizzes_rejected", model=db_model)
+            raise
+
+    @resilient(REJECTION_RETRY_POLICY, retry_on=(QuizRejected,))
+    def _invoke(self, db_model: str, prompt: str) -> ArcticQuiz:
+        generated_quiz = self.arctic_client.invoke(prompt)
+        self.verify(db_model, generated_quiz)
+        return generated_quiz
+
+    @resilient(REJECTION_RETRY_POLICY, retry_on=(QuizRejected,))
+    async def _ainvoke(self, db_model: str, prompt: str) -> ArcticQuiz:
+        generated_quiz = await self.arctic_client.ainvoke(prompt)
+        # the verifier runs SQL, which must not block the event loop
+        await asyncio.to_thread(self.verify, db_model, generated_quiz)
+        return generated_quiz
+
+    async def aspeech(self, generated_quiz: ArcticQuiz) -> QuizSpeech:
+        answers, explanation = await asyncio.gather(
+            asyncio.gather(*(
+                self.tts_client.asynthesize_chunked(f"Answer {number}: {getattr(generated_quiz, f'answer_{number}')}")
+                for number in (1, 2, 3)
+            )),
+            self.tts_client.asynthesize_chunked(generated_quiz.explanation)
+        )
+        return QuizSpeech(answers=join_mp3(list(answers)), explanation=explanation)
+
+    @staticmethod
+    def upstream_calls(generated_quiz: ArcticQuiz) -> int:
+        # one Replicate prediction and one TTS request per sentence chunk of the spoken texts
+        texts = [
+            generated_quiz.question,
+            *(f"Answer {number}: {getattr(generated_quiz, f'answer_{number}')}" for number in (1, 2, 3)),
+            generated_quiz.explanation
+        ]
+        return 1 + sum(len(split_sentences(text)) for text in texts)
+
+    def speech(self, pooled_quiz: PooledQuiz) -> Future[QuizSpeech]:
+        if pooled_quiz.speech_answers is not None and pooled_quiz.speech_explanation is not None:
+            future = Future()
+            future.set_result(QuizSpeech(answers=pooled_quiz.speech_answers, explanation=pooled_quiz.speech_explanation))
+            return future
+
+        return background_loop.submit(self.aspeech(pooled_quiz.quiz))
+
+    async def _apooled(self, generated_quiz: ArcticQuiz) -> PooledQuiz:
+        # question, answers and explanation are all synthesized at the same time
+        speech_question, speech = await asyncio.gather(
+            self.tts_client.asynthesize_chunked(generated_quiz.question),
+            self.aspeech(generated_quiz)
+        )
+        return PooledQuiz(
+            quiz=generated_quiz,
+            speech_question=speech_question,
+            speech_answers=speech.answers,
+            speech_explanation=speech.explanation
+        )
+
+    def generate(self, db_model: str, difficulty: Difficulty) -> PooledQuiz:
+        generated_quiz = self._invoke(db_model, self.prompt(db_model, difficulty))
+        return background_loop.run(self._apooled(generated_quiz))
+
+    async def agenerate(self, db_model: str, difficulty: Difficulty) -> PooledQuiz:
+        generated_quiz = await self._ainvoke(db_model, self.prompt(db_model, difficulty))
+        return await self._apooled(generated_quiz)
+
+    def generate_many(self, db_model: str, difficulty: Difficulty, count: int) -> list[PooledQuiz]:
+        # independent generations kept in flight together on the shared event loop instead of one thread each
+        async def generate_all():
+            return await asyncio.gather(
+                *(self.agenerate(db_model, difficulty) for _ in range(count)),
+                return_exceptions=True
+            )
+
+        results = background_loop.run(generate_all())
+        for error in (result for result in results if isinstance(result, BaseException)):
+            logger.warning(f"dropping failed generation: {error}")
+
+        pooled_quizzes = [result for result in results if not isinstance(result, BaseException)]
+        if not pooled_quizzes:
+            raise results[0]
+        return pooled_quizzes
+
+    def generate_batch(self, db_model: str, difficulty: Difficulty, count: int) -> list[PooledQuiz]:
+        with metrics.span("prompt_build"):
+            prompt = self.prompt_generator.generate_batch_prompt(
+                model=self._model(db_model, difficulty),
+                difficulty=difficulty,
+                count=count
+            )
+
+        quiz_batch = self.arctic_client.invoke_batch(prompt, count)
+        generated_quizzes = []
+        for generated_quiz in quiz_batch.quizzes:
+            try:
+                self.verify(db_model, generated_quiz)
+                generated_quizzes.append(generated_quiz)
+            except QuizRejected as e:
+                logger.warning(f"dropping rejected quiz from batch: {e}")
+
+        if not generated_quizzes:
+            raise QuizRejected(f"all {len(quiz_batch.quizzes)} quizzes of the batch were rejected")
+
+        async def synthesize_all():
+            # a failed synthesis costs its own quiz, not the whole batch
+            return await asyncio.gather(
+                *(self._apooled(generated_quiz) for generated_quiz in generated_quizzes),
+                return_exceptions=True
+            )
+
+        results = background_loop.run(synthesize_all())
+        for error in (result for result in results if isinstance(result, BaseException)):
+            logger.warning(f"dropping quiz from batch, speech synthesis failed: {error}")
+
+        pooled_quizzes = [result for result in results if not isinstance(result, BaseException)]
+        if not pooled_quizzes:
+            raise results[0]
+        return pooled_quizzes
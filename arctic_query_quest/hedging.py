@@ -0,0 +1,158 @@
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Callable, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+DEFAULT_QUANTILE = 0.9
+DEFAULT_DELAY = 15.0
+DEFAULT_MIN_DELAY = 1.0
+DEFAULT_MIN_SAMPLES = 10
+DEFAULT_WINDOW = 200
+
+
+class HedgeCancelled(Exception):
+    pass
+
+
+@dataclass
+class HedgeStats:
+    requests: int = 0
+    hedges_fired: int = 0
+    hedges_won: int = 0
+    hedges_skipped: int = 0
+    threshold: float = 0.0
+
+
+class LatencyTracker:
+
+    def __init__(self, window: int = DEFAULT_WINDOW):
+        self._lock = threading.Lock()
+        self._samples: deque[float] = deque(maxlen=window)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def record(self, latency: float):
+        with self._lock:
+            self._samples.append(latency)
+
+    def quantile(self, q: float) -> float | None:
+        with self._lock:
+            if not self._samples:
+                return None
+            ordered = sorted(self._samples)
+
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Hedger:
+
+    def __init__(
+        self,
+        quantile: float = DEFAULT_QUANTILE,
+        default_delay: float = DEFAULT_DELAY,
+        min_delay: float = DEFAULT_MIN_DELAY,
+        min_samples: int = DEFAULT_MIN_SAMPLES,
+        max_hedges: int = 1,
+        max_extra_in_flight: int = 4
+    ):
+        self.quantile = quantile
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.max_hedges = max_hedges
+
+        self.latencies = LatencyTracker()
+        self._extra_in_flight = threading.BoundedSemaphore(max_extra_in_flight)
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_extra_in_flight * 2 + 8,
+            thread_name_prefix="hedge"
+        )
+        self._lock = threading.Lock()
+        self._stats = HedgeStats()
+
+    def threshold(self) -> float:
+        if len(self.latencies) < self.min_samples:
+            return self.default_delay
+
+        return max(self.min_delay, self.latencies.quantile(self.quantile))
+
+    def stats(self) -> HedgeStats:
+        with self._lock:
+            return HedgeStats(
+                requests=self._stats.requests,
+                hedges_fired=self._stats.hedges_fired,
+                hedges_won=self._stats.hedges_won,
+                hedges_skipped=self._stats.hedges_skipped,
+                threshold=self.threshold()
+            )
+
+    def run(self, func: Callable[[threading.Event], T]) -> T:
+        with self._lock:
+            self._stats.requests += 1
+
+        attempts: dict[Future, tuple[int, threading.Event]] = {}
+        errors: list[Exception] = []
+        hedges = 0
+
+        def launch(index: int) -> Future:
+            cancel = threading.Event()
+            started = time.monotonic()
+
+            def attempt():
+                try:
+                    result = func(cancel)
+                    if not cancel.is_set():
+                        self.latencies.record(time.monotonic() - started)
+                    return result
+                finally:
+                    if index > 0:
+                        self._extra_in_flight.release()
+
+            future = self._executor.submit(attempt)
+            attempts[future] = (index, cancel)
+            return future
+
+        pending = {launch(0)}
+        try:
+            while pending:
+                can_hedge = hedges < self.max_hedges
+                done, pending = wait(pending, timeout=self.threshold() if can_hedge else None, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    index, _ = attempts[future]
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        errors.append(e)
+                        continue
+
+                    if index > 0:
+                        with self._lock:
+                            self._stats.hedges_won += 1
+                    return result
+
+                if not done and can_hedge:
+                    if self._extra_in_flight.acquire(blocking=False):
+                        hedges += 1
+                        with self._lock:
+                            self._stats.hedges_fired += 1
+                        logger.info(f"hedging request after {self.threshold():.1f}s")
+                        pending.add(launch(hedges))
+                    else:
+                        hedges = self.max_hedges
+                        with self._lock:
+                            self._stats.hedges_skipped += 1
+
+            raise errors[0]
+        finally:
+            for future, (_, cancel) in attempts.items():
+                if not future.done():
+                    cancel.set()
@@ -0,0 +1,165 @@
+DEFAULT_MAX_PREAMBLE = 4000
+DEFAULT_MAX_LENGTH = 32000
+
+WHITESPACE = " \t\r\n"
+
+
+class JsonStreamError(ValueError):
+    pass
+
+
+class JsonStreamExtractor:
+    """
+    Incremental extractor for the first top-level JSON object (or array) in a text stream.
+
+    Chunks are consumed character by character exactly once. Besides the complete JSON text, top-level members
+    of an object are exposed as soon as their raw value is closed, and a top-level string value which is still
+    being written is available as partial raw text.
+    """
+
+    def __init__(
+        self,
+        root: str = "{",
+        max_preamble: int = DEFAULT_MAX_PREAMBLE,
+        max_length: int = DEFAULT_MAX_LENGTH
+    ):
+        if root not in "{[" or len(root) != 1:
+            raise ValueError(f"invalid JSON root: {root}")
+
+        self.root = root
+        self.root_end = "}" if root == "{" else "]"
+        self.max_preamble = max_preamble
+        self.max_length = max_length
+
+        self.preamble = 0
+        self.complete = False
+        self.members: dict[str, str] = {}
+        self.items: list[str] = []
+
+        self._parts: list[str] = []
+        self._length = 0
+        self._started = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+        self._key: str | None = None
+        self._expect_key = True
+        self._token: list[str] | None = None
+        self._token_is_string = False
+
+    @property
+    def text(self) -> str:
+        return "".join(self._parts)
+
+    @property
+    def open_member(self) -> tuple[str, str] | None:
+        if self.root == "{" and self._in_string and self._key is not None and self._token_is_string:
+            return self._key, "".join(self._token[1:])
+        return None
+
+    def feed(self, chunk: str) -> bool:
+        if self.complete:
+            return True
+
+        start = 0 if self._started else None
+        for position, char in enumerate(chunk):
+            if not self._started:
+                if char != self.root:
+                    self.preamble += 1
+                    if self.preamble > self.max_preamble:
+                        raise JsonStreamError(f"no JSON {self.root} found within {self.max_preamble} characters")
+                    continue
+                self._started = True
+                start = position
+
+            self._length += 1
+            if self._length > self.max_length:
+                raise JsonStreamError(f"JSON exceeds {self.max_length} characters")
+
+            self._consume(char)
+            if self.complete:
+                self._parts.append(chunk[start:position + 1])
+                return True
+
+        if start is not None:
+            self._parts.append(chunk[start:])
+
+        return False
+
+    def _consume(self, char: str):
+        if self._in_string:
+            self._append(char)
+            if self._escape:
+                self._escape = False
+            elif char == "\\":
+                self._escape = True
+            elif char == '"':
+                self._in_string = False
+                if self._depth == 1:
+                    self._close_string()
+            return
+
+        if char == '"':
+            self._in_string = True
+            if self._depth == 1 and self._token is None:
+                self._token = []
+                self._token_is_string = True
+            self._append(char)
+            return
+
+        if char in "{[":
+            if self._depth == 1 and self._token is None:
+                self._token = []
+                self._token_is_string = False
+            self._append(char)
+            self._depth += 1
+            return
+
+        if char in "}]":
+            if self._depth == 1:
+                self._close_value()
+            self._depth -= 1
+            self._append(char)
+            if self._depth == 0:
+                if char != self.root_end:
+                    raise JsonStreamError(f"unbalanced JSON: unexpected {char}")
+                self.complete = True
+            return
+
+        if self._depth == 1:
+            if char == ",":
+                self._close_value()
+                self._expect_key = True
+            elif char == ":" and self.root == "{":
+                self._expect_key = False
+            elif char not in WHITESPACE:
+                if self._token is None:
+                    self._token = []
+                    self._token_is_string = False
+                self._token.append(char)
+        else:
+            self._append(char)
+
+    def _append(self, char: str):
+        if self._depth >= 1 and self._token is not None:
+            self._token.append(char)
+
+    def _close_string(self):
+        if self.root == "{" and self._expect_key:
+            self._key = "".join(self._token)[1:-1]
+            self._token = None
+
+    def _close_value(self):
+        if self._token is None:
+            return
+
+        raw = "".join(self._token).strip()
+        if self.root == "{":
+            if self._key is not None:
+                self.members[self._key] = raw
+            self._key = None
+        else:
+            self.items.append(raw)
+
+        self._token = None
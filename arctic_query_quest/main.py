@@ -1,7 +1,15 @@
-import streamlit as st
+from startup import startup
 
-from app import ArcticQueryQuest
-from common import AppState, init_page, console_log
+# only takes effect before the app modules are imported
+startup.profile_imports()
+
+import streamlit as st  # noqa: E402
+
+from app import ArcticQueryQuest  # noqa: E402
+from common import AppState, init_page, console_log  # noqa: E402
+from metrics import metrics  # noqa: E402
+from registry import registry  # noqa: E402
+from resources import QUIZ_GENERATOR  # noqa: E402
 
 if __name__ == '__main__':
     init_page()
@@ -11,9 +19,14 @@ if __name__ == '__main__':
     state = st.session_state.app_state
 
     console_log(f"rendering state: {state}")
-    if state == AppState.START:
-        arctic_query_quest.start()
-    elif state == AppState.QUIZ:
-        arctic_query_quest.quiz()
-    elif state == AppState.EVALUATE:
-        arctic_query_quest.evaluate()
+    with metrics.span("render", state=state.value):
+        if state == AppState.START:
+            arctic_query_quest.start()
+        elif state == AppState.QUIZ:
+            arctic_query_quest.quiz()
+        elif state == AppState.EVALUATE:
+            arctic_query_quest.evaluate()
+
+    startup.first_render()
+    if st.secrets.get("startup", {}).get("warm_up", True):
+        startup.warm_up(lambda: registry.get(QUIZ_GENERATOR))
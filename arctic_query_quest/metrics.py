@@ -0,0 +1,165 @@
+import json
+import logging
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+QUANTILES = (0.5, 0.95, 0.99)
+DEFAULT_WINDOW = 1024
+METRIC_PREFIX = "arctic_query_quest"
+
+
+def _key(name: str, labels: dict[str, str]) -> tuple[str, tuple[tuple[str, str], ...]]:
+    return name, tuple(sorted(labels.items()))
+
+
+def _format_labels(labels: tuple[tuple[str, str], ...], **extra: str) -> str:
+    pairs = [*labels, *extra.items()]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+
+class Histogram:
+
+    def __init__(self, window: int = DEFAULT_WINDOW):
+        self._lock = threading.Lock()
+        self._samples: deque[float] = deque(maxlen=window)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        with self._lock:
+            self._samples.append(value)
+            self.count += 1
+            self.sum += value
+
+    def quantiles(self) -> dict[float, float]:
+        with self._lock:
+            ordered = sorted(self._samples)
+
+        if not ordered:
+            return {q: math.nan for q in QUANTILES}
+        return {q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] for q in QUANTILES}
+
+
+class MetricsRegistry:
+
+    def __init__(self, window: int = DEFAULT_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._histograms: dict[tuple, Histogram] = {}
+        self._counters: dict[tuple, float] = {}
+        self._gauges: dict[str, Callable[[], dict[str, float]]] = {}
+
+    def observe(self, name: str, value: float, **labels: str):
+        key = _key(name, labels)
+        if (histogram := self._histograms.get(key)) is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, Histogram(self.window))
+        histogram.observe(value)
+
+    def increment(self, name: str, value: float = 1, **labels: str):
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def counter(self, name: str, **labels: str) -> float:
+        with self._lock:
+            return self._counters.get(_key(name, labels), 0)
+
+    def register_gauge(self, name: str, collect: Callable[[], dict[str, float]]):
+        with self._lock:
+            self._gauges[name] = collect
+
+    @contextmanager
+    def span(self, stage: str, **labels: str):
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            yield
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            self.observe("stage_seconds", elapsed, stage=stage, **labels)
+            logger.debug(f"stage {stage} took {elapsed * 1000:.1f}ms ({status})")
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            histograms = list(self._histograms.items())
+            counters = list(self._counters.items())
+            gauges = list(self._gauges.items())
+
+        result = {"histograms": [], "counters": [], "gauges": []}
+        for (name, labels), histogram in sorted(histograms):
+            result["histograms"].append({
+                "name": name,
+                "labels": dict(labels),
+                "count": histogram.count,
+                "sum": histogram.sum,
+                **{f"p{int(q * 100)}": value for q, value in histogram.quantiles().items()}
+            })
+        for (name, labels), value in sorted(counters):
+            result["counters"].append({"name": name, "labels": dict(labels), "value": value})
+        for name, collect in sorted(gauges, key=lambda gauge: gauge[0]):
+            try:
+                values = collect()
+            except Exception as e:
+                logger.error(f"could not collect gauge {name}: {e}")
+                continue
+            for key, value in values.items():
+                result["gauges"].append({"name": name, "labels": {"key": key}, "value": value})
+
+        return result
+
+    def to_json(self) -> str:
+        # NaN is not valid JSON, empty histograms report null quantiles
+        def clean(value):
+            return None if isinstance(value, float) and math.isnan(value) else value
+
+        snapshot = self.snapshot()
+        for histogram in snapshot["histograms"]:
+            for key, value in histogram.items():
+                histogram[key] = clean(value)
+        return json.dumps(snapshot, indent=2)
+
+    def to_prometheus(self) -> str:
+        snapshot = self.snapshot()
+        lines = []
+        declared = set()
+
+        def declare(name: str, metric_type: str):
+            if name not in declared:
+                declared.add(name)
+                lines.append(f"# TYPE {name} {metric_type}")
+
+        for histogram in snapshot["histograms"]:
+            name = f"{METRIC_PREFIX}_{histogram['name']}"
+            labels = tuple(histogram["labels"].items())
+            declare(name, "summary")
+            for q in QUANTILES:
+                lines.append(f"{name}{_format_labels(labels, quantile=str(q))} {histogram[f'p{int(q * 100)}']}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {histogram['sum']}")
+            lines.append(f"{name}_count{_format_labels(labels)} {histogram['count']}")
+
+        for counter in snapshot["counters"]:
+            name = f"{METRIC_PREFIX}_{counter['name']}_total"
+            declare(name, "counter")
+            lines.append(f"{name}{_format_labels(tuple(counter['labels'].items()))} {counter['value']}")
+
+        for gauge in snapshot["gauges"]:
+            name = f"{METRIC_PREFIX}_{gauge['name']}"
+            declare(name, "gauge")
+            lines.append(f"{name}{_format_labels(tuple(gauge['labels'].items()))} {gauge['value']}")
+
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,181 @@
+import logging
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable
+
+from arctic import ArcticQuiz
+from prompt import Difficulty
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOW_WATERMARK = 1
+DEFAULT_HIGH_WATERMARK = 3
+DEFAULT_ERROR_BACKOFF = 5.0
+
+
+@dataclass(frozen=True)
+class PooledQuiz:
+    quiz: ArcticQuiz
+    speech_question: bytes
+    speech_answers: bytes | None = None
+    speech_explanation: bytes | None = None
+
+
+@dataclass
+class PoolStats:
+    hits: int = 0
+    misses: int = 0
+    refills: int = 0
+    refill_errors: int = 0
+    last_refill_lag: float = 0.0
+    max_refill_lag: float = 0.0
+    sizes: dict[str, int] = field(default_factory=dict)
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class _Bucket:
+
+    def __init__(self):
+        self.items: deque[PooledQuiz] = deque()
+        self.active = False
+        self.refilling = False
+        self.starved_since: float | None = None
+
+
+class QuizPool:
+
+    def __init__(
+        self,
+        producer: Callable[[str, Difficulty], PooledQuiz],
+        low_watermark: int = DEFAULT_LOW_WATERMARK,
+        high_watermark: int = DEFAULT_HIGH_WATERMARK,
+        error_backoff: float = DEFAULT_ERROR_BACKOFF,
+        batch_producer: Callable[[str, Difficulty, int], list[PooledQuiz]] | None = None
+    ):
+        if not 0 <= low_watermark <= high_watermark or high_watermark < 1:
+            raise ValueError(f"invalid watermarks: low={low_watermark}, high={high_watermark}")
+
+        self.producer = producer
+        self.batch_producer = batch_producer
+        self.low_watermark = low_watermark
+        self.high_watermark = high_watermark
+        self.error_backoff = error_backoff
+
+        self._buckets: dict[tuple[str, Difficulty], _Bucket] = {}
+        self._stats = PoolStats()
+        self._condition = threading.Condition()
+        self._worker: threading.Thread | None = None
+        self._stopped = False
+
+    def start(self):
+        with self._condition:
+            if self._worker is not None:
+                return
+            self._stopped = False
+            self._worker = threading.Thread(target=self._run, name="quiz-pool-refill", daemon=True)
+            self._worker.start()
+
+    def stop(self, timeout: float | None = None):
+        with self._condition:
+            self._stopped = True
+            worker, self._worker = self._worker, None
+            self._condition.notify_all()
+
+        if worker is not None:
+            worker.join(timeout)
+
+    def get(self, db_model: str, difficulty: Difficulty) -> PooledQuiz | None:
+        with self._condition:
+            bucket = self._bucket(db_model, difficulty)
+            bucket.active = True
+
+            item = bucket.items.popleft() if bucket.items else None
+            if item is not None:
+                self._stats.hits += 1
+            else:
+                self._stats.misses += 1
+
+            if len(bucket.items) < self.low_watermark and not bucket.refilling:
+                bucket.refilling = True
+                bucket.starved_since = time.monotonic()
+                self._condition.notify_all()
+
+            return item
+
+    def put_back(self, db_model: str, difficulty: Difficulty, items: list[PooledQuiz]):
+        # taken but not served, kept for other sessions behind the items already waiting
+        with self._condition:
+            self._bucket(db_model, difficulty).items.extend(items)
+            self._stats.hits -= len(items)
+
+    def take(self, db_model: str, difficulty: Difficulty) -> PooledQuiz:
+        if (item := self.get(db_model, difficulty)) is not None:
+            return item
+
+        logger.info(f"quiz pool miss for {db_model}/{difficulty.name}, generating live")
+        return self.producer(db_model, difficulty)
+
+    def stats(self) -> PoolStats:
+        with self._condition:
+            return PoolStats(
+                hits=self._stats.hits,
+                misses=self._stats.misses,
+                refills=self._stats.refills,
+                refill_errors=self._stats.refill_errors,
+                last_refill_lag=self._stats.last_refill_lag,
+                max_refill_lag=self._stats.max_refill_lag,
+                sizes={f"{key[0]}/{key[1].name}": len(bucket.items) for key, bucket in self._buckets.items()}
+            )
+
+    def _bucket(self, db_model: str, difficulty: Difficulty) -> _Bucket:
+        key = (db_model, difficulty)
+        if key not in self._buckets:
+            self._buckets[key] = _Bucket()
+        return self._buckets[key]
+
+    def _next_refill(self) -> tuple[str, Difficulty] | None:
+        pending = [(len(bucket.items), key) for key, bucket in self._buckets.items() if bucket.active and bucket.refilling]
+        if not pending:
+            return None
+        return min(pending, key=lambda entry: entry[0])[1]
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._stopped and (key := self._next_refill()) is None:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                missing = self.high_watermark - len(self._buckets[key].items)
+
+            try:
+                if self.batch_producer is not None and missing > 1:
+                    items = self.batch_producer(*key, missing)
+                else:
+                    items = [self.producer(*key)]
+            except Exception as e:
+                logger.error(f"quiz pool refill failed for {key[0]}/{key[1].name}: {e}")
+                with self._condition:
+                    self._stats.refill_errors += 1
+                    self._condition.wait(self.error_backoff)
+                continue
+
+            with self._condition:
+                bucket = self._buckets[key]
+                bucket.items.extend(items)
+                self._stats.refills += len(items)
+
+                if bucket.starved_since is not None and len(bucket.items) >= max(self.low_watermark, 1):
+                    lag = time.monotonic() - bucket.starved_since
+                    self._stats.last_refill_lag = lag
+                    self._stats.max_refill_lag = max(self._stats.max_refill_lag, lag)
+                    bucket.starved_since = None
+
+                if len(bucket.items) >= self.high_watermark:
+                    bucket.refilling = False
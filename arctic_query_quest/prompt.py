@@ -1,7 +1,9 @@
+import threading
 from enum import StrEnum
-from pathlib import Path
 
-from langchain_core.prompts import PromptTemplate
+from assets import AssetRegistry, assets
+from audio_cache import cache_key
+from shared_cache import SharedCache
 
 BASE_PATH = "templates"
 MAIN_TEMPLATE = "prompt.jinja"
@@ -23,23 +25,66 @@ def get_difficulty_by_name(name: str) -> Difficulty:
 
 class PromptGenerator:
 
-    def __init__(self):
-        self.base_template = PromptTemplate.from_file(
-            template_file=Path(f"{BASE_PATH}/{MAIN_TEMPLATE}"),
-            template_format="jinja2"
-        )
+    def __init__(self, asset_registry: AssetRegistry = assets, cache: SharedCache | None = None):
+        self.assets = asset_registry
+        self.cache = cache
+        self._lock = threading.Lock()
+        self._prompts: dict[tuple[str, Difficulty, int], str] = {}
+        self._version = self.assets.version
+
+    def warm_up(self, models: list[str], counts: tuple[int, ...] = (1,)):
+        for model in models:
+            for difficulty in Difficulty:
+                for count in counts:
+                    self.generate_batch_prompt(model=model, difficulty=difficulty, count=count)
 
     def generate_prompt(
         self,
         model: str,
         difficulty: Difficulty
     ) -> str:
-        difficulty_template = PromptTemplate.from_file(
-            template_file=Path(f"{BASE_PATH}/{DIFFICULTY_PATH}/{difficulty.value}"),
-            template_format="jinja2"
-        )
+        return self.generate_batch_prompt(model=model, difficulty=difficulty, count=1)
+
+    def generate_batch_prompt(
+        self,
+        model: str,
+        difficulty: Difficulty,
+        count: int
+    ) -> str:
+        if count < 1:
+            raise ValueError(f"invalid number of quizzes: {count}")
+
+        key = (model, difficulty, count)
+        with self._lock:
+            if self._version != self.assets.version:
+                self._prompts.clear()
+                self._version = self.assets.version
+            if (prompt := self._prompts.get(key)) is not None:
+                return prompt
+
+        if self.cache is None:
+            prompt = self._render(model, difficulty, count)
+        else:
+            # keyed by the template sources, replicas agree on a prompt whatever the version of their assets
+            shared_key = cache_key(
+                self.assets.text(f"{BASE_PATH}/{MAIN_TEMPLATE}").encode("utf-8"),
+                self.assets.text(f"{BASE_PATH}/{DIFFICULTY_PATH}/{difficulty.value}").encode("utf-8"),
+                model.encode("utf-8"),
+                str(count).encode("utf-8")
+            )
+            prompt = self.cache.get_or_compute(
+                shared_key,
+                lambda: self._render(model, difficulty, count).encode("utf-8")
+            ).decode("utf-8")
+
+        with self._lock:
+            self._prompts[key] = prompt
+        return prompt
 
-        return self.base_template.format(
+    def _render(self, model: str, difficulty: Difficulty, count: int) -> str:
+        difficulty_template = self.assets.template(f"{BASE_PATH}/{DIFFICULTY_PATH}/{difficulty.value}")
+        return self.assets.template(f"{BASE_PATH}/{MAIN_TEMPLATE}").render(
             model=model,
-            difficulty=difficulty_template.format()
+            difficulty=difficulty_template.render(),
+            count=count
         )
@@ -0,0 +1,149 @@
+import logging
+import re
+import threading
+from dataclasses import dataclass
+
+from prompt import Difficulty
+from tokens import TokenCounter
+
+logger = logging.getLogger(__name__)
+
+CREATE_TABLE_PATTERN = re.compile(r"^CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)", re.IGNORECASE)
+INSERT_PATTERN = re.compile(r"^INSERT\s+INTO\s+(\w+)", re.IGNORECASE)
+REFERENCES_PATTERN = re.compile(r"\bREFERENCES\s+(\w+)", re.IGNORECASE)
+WHITESPACE_PATTERN = re.compile(r"\s+")
+# no whitespace is needed next to punctuation
+PUNCTUATION_PATTERN = re.compile(r"\s*([(),])\s*")
+
+
+@dataclass(frozen=True)
+class SchemaProfile:
+    # None keeps everything
+    max_tables: int | None = None
+    sample_rows: int | None = None
+
+
+DIFFICULTY_PROFILES = {
+    # basic queries and simple joins only need a few related tables
+    Difficulty.EASY: SchemaProfile(max_tables=3, sample_rows=1),
+    Difficulty.MEDIUM: SchemaProfile(sample_rows=1),
+    Difficulty.HARD: SchemaProfile(sample_rows=2),
+}
+
+
+@dataclass(frozen=True)
+class PromptTokens:
+    original: int
+    compacted: int
+
+    @property
+    def saved(self) -> int:
+        return self.original - self.compacted
+
+
+def split_statements(sql: str) -> list[str]:
+    # splits at semicolons outside of string literals and drops line comments
+    statements = []
+    current = []
+    quoted = False
+    index = 0
+    while index < len(sql):
+        char = sql[index]
+        if quoted:
+            current.append(char)
+            quoted = char != "'"
+        elif char == "'":
+            current.append(char)
+            quoted = True
+        elif sql.startswith("--", index):
+            end = sql.find("\n", index)
+            index = len(sql) if end < 0 else end
+            continue
+        elif char == ";":
+            statements.append("".join(current).strip())
+            current = []
+        else:
+            current.append(char)
+        index += 1
+
+    statements.append("".join(current).strip())
+    return [statement for statement in statements if statement]
+
+
+def minify_statement(statement: str) -> str:
+    # string literals are kept as they are, everything in between is collapsed
+    parts = re.split(r"('(?:[^']|'')*')", statement)
+    for index in range(0, len(parts), 2):
+        parts[index] = PUNCTUATION_PATTERN.sub(r"\1", WHITESPACE_PATTERN.sub(" ", parts[index]))
+    return "".join(parts).strip()
+
+
+def compact_schema(sql: str, profile: SchemaProfile = SchemaProfile(), minify: bool = True) -> str:
+    statements = split_statements(sql)
+    tables: dict[str, set[str]] = {}
+    for statement in statements:
+        if match := CREATE_TABLE_PATTERN.match(statement):
+            tables[match.group(1).lower()] = {name.lower() for name in REFERENCES_PATTERN.findall(statement)}
+
+    # the first tables of the model, together with every table they reference, so the schema stays consistent
+    selected = list(tables)[:profile.max_tables] if profile.max_tables is not None else list(tables)
+    kept = set()
+    while selected:
+        table = selected.pop()
+        if table not in kept:
+            kept.add(table)
+            selected.extend(tables.get(table, ()))
+
+    rows: dict[str, int] = {}
+    compacted = []
+    for statement in statements:
+        if match := CREATE_TABLE_PATTERN.match(statement):
+            if match.group(1).lower() not in kept:
+                continue
+        elif match := INSERT_PATTERN.match(statement):
+            table = match.group(1).lower()
+            rows[table] = rows.get(table, 0) + 1
+            if table not in kept or profile.sample_rows is not None and rows[table] > profile.sample_rows:
+                continue
+
+        compacted.append(minify_statement(statement) if minify else statement)
+
+    return ";\n".join(compacted) + ";" if compacted else ""
+
+
+class PromptOptimizer:
+
+    def __init__(
+        self,
+        token_counter: TokenCounter,
+        profiles: dict[Difficulty, SchemaProfile] | None = None,
+        minify: bool = True
+    ):
+        self.token_counter = token_counter
+        self.profiles = DIFFICULTY_PROFILES if profiles is None else profiles
+        self.minify = minify
+        self._lock = threading.Lock()
+        self._schemas: dict[tuple[str, Difficulty], tuple[str, str]] = {}
+        self._tokens: dict[tuple[str, Difficulty], PromptTokens] = {}
+
+    def compact(self, db_model: str, sql: str, difficulty: Difficulty) -> str:
+        key = (db_model, difficulty)
+        with self._lock:
+            if (cached := self._schemas.get(key)) is not None and cached[0] == sql:
+                return cached[1]
+
+        schema = compact_schema(sql, self.profiles.get(difficulty, SchemaProfile()), self.minify)
+        tokens = PromptTokens(original=self.token_counter.count(sql), compacted=self.token_counter.count(schema))
+        logger.info(
+            f"compacted schema of {db_model} for {difficulty.name.lower()} quizzes "
+            f"from {tokens.original} to {tokens.compacted} tokens"
+        )
+
+        with self._lock:
+            self._schemas[key] = (sql, schema)
+            self._tokens[key] = tokens
+        return schema
+
+    def report(self) -> dict[tuple[str, Difficulty], PromptTokens]:
+        with self._lock:
+            return dict(self._tokens)
@@ -0,0 +1,127 @@
+import atexit
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HEALTH_INTERVAL = 30.0
+
+
+@dataclass
+class _Resource:
+    factory: Callable[[], Any]
+    health_check: Callable[[Any], bool] | None
+    close: Callable[[Any], None] | None
+    health_interval: float
+    # rebuilt together with any of these, as they hold on to their instances
+    depends_on: tuple[str, ...] = ()
+    instance: Any = None
+    created: bool = False
+    checked_at: float = 0.0
+
+
+class ResourceRegistry:
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._resources: dict[str, _Resource] = {}
+        self._order: list[str] = []
+
+    def register(
+        self,
+        name: str,
+        factory: Callable[[], Any],
+        health_check: Callable[[Any], bool] | None = None,
+        close: Callable[[Any], None] | None = None,
+        health_interval: float = DEFAULT_HEALTH_INTERVAL,
+        depends_on: tuple[str, ...] = ()
+    ):
+        with self._lock:
+            if name in self._resources:
+                return
+            self._resources[name] = _Resource(factory, health_check, close, health_interval, depends_on)
+
+    def get(self, name: str) -> Any:
+        resource = self._resources[name]
+        if resource.created and not self._stale(resource):
+            return resource.instance
+
+        with self._lock:
+            # an unhealthy dependency is rebuilt first, which closes this resource as well
+            for dependency in resource.depends_on:
+                self.get(dependency)
+
+            if resource.created and self._needs_check(resource):
+                resource.checked_at = time.monotonic()
+                if not self._is_healthy(name, resource):
+                    logger.warning(f"resource {name} is unhealthy, rebuilding")
+                    self._close(name, resource)
+
+            if not resource.created:
+                started = time.perf_counter()
+                resource.instance = resource.factory()
+                resource.created = True
+                resource.checked_at = time.monotonic()
+                self._order.append(name)
+                logger.info(f"created resource {name} in {(time.perf_counter() - started) * 1000:.1f}ms")
+
+            return resource.instance
+
+    def health(self) -> dict[str, bool]:
+        with self._lock:
+            return {
+                name: self._is_healthy(name, resource)
+                for name, resource in self._resources.items() if resource.created
+            }
+
+    def shutdown(self):
+        with self._lock:
+            for name in list(reversed(self._order)):
+                self._close(name, self._resources[name])
+
+    @staticmethod
+    def _needs_check(resource: _Resource) -> bool:
+        return resource.health_check is not None and time.monotonic() - resource.checked_at >= resource.health_interval
+
+    def _stale(self, resource: _Resource) -> bool:
+        # a dependency due for a health check may be rebuilt, and this resource with it
+        return self._needs_check(resource) or any(
+            self._stale(self._resources[dependency]) for dependency in resource.depends_on
+        )
+
+    @staticmethod
+    def _is_healthy(name: str, resource: _Resource) -> bool:
+        if resource.health_check is None:
+            return True
+
+        try:
+            return resource.health_check(resource.instance)
+        except Exception as e:
+            logger.error(f"health check of {name} failed: {e}")
+            return False
+
+    def _close(self, name: str, resource: _Resource):
+        if not resource.created:
+            return
+
+        for dependent_name, dependent in self._resources.items():
+            if name in dependent.depends_on and dependent.created:
+                logger.info(f"closing resource {dependent_name}, it depends on {name}")
+                self._close(dependent_name, dependent)
+
+        if resource.close is not None:
+            try:
+                resource.close(resource.instance)
+            except Exception as e:
+                logger.error(f"could not close resource {name}: {e}")
+
+        resource.instance = None
+        resource.created = False
+        self._order.remove(name)
+
+
+registry = ResourceRegistry()
+atexit.register(registry.shutdown)
@@ -0,0 +1,237 @@
+import logging
+import os
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, AsyncIterator, Iterator
+
+if TYPE_CHECKING:
+    import httpx
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASE_URL = "https://api.replicate.com"
+DEFAULT_TIMEOUTS = {"connect": 5.0, "read": 30.0, "write": 30.0, "pool": 10.0}
+DEFAULT_POOL_LIMITS = {"max_connections": 50, "max_keepalive_connections": 20, "keepalive_expiry": 120.0}
+STREAM_HEADERS = {"Accept": "text/event-stream", "Cache-Control": "no-store"}
+# consecutive transport failures after which the connection pool is taken for broken
+MAX_CONNECTION_ERRORS = 5
+
+
+class ReplicateAPIError(RuntimeError):
+
+    def __init__(self, status: int, detail: str):
+        super().__init__(f"Replicate API error {status}: {detail}")
+        # picked up by resilience.classify_error
+        self.status = status
+        self.detail = detail
+
+
+class PredictionFailed(RuntimeError):
+    pass
+
+
+@dataclass(frozen=True)
+class StreamedPrediction:
+    id: str
+    stream_url: str
+    cancel_url: str
+    # latency of the request creating the prediction
+    created_seconds: float = 0.0
+
+
+@dataclass(frozen=True)
+class ServerSentEvent:
+    event: str = "message"
+    data: str = ""
+    id: str | None = None
+
+
+class EventParser:
+    # incremental parser for text/event-stream, fed line by line
+
+    def __init__(self):
+        self._event = "message"
+        self._data: list[str] = []
+        self._id: str | None = None
+
+    def feed(self, line: str) -> ServerSentEvent | None:
+        line = line.rstrip("\r\n")
+        if not line:
+            # a blank line dispatches the event
+            if not self._data and self._event == "message":
+                return None
+            event = ServerSentEvent(event=self._event, data="\n".join(self._data), id=self._id)
+            self._event, self._data = "message", []
+            return event
+
+        if line.startswith(":"):
+            return None
+        name, _, value = line.partition(":")
+        if value.startswith(" "):
+            value = value[1:]
+        if name == "event":
+            self._event = value
+        elif name == "data":
+            self._data.append(value)
+        elif name == "id":
+            self._id = value
+        return None
+
+
+def _raise_for_status(response: "httpx.Response"):
+    if response.status_code >= 400:
+        try:
+            detail = response.json().get("detail", response.text)
+        except ValueError:
+            detail = response.text
+        raise ReplicateAPIError(response.status_code, detail)
+
+
+def _prediction(payload: dict[str, Any], created_seconds: float) -> StreamedPrediction:
+    urls = payload.get("urls") or {}
+    if not urls.get("stream"):
+        raise ReplicateAPIError(400, f"model does not support streaming, prediction {payload.get('id')}")
+    return StreamedPrediction(
+        id=payload["id"],
+        stream_url=urls["stream"],
+        cancel_url=urls["cancel"],
+        created_seconds=created_seconds
+    )
+
+
+def _output(event: ServerSentEvent) -> str | None:
+    # output events carry the next tokens, done ends the stream, error fails the prediction
+    if event.event == "output":
+        return event.data
+    if event.event == "error":
+        raise PredictionFailed(event.data)
+    return None
+
+
+class ReplicateStreamClient:
+    # creates predictions with streaming enabled and reads their server-sent events, over one pooled keep-alive
+    # HTTP connection pool per client instead of polling the prediction
+
+    def __init__(
+        self,
+        api_token: str | None = None,
+        base_url: str | None = None,
+        pool_limits: "httpx.Limits | None" = None,
+        timeout: "httpx.Timeout | None" = None
+    ):
+        import httpx
+
+        self.base_url = base_url or os.environ.get("REPLICATE_BASE_URL") or DEFAULT_BASE_URL
+        api_token = api_token or os.environ.get("REPLICATE_API_TOKEN", "")
+        self.headers = {"Authorization": f"Token {api_token}"} if api_token else {}
+        self.pool_limits = pool_limits or httpx.Limits(**DEFAULT_POOL_LIMITS)
+        self.timeout = timeout or httpx.Timeout(**DEFAULT_TIMEOUTS)
+        self._client = httpx.Client(
+            base_url=self.base_url,
+            headers=self.headers,
+            timeout=self.timeout,
+            limits=self.pool_limits
+        )
+        # bound to the event loop it is first used on, created there
+        self._async_client: httpx.AsyncClient | None = None
+        self.connection_errors = 0
+
+    def healthy(self) -> bool:
+        # error statuses are answers of a working connection, only transport failures count against the pool
+        if self._client.is_closed or (self._async_client is not None and self._async_client.is_closed):
+            return False
+        return self.connection_errors < MAX_CONNECTION_ERRORS
+
+    @contextmanager
+    def _connection(self):
+        import httpx
+
+        try:
+            yield
+        except httpx.TransportError:
+            self.connection_errors += 1
+            raise
+        self.connection_errors = 0
+
+    def _get_async_client(self) -> "httpx.AsyncClient":
+        import httpx
+
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=self.headers,
+                timeout=self.timeout,
+                limits=self.pool_limits
+            )
+        return self._async_client
+
+    @staticmethod
+    def _predictions_path(model: str) -> str:
+        # official models are addressed by name, no model version lookup is needed
+        return f"/v1/models/{model}/predictions"
+
+    def create(self, model: str, input: dict[str, Any]) -> StreamedPrediction:
+        started = time.perf_counter()
+        with self._connection():
+            response = self._client.post(self._predictions_path(model), json={"input": input, "stream": True})
+        _raise_for_status(response)
+        return _prediction(response.json(), time.perf_counter() - started)
+
+    async def acreate(self, model: str, input: dict[str, Any]) -> StreamedPrediction:
+        started = time.perf_counter()
+        with self._connection():
+            response = await self._get_async_client().post(
+                self._predictions_path(model),
+                json={"input": input, "stream": True}
+            )
+        _raise_for_status(response)
+        return _prediction(response.json(), time.perf_counter() - started)
+
+    def stream(self, prediction: StreamedPrediction) -> Iterator[str]:
+        # closing the iterator closes the response, cancel stops the generation upstream
+        parser = EventParser()
+        with self._connection(), self._client.stream("GET", prediction.stream_url, headers=STREAM_HEADERS) as response:
+            if response.status_code >= 400:
+                response.read()
+            _raise_for_status(response)
+            for line in response.iter_lines():
+                if (event := parser.feed(line)) is None:
+                    continue
+                if event.event == "done":
+                    return
+                if (output := _output(event)) is not None:
+                    yield output
+
+    async def astream(self, prediction: StreamedPrediction) -> AsyncIterator[str]:
+        parser = EventParser()
+        client = self._get_async_client()
+        with self._connection():
+            async with client.stream("GET", prediction.stream_url, headers=STREAM_HEADERS) as response:
+                if response.status_code >= 400:
+                    await response.aread()
+                _raise_for_status(response)
+                async for line in response.aiter_lines():
+                    if (event := parser.feed(line)) is None:
+                        continue
+                    if event.event == "done":
+                        return
+                    if (output := _output(event)) is not None:
+                        yield output
+
+    def cancel(self, prediction: StreamedPrediction):
+        with self._connection():
+            response = self._client.post(prediction.cancel_url)
+        _raise_for_status(response)
+
+    async def acancel(self, prediction: StreamedPrediction):
+        with self._connection():
+            response = await self._get_async_client().post(prediction.cancel_url)
+        _raise_for_status(response)
+
+    def close(self):
+        self._client.close()
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
@@ -0,0 +1,299 @@
+import asyncio
+import inspect
+import logging
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from enum import Enum
+from functools import wraps
+from typing import Awaitable, Callable
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+TRANSIENT_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+
+
+class ErrorKind(Enum):
+    PARSE = "parse"
+    TRANSIENT = "transient"
+    FATAL = "fatal"
+
+
+class CircuitState(Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class Overloaded(RuntimeError):
+
+    def __init__(self, message: str, name: str, retry_after: float):
+        super().__init__(message)
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(Overloaded):
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"circuit {name} is open, retry in {retry_after:.0f}s", name, retry_after)
+
+
+def _status_code(e: Exception) -> int | None:
+    for candidate in (getattr(e, "status", None), getattr(e, "code", None), getattr(e, "status_code", None)):
+        if isinstance(candidate, int):
+            return candidate
+
+    if (response := getattr(e, "response", None)) is not None:
+        status_code = getattr(response, "status_code", None)
+        if isinstance(status_code, int):
+            return status_code
+
+    return None
+
+
+def classify_error(e: Exception) -> ErrorKind:
+    # pydantic ValidationError, JSONDecodeError and JsonStreamError are all ValueErrors
+    if isinstance(e, ValueError):
+        return ErrorKind.PARSE
+
+    if (status_code := _status_code(e)) is not None:
+        if status_code in TRANSIENT_STATUS_CODES or status_code >= 500:
+            return ErrorKind.TRANSIENT
+        if 400 <= status_code < 500:
+            return ErrorKind.FATAL
+
+    # network failures and unknown errors (e.g. failed predictions) are worth another attempt
+    return ErrorKind.TRANSIENT
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    max_attempts: int = 4
+    base_delay: float = 0.5
+    max_delay: float = 10.0
+    multiplier: float = 2.0
+    parse_delay: float = 0.1
+
+    def delay(self, attempt: int, kind: ErrorKind) -> float:
+        if kind == ErrorKind.PARSE:
+            # malformed replies are not caused by upstream load, retry almost immediately
+            return self.parse_delay
+
+        # full jitter: uniform between zero and the exponential backoff cap
+        backoff = min(self.max_delay, self.base_delay * self.multiplier ** attempt)
+        return random.uniform(0, backoff)
+
+
+class RetryBudget:
+
+    def __init__(self, ratio: float = 0.2, min_per_second: float = 1.0, max_tokens: float = 20.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+
+        self._lock = threading.Lock()
+        self._tokens = max_tokens
+        self._updated = time.monotonic()
+        self.exhausted = 0
+
+    def record_request(self):
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+
+            self.exhausted += 1
+            return False
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.max_tokens, self._tokens + (now - self._updated) * self.min_per_second)
+        self._updated = now
+
+
+class CircuitBreaker:
+
+    def __init__(
+        self,
+        name: str,
+        failure_rate: float = 0.5,
+        window: int = 20,
+        min_calls: int = 5,
+        open_duration: float = 30.0
+    ):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.open_duration = open_duration
+
+        self._lock = threading.Lock()
+        self._outcomes: deque[bool] = deque(maxlen=window)
+        self._state = CircuitState.CLOSED
+        self._opened_at = 0.0
+        self._probing = False
+        self.rejected = 0
+
+    @property
+    def state(self) -> CircuitState:
+        with self._lock:
+            self._update_state()
+            return self._state
+
+    def allow(self):
+        with self._lock:
+            self._update_state()
+
+            if self._state == CircuitState.CLOSED:
+                return
+            if self._state == CircuitState.HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+
+            self.rejected += 1
+            retry_after = max(0.0, self._opened_at + self.open_duration - time.monotonic())
+            raise CircuitOpenError(self.name, retry_after)
+
+    def record_success(self):
+        with self._lock:
+            if self._state == CircuitState.HALF_OPEN:
+                logger.info(f"circuit {self.name} closed")
+                self._state = CircuitState.CLOSED
+                self._outcomes.clear()
+            self._probing = False
+            self._outcomes.append(True)
+
+    def record_failure(self):
+        with self._lock:
+            self._probing = False
+            if self._state == CircuitState.HALF_OPEN:
+                self._open()
+                return
+
+            self._outcomes.append(False)
+            failures = self._outcomes.count(False)
+            if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.failure_rate:
+                self._open()
+
+    @contextmanager
+    def guard(self, classify: Callable[[Exception], ErrorKind] = classify_error):
+        self.allow()
+        try:
+            yield
+        except Overloaded:
+            # the call never reached the upstream service
+            with self._lock:
+                self._probing = False
+            raise
+        except Exception as e:
+            # parse failures say nothing about the health of the upstream service
+            if classify(e) == ErrorKind.PARSE:
+                self.record_success()
+            else:
+                self.record_failure()
+            raise
+        except BaseException:
+            # a cancelled call says nothing either, but must not keep a half-open probe forever
+            with self._lock:
+                self._probing = False
+            raise
+        else:
+            self.record_success()
+
+    def _open(self):
+        logger.warning(f"circuit {self.name} opened")
+        self._state = CircuitState.OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+
+    def _update_state(self):
+        if self._state == CircuitState.OPEN and time.monotonic() - self._opened_at >= self.open_duration:
+            self._state = CircuitState.HALF_OPEN
+            self._probing = False
+
+
+retry_budget = RetryBudget()
+
+
+def resilient(
+    policy: RetryPolicy,
+    breaker: CircuitBreaker | None = None,
+    budget: RetryBudget | None = retry_budget,
+    classify: Callable[[Exception], ErrorKind] = classify_error,
+    sleep: Callable[[float], None] = time.sleep,
+    async_sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+    retry_on: tuple[type[Exception], ...] = (Exception,)
+) -> callable:
+    def decorator(func) -> callable:
+        def retry_delay(e: Exception, attempt: int) -> float | None:
+            # other errors are left to the callee, e.g. when it already retries them itself
+            if not isinstance(e, retry_on):
+                return None
+
+            kind = classify(e)
+            logger.error(f"{kind.value} error in {func.__name__}: {e}")
+
+            if kind == ErrorKind.FATAL or attempt == policy.max_attempts - 1:
+                return None
+            if budget is not None and not budget.try_acquire():
+                logger.warning(f"retry budget exhausted, not retrying {func.__name__}")
+                return None
+
+            delay = policy.delay(attempt, kind)
+            metrics.increment("retries", function=func.__name__, kind=kind.value)
+            logger.warning(f"retrying {func.__name__} in {delay:.2f}s...")
+            return delay
+
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if budget is not None:
+                    budget.record_request()
+
+                for attempt in range(policy.max_attempts):
+                    try:
+                        if breaker is None:
+                            return await func(*args, **kwargs)
+                        with breaker.guard(classify):
+                            return await func(*args, **kwargs)
+                    except Overloaded:
+                        raise
+                    except Exception as e:
+                        if (delay := retry_delay(e, attempt)) is None:
+                            raise
+                    await async_sleep(delay)
+
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if budget is not None:
+                budget.record_request()
+
+            for attempt in range(policy.max_attempts):
+                try:
+                    if breaker is None:
+                        return func(*args, **kwargs)
+                    with breaker.guard(classify):
+                        return func(*args, **kwargs)
+                except Overloaded:
+                    raise
+                except Exception as e:
+                    if (delay := retry_delay(e, attempt)) is None:
+                        raise
+                sleep(delay)
+
+        return wrapper
+
+    return decorator
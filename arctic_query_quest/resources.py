@@ -0,0 +1,330 @@
+import streamlit as st
+
+from arctic import DEFAULT_MAX_NEW_TOKENS, ArcticClient, quiz_reply_tokens, replicate_admission, replicate_breaker
+from assets import assets
+from attempts import AttemptRegistry
+from audio_cache import AudioCache
+from common import MODEL_FILES, load_model
+from corpus import QuizCorpus
+from generator import QuizGenerator
+from hedging import Hedger
+from metrics import metrics
+from pool import QuizPool
+from prompt import PromptGenerator
+from prompt_optimizer import PromptOptimizer
+from registry import registry
+from resilience import CircuitState
+from session_store import session_store
+from shared_cache import DEFAULT_TTL, CacheBackend, SharedCache, create_backend
+from tokens import ARCTIC_TOKENIZER, OutputBudget, TokenCounter
+from tts import SpeechClient, tts_admission, tts_breaker
+from verifier import QuizVerifier
+
+PROMPT_GENERATOR = "prompt_generator"
+AUDIO_CACHE = "audio_cache"
+HEDGER = "hedger"
+ARCTIC_CLIENT = "arctic_client"
+TTS_CLIENT = "tts_client"
+QUIZ_GENERATOR = "quiz_generator"
+QUIZ_POOL = "quiz_pool"
+QUIZ_VERIFIER = "quiz_verifier"
+QUIZ_CORPUS = "quiz_corpus"
+TOKEN_COUNTER = "token_counter"
+PROMPT_OPTIMIZER = "prompt_optimizer"
+QUIZ_ATTEMPTS = "quiz_attempts"
+CACHE_BACKEND = "cache_backend"
+
+# entries of the shared cache expire per namespace, sampled quiz replies are never cached, only their prompts and audio
+SHARED_CACHE_TTLS = {"audio": DEFAULT_TTL, "prompt": DEFAULT_TTL}
+shared_caches: dict[str, SharedCache] = {}
+
+
+def create_cache_backend() -> CacheBackend:
+    # memory keeps caching per replica, "sqlite" shares it on one host, "redis" across hosts
+    cache_config = {
+        key: value for key, value in st.secrets.get("shared_cache", {}).items() if key != "ttl"
+    }
+    return create_backend(**cache_config)
+
+
+def create_shared_cache(namespace: str) -> SharedCache:
+    ttl = st.secrets.get("shared_cache", {}).get("ttl", {}).get(namespace, SHARED_CACHE_TTLS[namespace])
+    shared_caches[namespace] = SharedCache(registry.get(CACHE_BACKEND), namespace, ttl=ttl)
+    return shared_caches[namespace]
+
+
+def create_prompt_generator() -> PromptGenerator:
+    assets.preload()
+    if st.secrets.get("assets", {}).get("hot_reload", False):
+        assets.watch()
+
+    prompt_generator = PromptGenerator(assets, cache=create_shared_cache("prompt"))
+    prompt_generator.warm_up([load_model(model) for model in MODEL_FILES])
+    return prompt_generator
+
+
+def create_hedger() -> Hedger | None:
+    hedging_config = dict(st.secrets.get("hedging", {}))
+    if not hedging_config.pop("enabled", False):
+        return None
+
+    hedger = Hedger(**hedging_config)
+
+    def collect() -> dict[str, float]:
+        stats = hedger.stats()
+        return {
+            "requests": stats.requests,
+            "hedges_fired": stats.hedges_fired,
+            "hedges_won": stats.hedges_won,
+            "threshold_seconds": stats.threshold
+        }
+
+    metrics.register_gauge("hedging", collect)
+    return hedger
+
+
+def create_token_counter() -> TokenCounter:
+    token_config = st.secrets.get("tokens", {})
+    return TokenCounter(
+        tokenizer_name=token_config.get("tokenizer", ARCTIC_TOKENIZER),
+        local_files_only=token_config.get("local_files_only", True)
+    )
+
+
+def create_prompt_optimizer() -> PromptOptimizer | None:
+    optimizer_config = dict(st.secrets.get("prompt_optimizer", {}))
+    if not optimizer_config.pop("enabled", True):
+        return None
+
+    prompt_optimizer = PromptOptimizer(registry.get(TOKEN_COUNTER), **optimizer_config)
+
+    def collect() -> dict[str, float]:
+        values = {}
+        for (model, difficulty), tokens in prompt_optimizer.report().items():
+            values[f"{model}/{difficulty.name.lower()}/original"] = tokens.original
+            values[f"{model}/{difficulty.name.lower()}/compacted"] = tokens.compacted
+        return values
+
+    metrics.register_gauge("schema_tokens", collect)
+    return prompt_optimizer
+
+
+def create_arctic_client() -> ArcticClient:
+    replicate_admission.configure(**st.secrets.get("admission", {}).get("replicate", {}))
+    token_counter: TokenCounter = registry.get(TOKEN_COUNTER)
+    token_config = st.secrets.get("tokens", {})
+    max_new_tokens = token_config.get("max_new_tokens", DEFAULT_MAX_NEW_TOKENS)
+
+    output_budget = None
+    if token_config.get("dynamic_max_new_tokens", True):
+        output_budget = OutputBudget(quiz_reply_tokens(token_counter), ceiling=max_new_tokens)
+        metrics.register_gauge("output_budget", lambda: {
+            "tokens_per_quiz": output_budget.per_quiz(),
+            "truncations": output_budget.truncations
+        })
+
+    return ArcticClient(
+        max_new_tokens=max_new_tokens,
+        hedger=registry.get(HEDGER),
+        token_counter=token_counter,
+        output_budget=output_budget
+    )
+
+
+def create_tts_client() -> SpeechClient:
+    tts_admission.configure(**st.secrets.get("admission", {}).get("tts", {}))
+    return SpeechClient(
+        st.secrets.gcp.project_id,
+        st.secrets.gcp.private_key_id,
+        st.secrets.gcp.private_key,
+        st.secrets.gcp.client_email,
+        st.secrets.gcp.client_id,
+        st.secrets.gcp.client_x509_cert_url,
+        cache=registry.get(AUDIO_CACHE),
+        shared_cache=create_shared_cache("audio")
+    )
+
+
+def create_quiz_verifier() -> QuizVerifier | None:
+    verifier_config = dict(st.secrets.get("verifier", {}))
+    if not verifier_config.pop("enabled", True):
+        return None
+
+    verifier = QuizVerifier({model: load_model(model) for model in MODEL_FILES}, **verifier_config)
+    metrics.register_gauge("verifier", lambda: {"checked": verifier.checked, "rejected": verifier.rejected})
+    return verifier
+
+
+def create_quiz_generator() -> QuizGenerator:
+    return QuizGenerator(
+        registry.get(PROMPT_GENERATOR),
+        registry.get(ARCTIC_CLIENT),
+        registry.get(TTS_CLIENT),
+        verifier=registry.get(QUIZ_VERIFIER),
+        prompt_optimizer=registry.get(PROMPT_OPTIMIZER)
+    )
+
+
+def create_quiz_pool() -> QuizPool:
+    quiz_generator: QuizGenerator = registry.get(QUIZ_GENERATOR)
+    pool_config = st.secrets.get("quiz_pool", {})
+    if pool_config.get("async_refill", False):
+        # several independent generations in flight on the event loop instead of one batch prompt
+        batch_producer = quiz_generator.generate_many
+    elif pool_config.get("batch", True):
+        batch_producer = quiz_generator.generate_batch
+    else:
+        batch_producer = None
+
+    quiz_pool = QuizPool(
+        quiz_generator.generate,
+        low_watermark=pool_config.get("low_watermark", 1),
+        high_watermark=pool_config.get("high_watermark", 3),
+        batch_producer=batch_producer
+    )
+    quiz_pool.start()
+
+    def collect() -> dict[str, float]:
+        stats = quiz_pool.stats()
+        return {
+            "hits": stats.hits,
+            "misses": stats.misses,
+            "refills": stats.refills,
+            "refill_errors": stats.refill_errors,
+            "last_refill_lag_seconds": stats.last_refill_lag,
+            "max_refill_lag_seconds": stats.max_refill_lag
+        }
+
+    metrics.register_gauge("quiz_pool", collect)
+    return quiz_pool
+
+
+def create_audio_cache() -> AudioCache:
+    audio_cache = AudioCache(**st.secrets.get("audio_cache", {}))
+
+    def collect() -> dict[str, float]:
+        stats = audio_cache.stats()
+        return {
+            "hit_ratio": stats.hit_ratio,
+            "bytes_stored": stats.bytes_stored,
+            "entries": stats.entries,
+            "evictions": stats.evictions
+        }
+
+    metrics.register_gauge("audio_cache", collect)
+    return audio_cache
+
+
+def create_quiz_corpus() -> QuizCorpus:
+    corpus = QuizCorpus(**st.secrets.get("corpus", {}))
+
+    def collect() -> dict[str, float]:
+        stats = corpus.stats()
+        return {
+            "entries": stats.entries,
+            "inserts": stats.inserts,
+            "duplicates": stats.duplicates,
+            "samples": stats.samples,
+            "exhausted": stats.exhausted
+        }
+
+    metrics.register_gauge("corpus", collect)
+    return corpus
+
+
+def create_quiz_attempts() -> AttemptRegistry:
+    attempts = AttemptRegistry(**st.secrets.get("attempts", {}))
+
+    def collect() -> dict[str, float]:
+        stats = attempts.stats()
+        return {
+            "started": stats.started,
+            "reused": stats.reused,
+            "calls_saved": stats.calls_saved,
+            "active": stats.active
+        }
+
+    metrics.register_gauge("attempts", collect)
+    return attempts
+
+
+def register_resources():
+    registry.register(CACHE_BACKEND, create_cache_backend, close=lambda backend: backend.close())
+    registry.register(PROMPT_GENERATOR, create_prompt_generator)
+    registry.register(AUDIO_CACHE, create_audio_cache)
+    registry.register(HEDGER, create_hedger)
+    registry.register(TOKEN_COUNTER, create_token_counter)
+    registry.register(PROMPT_OPTIMIZER, create_prompt_optimizer)
+    registry.register(
+        ARCTIC_CLIENT,
+        create_arctic_client,
+        health_check=ArcticClient.healthy,
+        close=ArcticClient.close
+    )
+    registry.register(TTS_CLIENT, create_tts_client, health_check=SpeechClient.healthy, close=SpeechClient.close)
+    registry.register(
+        QUIZ_VERIFIER,
+        create_quiz_verifier,
+        close=lambda verifier: verifier.close() if verifier is not None else None
+    )
+    registry.register(
+        QUIZ_GENERATOR,
+        create_quiz_generator,
+        depends_on=(PROMPT_GENERATOR, ARCTIC_CLIENT, TTS_CLIENT, QUIZ_VERIFIER, PROMPT_OPTIMIZER)
+    )
+    registry.register(QUIZ_POOL, create_quiz_pool, close=QuizPool.stop, depends_on=(QUIZ_GENERATOR,))
+    registry.register(QUIZ_CORPUS, create_quiz_corpus, close=QuizCorpus.close)
+    registry.register(QUIZ_ATTEMPTS, create_quiz_attempts, close=AttemptRegistry.shutdown)
+
+    session_store.configure(**st.secrets.get("session_store", {}))
+
+    def collect_session_store() -> dict[str, float]:
+        stats = session_store.stats()
+        return {
+            "sessions": stats.sessions,
+            "session_bytes": stats.session_bytes,
+            "resident_bytes": stats.resident_bytes,
+            "deduplicated_bytes": stats.deduplicated_bytes,
+            "audio_entries": stats.audio_entries,
+            "evicted_sessions": stats.evicted_sessions,
+            "evicted_audio": stats.evicted_audio
+        }
+
+    metrics.register_gauge("session_store", collect_session_store)
+
+    metrics.register_gauge("circuit_open", lambda: {
+        breaker.name: float(breaker.state != CircuitState.CLOSED) for breaker in (replicate_breaker, tts_breaker)
+    })
+
+    def collect_admission() -> dict[str, float]:
+        values = {}
+        for admission in (replicate_admission, tts_admission):
+            stats = admission.stats()
+            values.update({
+                f"{admission.name}/queued": stats.queued,
+                f"{admission.name}/in_flight": stats.in_flight,
+                f"{admission.name}/admitted": stats.admitted,
+                f"{admission.name}/shed": stats.shed,
+                f"{admission.name}/timed_out": stats.timed_out
+            })
+        return values
+
+    metrics.register_gauge("admission", collect_admission)
+
+    def collect_shared_cache() -> dict[str, float]:
+        values = {}
+        for namespace, shared_cache in list(shared_caches.items()):
+            stats = shared_cache.stats()
+            values.update({
+                f"{namespace}/hit_ratio": stats.hit_ratio,
+                f"{namespace}/computed": stats.computed,
+                f"{namespace}/coalesced": stats.coalesced,
+                f"{namespace}/shared": stats.shared,
+                f"{namespace}/errors": stats.errors
+            })
+        return values
+
+    metrics.register_gauge("shared_cache", collect_shared_cache)
+
+
+register_resources()
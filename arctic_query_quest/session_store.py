@@ -0,0 +1,256 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable
+
+from arctic import ArcticQuiz
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_SESSION_BYTES = 2 * 1024 * 1024
+DEFAULT_MAX_TOTAL_BYTES = 256 * 1024 * 1024
+DEFAULT_IDLE_TTL = 1800.0
+QUESTION_AUDIO = "question"
+ANSWERS_AUDIO = "answers"
+EXPLANATION_AUDIO = "explanation"
+
+
+@dataclass(frozen=True)
+class AudioRef:
+    digest: str
+    size: int
+
+
+class AudioStore:
+    # audio shared by all sessions, equal payloads are kept once and dropped with their last reference
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._payloads: dict[str, bytes] = {}
+        self._references: dict[str, int] = {}
+        self.bytes = 0
+
+    def acquire(self, data: bytes) -> AudioRef:
+        digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+        with self._lock:
+            if digest not in self._payloads:
+                self._payloads[digest] = data
+                self._references[digest] = 0
+                self.bytes += len(data)
+            self._references[digest] += 1
+        return AudioRef(digest, len(data))
+
+    def get(self, ref: AudioRef) -> bytes | None:
+        with self._lock:
+            return self._payloads.get(ref.digest)
+
+    def release(self, ref: AudioRef):
+        with self._lock:
+            if ref.digest not in self._references:
+                return
+            self._references[ref.digest] -= 1
+            if self._references[ref.digest] <= 0:
+                del self._references[ref.digest]
+                self.bytes -= len(self._payloads.pop(ref.digest))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._payloads)
+
+
+@dataclass
+class _Session:
+    last_seen: float
+    quiz: ArcticQuiz | None = None
+    quiz_bytes: int = 0
+    # oldest first, evicted first when the session is over its limit
+    audio: OrderedDict[str, AudioRef] = field(default_factory=OrderedDict)
+
+    @property
+    def bytes(self) -> int:
+        return self.quiz_bytes + sum(ref.size for ref in self.audio.values())
+
+
+@dataclass
+class SessionStoreStats:
+    sessions: int = 0
+    # per session, shared audio counted for every session referencing it
+    session_bytes: int = 0
+    # actually held, shared audio counted once
+    resident_bytes: int = 0
+    audio_entries: int = 0
+    evicted_sessions: int = 0
+    evicted_audio: int = 0
+
+    @property
+    def deduplicated_bytes(self) -> int:
+        return self.session_bytes - self.resident_bytes
+
+
+class SessionStore:
+    # quiz and audio of each session, outside of the session state, bounded per session and in total
+
+    def __init__(
+        self,
+        max_session_bytes: int = DEFAULT_MAX_SESSION_BYTES,
+        max_total_bytes: int = DEFAULT_MAX_TOTAL_BYTES,
+        idle_ttl: float = DEFAULT_IDLE_TTL,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.max_session_bytes = max_session_bytes
+        self.max_total_bytes = max_total_bytes
+        self.idle_ttl = idle_ttl
+        self.audio_store = AudioStore()
+        self._clock = clock
+        self._lock = threading.Lock()
+        # least recently seen first
+        self._sessions: OrderedDict[str, _Session] = OrderedDict()
+        self._quiz_bytes = 0
+        self._evicted_sessions = 0
+        self._evicted_audio = 0
+
+    def configure(
+        self,
+        max_session_bytes: int | None = None,
+        max_total_bytes: int | None = None,
+        idle_ttl: float | None = None
+    ):
+        with self._lock:
+            if max_session_bytes is not None:
+                self.max_session_bytes = max_session_bytes
+            if max_total_bytes is not None:
+                self.max_total_bytes = max_total_bytes
+            if idle_ttl is not None:
+                self.idle_ttl = idle_ttl
+            self._evict_stale()
+            self._enforce_total(None)
+
+    def set_quiz(self, session_id: str, quiz: ArcticQuiz):
+        with self._lock:
+            session = self._session(session_id)
+            if session.quiz == quiz:
+                return
+            # a new quiz, the audio of the previous one is not shown anymore
+            self._release_audio(session)
+            self._quiz_bytes -= session.quiz_bytes
+            session.quiz = quiz
+            session.quiz_bytes = len(quiz.model_dump_json())
+            self._quiz_bytes += session.quiz_bytes
+            self._enforce_total(session_id)
+
+    def quiz(self, session_id: str) -> ArcticQuiz | None:
+        with self._lock:
+            if (session := self._get(session_id)) is None:
+                return None
+            return session.quiz
+
+    def set_audio(self, session_id: str, name: str, data: bytes, quiz: ArcticQuiz | None = None) -> bool:
+        ref = self.audio_store.acquire(data)
+        with self._lock:
+            session = self._session(session_id) if quiz is None else self._get(session_id)
+            if session is None or (quiz is not None and session.quiz != quiz):
+                # synthesized for a quiz the session does not show anymore
+                self.audio_store.release(ref)
+                return False
+            if (previous := session.audio.pop(name, None)) is not None:
+                self.audio_store.release(previous)
+            session.audio[name] = ref
+            while session.bytes > self.max_session_bytes and session.audio:
+                self._evict_audio(session)
+            self._enforce_total(session_id)
+        return True
+
+    def audio(self, session_id: str, name: str) -> bytes | None:
+        with self._lock:
+            if (session := self._get(session_id)) is None or (ref := session.audio.get(name)) is None:
+                return None
+        return self.audio_store.get(ref)
+
+    def session_bytes(self, session_id: str) -> int:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            return session.bytes if session is not None else 0
+
+    def drop(self, session_id: str):
+        with self._lock:
+            if (session := self._sessions.pop(session_id, None)) is not None:
+                self._discard(session)
+
+    def evict_stale(self) -> int:
+        with self._lock:
+            return self._evict_stale()
+
+    def stats(self) -> SessionStoreStats:
+        with self._lock:
+            return SessionStoreStats(
+                sessions=len(self._sessions),
+                session_bytes=sum(session.bytes for session in self._sessions.values()),
+                resident_bytes=self._quiz_bytes + self.audio_store.bytes,
+                audio_entries=len(self.audio_store),
+                evicted_sessions=self._evicted_sessions,
+                evicted_audio=self._evicted_audio
+            )
+
+    def _get(self, session_id: str) -> _Session | None:
+        self._evict_stale()
+        if (session := self._sessions.get(session_id)) is not None:
+            session.last_seen = self._clock()
+            self._sessions.move_to_end(session_id)
+        return session
+
+    def _session(self, session_id: str) -> _Session:
+        if (session := self._get(session_id)) is None:
+            session = self._sessions[session_id] = _Session(last_seen=self._clock())
+        return session
+
+    def _evict_stale(self) -> int:
+        # disconnected sessions are never told apart from idle ones, both are dropped after idle_ttl
+        now = self._clock()
+        evicted = 0
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.last_seen <= self.idle_ttl:
+                break
+            del self._sessions[session_id]
+            self._discard(session)
+            evicted += 1
+
+        if evicted:
+            self._evicted_sessions += evicted
+            logger.info(f"evicted {evicted} stale sessions")
+        return evicted
+
+    def _enforce_total(self, current: str | None):
+        # audio of the least recently seen sessions goes first, then these sessions as a whole
+        for session_id in list(self._sessions):
+            if self._quiz_bytes + self.audio_store.bytes <= self.max_total_bytes:
+                return
+            session = self._sessions[session_id]
+            while session.audio and self._quiz_bytes + self.audio_store.bytes > self.max_total_bytes:
+                self._evict_audio(session)
+
+        for session_id in list(self._sessions):
+            if self._quiz_bytes + self.audio_store.bytes <= self.max_total_bytes:
+                return
+            if session_id != current:
+                self._discard(self._sessions.pop(session_id))
+                self._evicted_sessions += 1
+
+    def _evict_audio(self, session: _Session):
+        _, ref = session.audio.popitem(last=False)
+        self.audio_store.release(ref)
+        self._evicted_audio += 1
+
+    def _release_audio(self, session: _Session):
+        while session.audio:
+            self.audio_store.release(session.audio.popitem()[1])
+
+    def _discard(self, session: _Session):
+        self._release_audio(session)
+        self._quiz_bytes -= session.quiz_bytes
+
+
+session_store = SessionStore()
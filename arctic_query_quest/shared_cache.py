@@ -0,0 +1,513 @@
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Awaitable, Callable
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 24 * 60 * 60.0
+# a replica computing a value holds a lease, others wait for its result until the lease runs out
+DEFAULT_LEASE_TTL = 60.0
+DEFAULT_WAIT_INTERVAL = 0.05
+DEFAULT_MEMORY_MAX_BYTES = 32 * 1024 * 1024
+DEFAULT_SQLITE_PATH = ".cache/shared.sqlite"
+DEFAULT_SQLITE_MAX_BYTES = 512 * 1024 * 1024
+DEFAULT_KEY_PREFIX = "arctic-query-quest:"
+DEFAULT_MAX_VALUE_BYTES = 4 * 1024 * 1024
+LEASE_PREFIX = "lease:"
+# deletes a key only while it still holds the given value, atomically on the server
+COMPARE_AND_DELETE_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("DEL", KEYS[1])
+end
+return 0
+"""
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entry (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    expires_at REAL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entry_accessed_at ON entry (accessed_at);
+"""
+
+
+class CacheBackend(ABC):
+    # values are bytes, a ttl of None keeps an entry until it is evicted
+
+    @abstractmethod
+    def get(self, key: str) -> bytes | None:
+        pass
+
+    @abstractmethod
+    def set(self, key: str, value: bytes, ttl: float | None = None):
+        pass
+
+    @abstractmethod
+    def add(self, key: str, value: bytes, ttl: float | None = None) -> bool:
+        # stores the value only if the key is absent, returns whether it was stored
+        pass
+
+    @abstractmethod
+    def delete(self, key: str):
+        pass
+
+    @abstractmethod
+    def delete_if(self, key: str, value: bytes) -> bool:
+        # deletes the key only if it holds the value, in one atomic step, returns whether it was deleted
+        pass
+
+    def close(self):
+        pass
+
+
+class MemoryBackend(CacheBackend):
+    # per process, least recently used entries are evicted beyond max_bytes
+
+    def __init__(self, max_bytes: int = DEFAULT_MEMORY_MAX_BYTES, clock: Callable[[], float] = time.monotonic):
+        self.max_bytes = max_bytes
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, tuple[bytes, float | None]] = OrderedDict()
+        self._bytes = 0
+
+    def _live(self, key: str) -> bytes | None:
+        if (entry := self._entries.get(key)) is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= self._clock():
+            self._remove(key)
+            return None
+        return value
+
+    def _remove(self, key: str):
+        if (entry := self._entries.pop(key, None)) is not None:
+            self._bytes -= len(entry[0])
+
+    def _store(self, key: str, value: bytes, ttl: float | None):
+        self._remove(key)
+        if len(value) > self.max_bytes:
+            return
+        self._entries[key] = (value, self._clock() + ttl if ttl is not None else None)
+        self._bytes += len(value)
+        while self._bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            if (value := self._live(key)) is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes, ttl: float | None = None):
+        with self._lock:
+            self._store(key, value, ttl)
+
+    def add(self, key: str, value: bytes, ttl: float | None = None) -> bool:
+        with self._lock:
+            if self._live(key) is not None:
+                return False
+            self._store(key, value, ttl)
+            return True
+
+    def delete(self, key: str):
+        with self._lock:
+            self._remove(key)
+
+    def delete_if(self, key: str, value: bytes) -> bool:
+        with self._lock:
+            if self._live(key) != value:
+                return False
+            self._remove(key)
+            return True
+
+
+class SQLiteBackend(CacheBackend):
+    # shared by all processes on one host, WAL lets readers proceed while another process writes
+
+    def __init__(
+        self,
+        path: str = DEFAULT_SQLITE_PATH,
+        max_bytes: int = DEFAULT_SQLITE_MAX_BYTES,
+        busy_timeout: float = 5.0,
+        clock: Callable[[], float] = time.time
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._clock = clock
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=busy_timeout, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode = WAL")
+        self._connection.execute("PRAGMA synchronous = NORMAL")
+        self._connection.executescript(SQLITE_SCHEMA)
+
+    def get(self, key: str) -> bytes | None:
+        now = self._clock()
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT value FROM entry WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)", (key, now)
+            ).fetchone()
+            if row is not None:
+                self._connection.execute("UPDATE entry SET accessed_at = ? WHERE key = ?", (now, key))
+        return row[0] if row is not None else None
+
+    def set(self, key: str, value: bytes, ttl: float | None = None):
+        now = self._clock()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO entry (key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now + ttl if ttl is not None else None, now)
+            )
+            self._evict(now)
+
+    def add(self, key: str, value: bytes, ttl: float | None = None) -> bool:
+        now = self._clock()
+        with self._lock, self._connection:
+            # an expired entry counts as absent
+            cursor = self._connection.execute(
+                "INSERT INTO entry (key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET value = excluded.value, size = excluded.size, "
+                "expires_at = excluded.expires_at, accessed_at = excluded.accessed_at "
+                "WHERE entry.expires_at IS NOT NULL AND entry.expires_at <= ?",
+                (key, value, len(value), now + ttl if ttl is not None else None, now, now)
+            )
+            return cursor.rowcount == 1
+
+    def delete(self, key: str):
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM entry WHERE key = ?", (key,))
+
+    def delete_if(self, key: str, value: bytes) -> bool:
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                "DELETE FROM entry WHERE key = ? AND value = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (key, value, self._clock())
+            )
+            return cursor.rowcount == 1
+
+    def _evict(self, now: float):
+        self._connection.execute("DELETE FROM entry WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+        (stored,) = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM entry").fetchone()
+        if stored <= self.max_bytes:
+            return
+
+        # least recently used first, until the store is back under its limit
+        excess = stored - self.max_bytes
+        evicted = []
+        for key, size in self._connection.execute("SELECT key, size FROM entry ORDER BY accessed_at"):
+            evicted.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        self._connection.executemany("DELETE FROM entry WHERE key = ?", evicted)
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class LocalKeyValueStore:
+    # in-process stand-in for a Redis server, implements the subset of the client API the cache uses
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._values: dict[str, tuple[bytes, float | None]] = {}
+
+    def get(self, name: str) -> bytes | None:
+        with self._lock:
+            if (entry := self._values.get(name)) is None:
+                return None
+            if entry[1] is not None and entry[1] <= self._clock():
+                del self._values[name]
+                return None
+            return entry[0]
+
+    def set(self, name: str, value: bytes, px: int | None = None, nx: bool = False) -> bool | None:
+        with self._lock:
+            entry = self._values.get(name)
+            if nx and entry is not None and (entry[1] is None or entry[1] > self._clock()):
+                return None
+            self._values[name] = (value, self._clock() + px / 1000 if px is not None else None)
+            return True
+
+    def delete(self, *names: str) -> int:
+        with self._lock:
+            return sum(self._values.pop(name, None) is not None for name in names)
+
+    def eval(self, script: str, numkeys: int, *keys_and_args: Any) -> int:
+        # only the compare-and-delete script of the cache is understood
+        if script != COMPARE_AND_DELETE_SCRIPT or numkeys != 1:
+            raise NotImplementedError("the local key-value store only runs the compare-and-delete script")
+        name, value = keys_and_args
+        with self._lock:
+            if (entry := self._values.get(name)) is None or entry[0] != value:
+                return 0
+            del self._values[name]
+            return 0 if entry[1] is not None and entry[1] <= self._clock() else 1
+
+    def close(self):
+        pass
+
+
+class KeyValueBackend(CacheBackend):
+    # networked store shared by all replicas, size limits and eviction are left to the server (maxmemory policy)
+
+    def __init__(self, client: Any, prefix: str = DEFAULT_KEY_PREFIX, max_value_bytes: int = DEFAULT_MAX_VALUE_BYTES):
+        self.client = client
+        self.prefix = prefix
+        self.max_value_bytes = max_value_bytes
+
+    @classmethod
+    def from_url(cls, url: str, **options) -> "KeyValueBackend":
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("the redis cache backend requires the redis extra: poetry install --extras redis") from e
+        return cls(redis.Redis.from_url(url), **options)
+
+    @staticmethod
+    def _milliseconds(ttl: float | None) -> int | None:
+        return max(1, int(ttl * 1000)) if ttl is not None else None
+
+    def get(self, key: str) -> bytes | None:
+        return self.client.get(self.prefix + key)
+
+    def set(self, key: str, value: bytes, ttl: float | None = None):
+        if len(value) <= self.max_value_bytes:
+            self.client.set(self.prefix + key, value, px=self._milliseconds(ttl))
+
+    def add(self, key: str, value: bytes, ttl: float | None = None) -> bool:
+        return bool(self.client.set(self.prefix + key, value, px=self._milliseconds(ttl), nx=True))
+
+    def delete(self, key: str):
+        self.client.delete(self.prefix + key)
+
+    def delete_if(self, key: str, value: bytes) -> bool:
+        return bool(self.client.eval(COMPARE_AND_DELETE_SCRIPT, 1, self.prefix + key, value))
+
+    def close(self):
+        self.client.close()
+
+
+def create_backend(backend: str = "memory", **options) -> CacheBackend:
+    if backend == "memory":
+        return MemoryBackend(**options)
+    if backend == "sqlite":
+        return SQLiteBackend(**options)
+    if backend == "redis":
+        return KeyValueBackend.from_url(**options)
+    if backend == "local":
+        return KeyValueBackend(LocalKeyValueStore(), **options)
+    raise ValueError(f"unknown cache backend: {backend}")
+
+
+@dataclass
+class SharedCacheStats:
+    hits: int = 0
+    misses: int = 0
+    computed: int = 0
+    # served by a computation which was already running in this process
+    coalesced: int = 0
+    # served by a computation of another replica
+    shared: int = 0
+    errors: int = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class _LeaderCancelled(Exception):
+    # set on a flight whose computing caller was cancelled, its waiting callers were not
+    pass
+
+
+class SharedCache:
+    # one namespace of a backend with single-flight computation of missing values: within the process by a future
+    # per key, across replicas by a lease in the backend. Backend failures are logged and degrade to no caching.
+
+    def __init__(
+        self,
+        backend: CacheBackend,
+        namespace: str,
+        ttl: float | None = DEFAULT_TTL,
+        lease_ttl: float = DEFAULT_LEASE_TTL,
+        wait_interval: float = DEFAULT_WAIT_INTERVAL
+    ):
+        self.backend = backend
+        self.namespace = namespace
+        self.ttl = ttl
+        self.lease_ttl = lease_ttl
+        self.wait_interval = wait_interval
+        self._lock = threading.Lock()
+        self._flights: dict[str, Future] = {}
+        self._stats = SharedCacheStats()
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def _count(self, field: str):
+        with self._lock:
+            setattr(self._stats, field, getattr(self._stats, field) + 1)
+        metrics.increment(f"shared_cache_{field}", namespace=self.namespace)
+
+    def _call(self, operation: Callable[..., Any], *args, default: Any = None) -> Any:
+        try:
+            return operation(*args)
+        except Exception as e:
+            logger.warning(f"shared cache {self.namespace} is unavailable: {e}")
+            self._count("errors")
+            return default
+
+    def get(self, key: str) -> bytes | None:
+        value = self._call(self.backend.get, self._key(key))
+        self._count("hits" if value is not None else "misses")
+        return value
+
+    def put(self, key: str, value: bytes, ttl: float | None = None):
+        self._call(self.backend.set, self._key(key), value, ttl if ttl is not None else self.ttl)
+
+    def delete(self, key: str):
+        self._call(self.backend.delete, self._key(key))
+
+    def stats(self) -> SharedCacheStats:
+        with self._lock:
+            return SharedCacheStats(**vars(self._stats))
+
+    def _join(self, key: str) -> tuple[Future, bool]:
+        with self._lock:
+            if (flight := self._flights.get(key)) is not None:
+                return flight, False
+            flight = self._flights[key] = Future()
+            return flight, True
+
+    def _land(self, key: str, flight: Future, value: bytes | None = None, error: BaseException | None = None):
+        with self._lock:
+            self._flights.pop(key, None)
+        if error is not None and not isinstance(error, Exception):
+            # a cancelled or interrupted leader must not cancel the callers waiting for it, one of them takes over
+            flight.set_exception(_LeaderCancelled(f"computation of {key} was cancelled"))
+        elif error is not None:
+            flight.set_exception(error)
+        else:
+            flight.set_result(value)
+
+    def _acquire(self, lease: str, token: bytes) -> bool:
+        # without a reachable backend every replica computes on its own
+        return self._call(self.backend.add, lease, token, self.lease_ttl, default=True)
+
+    def _release(self, lease: str, token: bytes):
+        # a lease which ran out may already belong to another replica, only our own is released
+        self._call(self.backend.delete_if, lease, token)
+
+    def get_or_compute(self, key: str, compute: Callable[[], bytes], ttl: float | None = None) -> bytes:
+        while True:
+            if (value := self.get(key)) is not None:
+                return value
+
+            flight, leader = self._join(key)
+            if leader:
+                break
+            self._count("coalesced")
+            try:
+                return flight.result()
+            except _LeaderCancelled:
+                continue
+
+        try:
+            value = self._compute(key, compute, ttl)
+        except BaseException as e:
+            self._land(key, flight, error=e)
+            raise
+        self._land(key, flight, value)
+        return value
+
+    def _compute(self, key: str, compute: Callable[[], bytes], ttl: float | None) -> bytes:
+        lease, token = LEASE_PREFIX + self._key(key), uuid.uuid4().bytes
+        waited = False
+        while not self._acquire(lease, token):
+            # another replica is computing the value
+            waited = True
+            time.sleep(self.wait_interval)
+            if (value := self._call(self.backend.get, self._key(key))) is not None:
+                self._count("shared")
+                return value
+
+        try:
+            # the previous holder may have stored the value right before releasing its lease
+            if waited and (value := self._call(self.backend.get, self._key(key))) is not None:
+                self._count("shared")
+                return value
+            value = compute()
+            self._count("computed")
+            self.put(key, value, ttl)
+            return value
+        finally:
+            self._release(lease, token)
+
+    async def aget_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[bytes]],
+        ttl: float | None = None
+    ) -> bytes:
+        # backend calls may block on disk or network, they are kept off the event loop
+        while True:
+            if (value := await asyncio.to_thread(self.get, key)) is not None:
+                return value
+
+            flight, leader = self._join(key)
+            if leader:
+                break
+            self._count("coalesced")
+            try:
+                return await asyncio.wrap_future(flight)
+            except _LeaderCancelled:
+                continue
+
+        try:
+            value = await self._acompute(key, compute, ttl)
+        except BaseException as e:
+            self._land(key, flight, error=e)
+            raise
+        self._land(key, flight, value)
+        return value
+
+    async def _acompute(self, key: str, compute: Callable[[], Awaitable[bytes]], ttl: float | None) -> bytes:
+        lease, token = LEASE_PREFIX + self._key(key), uuid.uuid4().bytes
+        waited = False
+        while not await asyncio.to_thread(self._acquire, lease, token):
+            waited = True
+            await asyncio.sleep(self.wait_interval)
+            if (value := await asyncio.to_thread(self._call, self.backend.get, self._key(key))) is not None:
+                self._count("shared")
+                return value
+
+        try:
+            if waited and (value := await asyncio.to_thread(self._call, self.backend.get, self._key(key))) is not None:
+                self._count("shared")
+                return value
+            value = await compute()
+            self._count("computed")
+            await asyncio.to_thread(self.put, key, value, ttl)
+            return value
+        finally:
+            await asyncio.to_thread(self._release, lease, token)
@@ -0,0 +1,162 @@
+import importlib.abc
+import logging
+import os
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+PROFILE_ENV = "ARCTIC_PROFILE_STARTUP"
+DEFAULT_REPORT_SIZE = 25
+
+
+@dataclass(frozen=True)
+class ImportTime:
+    module: str
+    # including the imports it triggered
+    seconds: float
+    own_seconds: float
+
+
+class _TimedLoader:
+
+    def __init__(self, loader: Any, profiler: "ImportProfiler", name: str):
+        self._loader = loader
+        self._profiler = profiler
+        self._name = name
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._loader, name)
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        # the module keeps its original loader, the wrapper only exists while it is executed
+        module.__loader__ = self._loader
+        if module.__spec__ is not None:
+            module.__spec__.loader = self._loader
+        self._profiler._enter(self._name)
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._profiler._exit(self._name)
+
+
+class ImportProfiler(importlib.abc.MetaPathFinder):
+    # wraps the loaders found by the other finders and times the execution of every newly imported module
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._times: dict[str, ImportTime] = {}
+
+    def find_spec(self, fullname: str, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is None:
+                continue
+            if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                spec.loader = _TimedLoader(spec.loader, self, fullname)
+            return spec
+        return None
+
+    def _stack(self) -> list[list]:
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def _enter(self, name: str):
+        self._stack().append([name, time.perf_counter(), 0.0])
+
+    def _exit(self, name: str):
+        stack = self._stack()
+        _, started, children = stack.pop()
+        seconds = time.perf_counter() - started
+        if stack:
+            stack[-1][2] += seconds
+        with self._lock:
+            self._times[name] = ImportTime(module=name, seconds=seconds, own_seconds=seconds - children)
+
+    def install(self):
+        if self not in sys.meta_path:
+            sys.meta_path.insert(0, self)
+
+    def uninstall(self):
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+    def report(self, limit: int = DEFAULT_REPORT_SIZE) -> list[ImportTime]:
+        with self._lock:
+            return sorted(self._times.values(), key=lambda import_time: import_time.seconds, reverse=True)[:limit]
+
+    def format_report(self, limit: int = DEFAULT_REPORT_SIZE) -> str:
+        lines = [f"{'cumulative':>12}{'own':>10}  module"]
+        for import_time in self.report(limit):
+            lines.append(f"{import_time.seconds * 1000:10.1f}ms{import_time.own_seconds * 1000:8.1f}ms  {import_time.module}")
+        return "\n".join(lines)
+
+
+class Startup:
+    # cold start of the process: import profiling, time to the first rendered page, background warm-up
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.profiler: ImportProfiler | None = None
+        self.first_render_seconds: float | None = None
+        self.warm_up_seconds: float | None = None
+        self._lock = threading.Lock()
+        self._warm_up: threading.Thread | None = None
+
+    def profile_imports(self, enabled: bool | None = None) -> bool:
+        # has to run before the modules of interest are imported, enabled by ARCTIC_PROFILE_STARTUP by default
+        if enabled is None:
+            enabled = bool(os.environ.get(PROFILE_ENV))
+        with self._lock:
+            if enabled and self.profiler is None:
+                self.profiler = ImportProfiler()
+                self.profiler.install()
+        return self.profiler is not None
+
+    def first_render(self):
+        with self._lock:
+            if self.first_render_seconds is not None:
+                return
+            self.first_render_seconds = time.perf_counter() - self.started
+            profiler, self.profiler = self.profiler, None
+
+        metrics.observe("startup_seconds", self.first_render_seconds, phase="first_render")
+        logger.info(f"first page rendered {self.first_render_seconds * 1000:.0f}ms after start")
+        if profiler is not None:
+            profiler.uninstall()
+            logger.info(f"time to first render: {self.first_render_seconds * 1000:.0f}ms\n{profiler.format_report()}")
+
+    def warm_up(self, load: Callable[[], Any]):
+        # loads the generation stack once per process after the first page is out, so entering QUIZ is warm
+        with self._lock:
+            if self._warm_up is not None:
+                return
+            self._warm_up = threading.Thread(target=self._run_warm_up, args=(load,), name="warm-up", daemon=True)
+        self._warm_up.start()
+
+    def _run_warm_up(self, load: Callable[[], Any]):
+        started = time.perf_counter()
+        try:
+            load()
+        except Exception as e:
+            logger.warning(f"warm-up failed, resources are created on first use: {e}")
+            return
+
+        self.warm_up_seconds = time.perf_counter() - started
+        metrics.observe("startup_seconds", self.warm_up_seconds, phase="warm_up")
+        logger.info(f"warmed up in {self.warm_up_seconds * 1000:.0f}ms")
+
+
+startup = Startup()
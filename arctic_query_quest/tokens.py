@@ -0,0 +1,116 @@
+import logging
+import math
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+ARCTIC_TOKENIZER = "Snowflake/snowflake-arctic-instruct"
+DEFAULT_HEADROOM = 1.5
+DEFAULT_MIN_SAMPLES = 16
+DEFAULT_WINDOW = 256
+# the observed p99 reply size drives the limit, a single outlier does not
+BUDGET_QUANTILE = 0.99
+
+
+def estimate_tokens(text: str) -> int:
+    # rough approximation of ~4 characters per token for English text and SQL
+    return math.ceil(len(text) / 4)
+
+
+class TokenCounter:
+
+    def __init__(self, tokenizer_name: str | None = ARCTIC_TOKENIZER, local_files_only: bool = True):
+        self.tokenizer_name = tokenizer_name
+        self.local_files_only = local_files_only
+        self._lock = threading.Lock()
+        self._tokenizer = None
+        self._loaded = tokenizer_name is None
+
+    @property
+    def exact(self) -> bool:
+        return self._get_tokenizer() is not None
+
+    def _get_tokenizer(self):
+        if self._loaded:
+            return self._tokenizer
+
+        with self._lock:
+            if not self._loaded:
+                try:
+                    from transformers import AutoTokenizer
+
+                    # by default only a tokenizer which is already on disk is used, counting never blocks on a download
+                    self._tokenizer = AutoTokenizer.from_pretrained(
+                        self.tokenizer_name,
+                        local_files_only=self.local_files_only
+                    )
+                    logger.info(f"counting tokens with tokenizer {self.tokenizer_name}")
+                except (ImportError, OSError, ValueError) as e:
+                    logger.warning(f"tokenizer {self.tokenizer_name} is not available, estimating token counts: {e}")
+                self._loaded = True
+
+        return self._tokenizer
+
+    def count(self, text: str) -> int:
+        if (tokenizer := self._get_tokenizer()) is None:
+            return estimate_tokens(text)
+        return len(tokenizer.encode(text, add_special_tokens=False))
+
+
+class OutputBudget:
+
+    def __init__(
+        self,
+        prior: int,
+        ceiling: int,
+        headroom: float = DEFAULT_HEADROOM,
+        min_samples: int = DEFAULT_MIN_SAMPLES,
+        window: int = DEFAULT_WINDOW
+    ):
+        if prior < 1 or ceiling < 1:
+            raise ValueError("prior and ceiling must be positive")
+
+        self.prior = prior
+        self.ceiling = ceiling
+        self.headroom = headroom
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._samples: deque[float] = deque(maxlen=window)
+        # raised by a truncated reply, held until enough replies completed below it
+        self._floor = 0.0
+        self._observed_since_truncation = 0
+        self.truncations = 0
+
+    def _per_quiz(self) -> float:
+        if len(self._samples) < self.min_samples:
+            # until there are enough observations the upper bound derived from the reply schema is used
+            return max(self.prior, self._floor)
+
+        ordered = sorted(self._samples)
+        return max(ordered[min(len(ordered) - 1, int(BUDGET_QUANTILE * len(ordered)))] * self.headroom, self._floor)
+
+    def per_quiz(self) -> float:
+        with self._lock:
+            return self._per_quiz()
+
+    def limit(self, count: int = 1) -> int:
+        return max(1, min(self.ceiling, math.ceil(self.per_quiz() * count)))
+
+    def observe(self, tokens: int, count: int = 1):
+        if count < 1 or tokens < 1:
+            return
+
+        with self._lock:
+            self._samples.append(tokens / count)
+            self._observed_since_truncation += 1
+            if self._observed_since_truncation >= self.min_samples:
+                self._floor = 0.0
+
+    def truncated(self):
+        # a reply ran into the limit, double the budget in use until the next observations settle
+        with self._lock:
+            self.truncations += 1
+            self._floor = min(self._per_quiz() * 2, self.ceiling)
+            self._observed_since_truncation = 0
+        logger.warning(f"reply was truncated, raising the output budget to {self.limit()} tokens per quiz")
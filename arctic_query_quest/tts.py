@@ -1,5 +1,63 @@
-from google.cloud import texttospeech
-from google.oauth2 import service_account
+import asyncio
+import re
+from contextlib import contextmanager
+from typing import TYPE_CHECKING
+
+from admission import AdmissionController
+from audio_cache import AudioCache, cache_key
+from event_loop import background_loop
+from metrics import metrics
+from resilience import CircuitBreaker, RetryPolicy, resilient
+from shared_cache import SharedCache
+
+if TYPE_CHECKING:
+    from google.cloud import texttospeech
+
+TTS_RETRY_POLICY = RetryPolicy(max_attempts=3)
+tts_breaker = CircuitBreaker("tts")
+# sentence chunks make several short calls per text, hence a higher rate than for Replicate
+tts_admission = AdmissionController("tts", rate=20.0, burst=40, max_in_flight=32, deadline=10.0)
+
+GRPC_CHANNEL_OPTIONS = [
+    ("grpc.keepalive_time_ms", 30000),
+    ("grpc.keepalive_timeout_ms", 10000),
+    ("grpc.keepalive_permit_without_calls", 1),
+    ("grpc.http2.max_pings_without_data", 0),
+]
+MAX_ASYNC_CONCURRENCY = 64
+# consecutive unavailable errors after which the gRPC channels are taken for broken
+MAX_CHANNEL_ERRORS = 5
+DEFAULT_CHUNK_CHARS = 250
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?:;])\s+")
+ID3_HEADER_SIZE = 10
+
+
+def split_sentences(text: str, max_chars: int = DEFAULT_CHUNK_CHARS) -> list[str]:
+    # short sentences are merged, so a chunk is worth the round trip
+    chunks = []
+    for sentence in SENTENCE_PATTERN.split(text.strip()):
+        if chunks and len(chunks[-1]) + len(sentence) + 1 <= max_chars:
+            chunks[-1] = f"{chunks[-1]} {sentence}"
+        elif sentence:
+            chunks.append(sentence)
+
+    return chunks
+
+
+def _strip_id3(audio: bytes) -> bytes:
+    if len(audio) < ID3_HEADER_SIZE or not audio.startswith(b"ID3"):
+        return audio
+
+    # the tag size is a 28 bit syncsafe integer, 7 bits per byte
+    size = 0
+    for byte in audio[6:10]:
+        size = size << 7 | byte & 0x7F
+    return audio[ID3_HEADER_SIZE + size:]
+
+
+def join_mp3(parts: list[bytes]) -> bytes:
+    # MP3 frames are self-contained, only the leading ID3 tag of all but the first part has to go
+    return b"".join([parts[0], *(_strip_id3(part) for part in parts[1:])]) if parts else b""
 
 
 class SpeechClient:
@@ -11,9 +69,16 @@ class SpeechClient:
         private_key: str,
         client_email: str,
         client_id: str,
-        client_x509_cert_url: str
+        client_x509_cert_url: str,
+        cache: AudioCache | None = None,
+        max_async_concurrency: int = MAX_ASYNC_CONCURRENCY,
+        shared_cache: SharedCache | None = None
     ):
-        credentials = service_account.Credentials.from_service_account_info({
+        # the Google Cloud client libraries are slow to import, they are only loaded once a client is created
+        from google.cloud import texttospeech
+        from google.oauth2 import service_account
+
+        self.credentials = service_account.Credentials.from_service_account_info({
             "type": "service_account",
             "project_id": project_id,
             "private_key_id": private_key_id,
@@ -26,7 +91,15 @@ class SpeechClient:
             "client_x509_cert_url": client_x509_cert_url,
             "universe_domain": "googleapis.com"
         })
-        self.client = texttospeech.TextToSpeechClient(credentials=credentials)
+        transport_class = texttospeech.TextToSpeechClient.get_transport_class("grpc")
+        channel = transport_class.create_channel(credentials=self.credentials, options=GRPC_CHANNEL_OPTIONS)
+        self.client = texttospeech.TextToSpeechClient(transport=transport_class(channel=channel))
+        # grpc.aio channels are bound to an event loop, the async client is created on the background loop
+        self.async_client: "texttospeech.TextToSpeechAsyncClient | None" = None
+        self.max_async_concurrency = max_async_concurrency
+        self._async_slots: asyncio.Semaphore | None = None
+        self.closed = False
+        self.channel_errors = 0
         self.voice = texttospeech.VoiceSelectionParams(
             language_code="en-US",
             name="en-US-Studio-O",
@@ -35,13 +108,119 @@ class SpeechClient:
         self.audio_config = texttospeech.AudioConfig(
             audio_encoding=texttospeech.AudioEncoding.MP3
         )
+        self.cache = cache
+        # shared with other replicas, the local audio cache stays in front of it
+        self.shared_cache = shared_cache
+
+    def healthy(self) -> bool:
+        return not self.closed and self.channel_errors < MAX_CHANNEL_ERRORS
+
+    @contextmanager
+    def _channel(self):
+        # failed requests are answers of a working channel, only an unreachable service counts against it
+        from google.api_core.exceptions import ServiceUnavailable
+
+        try:
+            yield
+        except ServiceUnavailable:
+            self.channel_errors += 1
+            raise
+        self.channel_errors = 0
+
+    def close(self):
+        self.closed = True
+        self.client.transport.close()
+        if self.async_client is not None and background_loop.running:
+            background_loop.submit(self.async_client.transport.close())
+
+    def _cache_key(self, text: str) -> str:
+        return cache_key(
+            text.encode("utf-8"),
+            type(self.voice).serialize(self.voice),
+            type(self.audio_config).serialize(self.audio_config)
+        )
 
     def synthesize(self, text: str) -> bytes:
+        if self.cache is None and self.shared_cache is None:
+            return self._synthesize(text)
+
+        key = self._cache_key(text)
+        if self.cache is not None and (audio := self.cache.get(key)) is not None:
+            return audio
+
+        if self.shared_cache is None:
+            audio = self._synthesize(text)
+        else:
+            audio = self.shared_cache.get_or_compute(key, lambda: self._synthesize(text))
+        if self.cache is not None:
+            self.cache.put(key, audio)
+        return audio
+
+    @resilient(TTS_RETRY_POLICY, breaker=tts_breaker)
+    def _synthesize(self, text: str) -> bytes:
+        from google.cloud import texttospeech
+
         synthesis_input = texttospeech.SynthesisInput(text=text)
-        response = self.client.synthesize_speech(
-            input=synthesis_input,
-            voice=self.voice,
-            audio_config=self.audio_config
-        )
+        with tts_admission.admit(), metrics.span("tts"), self._channel():
+            response = self.client.synthesize_speech(
+                input=synthesis_input,
+                voice=self.voice,
+                audio_config=self.audio_config
+            )
+
+        return response.audio_content
+
+    def _get_async_client(self) -> "texttospeech.TextToSpeechAsyncClient":
+        if self.async_client is None:
+            from google.cloud import texttospeech
+
+            transport_class = texttospeech.TextToSpeechAsyncClient.get_transport_class("grpc_asyncio")
+            channel = transport_class.create_channel(credentials=self.credentials, options=GRPC_CHANNEL_OPTIONS)
+            self.async_client = texttospeech.TextToSpeechAsyncClient(transport=transport_class(channel=channel))
+        return self.async_client
+
+    def _slots(self) -> asyncio.Semaphore:
+        if self._async_slots is None:
+            self._async_slots = asyncio.Semaphore(self.max_async_concurrency)
+        return self._async_slots
+
+    async def asynthesize(self, text: str) -> bytes:
+        if self.cache is None and self.shared_cache is None:
+            return await self._asynthesize(text)
+
+        key = self._cache_key(text)
+        # the audio cache reads and writes files, keep that off the event loop
+        if self.cache is not None and (audio := await asyncio.to_thread(self.cache.get, key)) is not None:
+            return audio
+
+        if self.shared_cache is None:
+            audio = await self._asynthesize(text)
+        else:
+            audio = await self.shared_cache.aget_or_compute(key, lambda: self._asynthesize(text))
+        if self.cache is not None:
+            await asyncio.to_thread(self.cache.put, key, audio)
+        return audio
+
+    @resilient(TTS_RETRY_POLICY, breaker=tts_breaker)
+    async def _asynthesize(self, text: str) -> bytes:
+        from google.cloud import texttospeech
+
+        client = self._get_async_client()
+        synthesis_input = texttospeech.SynthesisInput(text=text)
+        async with tts_admission.aadmit(), self._slots():
+            with metrics.span("tts"), self._channel():
+                response = await client.synthesize_speech(
+                    input=synthesis_input,
+                    voice=self.voice,
+                    audio_config=self.audio_config
+                )
 
         return response.audio_content
+
+    async def asynthesize_chunked(self, text: str) -> bytes:
+        # sentences are synthesized concurrently, bounded by the async client slots, and joined in order
+        chunks = split_sentences(text)
+        return join_mp3(list(await asyncio.gather(*(self.asynthesize(chunk) for chunk in chunks))))
+
+    def synthesize_chunked(self, text: str) -> bytes:
+        return background_loop.run(self.asynthesize_chunked(text))
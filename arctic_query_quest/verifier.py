@@ -0,0 +1,153 @@
+import logging
+import queue
+import re
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Iterator
+
+import duckdb
+
+from arctic import ArcticQuiz
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POOL_SIZE = 4
+CODE_PATTERN = re.compile(r"```(?:sql)?\s*(.+?)```|`([^`]+)`", re.DOTALL | re.IGNORECASE)
+STATEMENT_PATTERN = re.compile(r"^\s*(SELECT|WITH|INSERT|UPDATE|DELETE|CREATE|ALTER|DROP)\b", re.IGNORECASE)
+CHECKED_FIELDS = ("answer_1", "answer_2", "answer_3", "explanation")
+
+
+class QuizRejected(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class SnippetCheck:
+    field: str
+    sql: str
+    error: str | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+@dataclass
+class Verification:
+    correct_field: str
+    checks: list[SnippetCheck] = field(default_factory=list)
+
+    @property
+    def failures(self) -> list[SnippetCheck]:
+        return [check for check in self.checks if not check.ok]
+
+    @property
+    def accepted(self) -> bool:
+        # wrong answers may well contain broken SQL, only the marked answer has to hold up
+        return all(check.ok for check in self.checks if check.field == self.correct_field)
+
+
+def extract_statements(text: str) -> list[str]:
+    statements = []
+    for match in CODE_PATTERN.finditer(text):
+        code = match.group(1) or match.group(2)
+        for statement in code.split(";"):
+            if STATEMENT_PATTERN.match(statement):
+                statements.append(statement.strip())
+
+    return statements
+
+
+class QuizVerifier:
+
+    def __init__(self, models: dict[str, str], pool_size: int = DEFAULT_POOL_SIZE, execute: bool = False):
+        self.execute = execute
+        # one in-memory snapshot with a schema per model, loaded once and shared by all cursors, no statement may read
+        # or write files, attach databases or load extensions
+        self.connection = duckdb.connect(":memory:", config={"enable_external_access": False})
+        self._cursors: dict[str, queue.Queue[duckdb.DuckDBPyConnection]] = {}
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.rejected = 0
+
+        for name, sql in models.items():
+            schema = self._schema(name)
+            self.connection.execute(f"CREATE SCHEMA {schema}")
+            self.connection.execute(f"SET schema = '{schema}'")
+            for statement in self.connection.extract_statements(sql):
+                try:
+                    self.connection.execute(statement)
+                except duckdb.Error as e:
+                    # some bundled sample rows violate their own keys, the schema is what matters
+                    logger.warning(f"skipping statement of model {name}: {str(e).splitlines()[0]}")
+
+            cursors = queue.Queue()
+            for _ in range(pool_size):
+                cursor = self.connection.cursor()
+                cursor.execute(f"SET schema = '{schema}'")
+                cursors.put(cursor)
+            self._cursors[name] = cursors
+
+        # checked statements can not change settings either, e.g. to enable external access again
+        self.connection.execute("SET lock_configuration = true")
+
+    @staticmethod
+    def _schema(name: str) -> str:
+        return re.sub(r"\W", "_", name.lower())
+
+    @contextmanager
+    def _cursor(self, db_model: str) -> Iterator[duckdb.DuckDBPyConnection]:
+        cursors = self._cursors[db_model]
+        cursor = cursors.get()
+        try:
+            yield cursor
+        finally:
+            cursors.put(cursor)
+
+    def check(self, db_model: str, sql: str) -> str | None:
+        with self._cursor(db_model) as cursor:
+            try:
+                statements = cursor.extract_statements(sql)
+                if len(statements) != 1:
+                    return f"expected one statement, found {len(statements)}"
+                # EXPLAIN parses and binds against the schema without touching any data
+                cursor.execute(f"EXPLAIN {sql}")
+                if self.execute and statements[0].type == duckdb.StatementType.SELECT:
+                    # only queries run on the sample data, the cursors never write to the shared snapshot
+                    cursor.execute(sql).fetchmany(1)
+            except duckdb.Error as e:
+                return str(e).splitlines()[0]
+
+        return None
+
+    def verify(self, db_model: str, quiz: ArcticQuiz) -> Verification:
+        with metrics.span("verify"):
+            verification = Verification(correct_field=f"answer_{quiz.correct_answer}")
+            for name in CHECKED_FIELDS:
+                for sql in extract_statements(getattr(quiz, name)):
+                    verification.checks.append(SnippetCheck(name, sql, self.check(db_model, sql)))
+
+        with self._lock:
+            self.checked += 1
+            self.rejected += not verification.accepted
+
+        for failure in verification.failures:
+            logger.info(f"SQL in {failure.field} does not hold up against {db_model}: {failure.error}")
+        return verification
+
+    def ensure_valid(self, db_model: str, quiz: ArcticQuiz):
+        if quiz.correct_answer not in (1, 2, 3):
+            raise QuizRejected(f"correct answer {quiz.correct_answer} is out of range")
+
+        verification = self.verify(db_model, quiz)
+        if not verification.accepted:
+            errors = "; ".join(f"{check.sql}: {check.error}" for check in verification.failures)
+            raise QuizRejected(f"the marked answer of the quiz is invalid SQL for {db_model}: {errors}")
+
+    def close(self):
+        for cursors in self._cursors.values():
+            while not cursors.empty():
+                cursors.get_nowait().close()
+        self.connection.close()
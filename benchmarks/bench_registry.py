@@ -0,0 +1,59 @@
+"""
+Per-rerun setup cost: building the clients on every Streamlit rerun vs. looking them up in the registry.
+
+Runs fully offline with a throwaway service account key, no request is sent upstream.
+
+    poetry run python benchmarks/bench_registry.py
+"""
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "arctic_query_quest"))
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from arctic import ArcticClient  # noqa: E402
+from prompt import PromptGenerator  # noqa: E402
+from registry import ResourceRegistry  # noqa: E402
+from tts import SpeechClient  # noqa: E402
+
+from tests.fakes import create_private_key  # noqa: E402
+
+RERUNS = 50
+
+
+def main():
+    os.environ.setdefault("REPLICATE_API_TOKEN", "dummy")
+    private_key = create_private_key()
+
+    def create_tts_client() -> SpeechClient:
+        return SpeechClient("project", "key-id", private_key, "bench@example.com", "1", "https://example.com")
+
+    def setup_without_registry():
+        PromptGenerator()
+        ArcticClient().close()
+        create_tts_client().close()
+
+    registry = ResourceRegistry()
+    registry.register("prompt_generator", PromptGenerator)
+    registry.register("arctic_client", ArcticClient, health_check=ArcticClient.healthy, close=ArcticClient.close)
+    registry.register("tts_client", create_tts_client, health_check=SpeechClient.healthy, close=SpeechClient.close)
+
+    def setup_with_registry():
+        registry.get("prompt_generator")
+        registry.get("arctic_client")
+        registry.get("tts_client")
+
+    for name, setup in (("without registry", setup_without_registry), ("with registry", setup_with_registry)):
+        started = time.perf_counter()
+        for _ in range(RERUNS):
+            setup()
+        elapsed = (time.perf_counter() - started) / RERUNS
+        print(f"{name:>18}: {elapsed * 1000:8.3f} ms per rerun")
+
+    registry.shutdown()
+
+
+if __name__ == '__main__':
+    main()
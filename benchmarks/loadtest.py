@@ -0,0 +1,254 @@
+"""
+Offline load test: N concurrent AppTest sessions play START -> QUIZ -> EVALUATE against local fake backends.
+
+Reports throughput, end-to-end quiz latency, upstream call counts and peak RSS. Needs `.streamlit/secrets.toml`
+with a `gcp` section like the tests, no request is sent upstream.
+
+    poetry run python benchmarks/loadtest.py --sessions 16 --rounds 3 --malformed-rate 0.1 --error-rate 0.05
+"""
+import argparse
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+from streamlit.runtime import Runtime
+from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+from streamlit.runtime.media_file_manager import MediaFileManager
+from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+from streamlit.testing.v1 import AppTest
+from streamlit.testing.v1.util import patch_config_options
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "arctic_query_quest"))
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from tests.fakes import (  # noqa: E402
+    FakeReplicate,
+    FakeReplicateConfig,
+    FakeTextToSpeech,
+    FakeTextToSpeechConfig,
+    Latency,
+    UpstreamCalls,
+    fake_backends
+)
+
+MAIN_SCRIPT = str(Path(__file__).parent.parent / "arctic_query_quest" / "main.py")
+START_BUTTON = ":video_game: Start the Quest!"
+ANSWER_BUTTONS = (":one:", ":two:", ":three:")
+BACK_BUTTON = ":arrow_left: Back to start!"
+DB_MODELS = ("Shop", "Game", "Books")
+DIFFICULTIES = ("Easy", "Medium", "Hard")
+
+
+@dataclass
+class LoadTestReport:
+    sessions: int
+    rounds: int
+    seconds: float
+    quiz_latencies: list[float] = field(default_factory=list)
+    failures: list[str] = field(default_factory=list)
+    replicate_calls: UpstreamCalls = field(default_factory=UpstreamCalls)
+    tts_calls: UpstreamCalls = field(default_factory=UpstreamCalls)
+    peak_rss_bytes: int = 0
+    session_store_bytes: int = 0
+    session_store_shared_bytes: int = 0
+
+    @property
+    def completed(self) -> int:
+        return len(self.quiz_latencies)
+
+    @property
+    def throughput(self) -> float:
+        return self.completed / self.seconds if self.seconds else 0.0
+
+    def latency(self, quantile: float) -> float:
+        if not self.quiz_latencies:
+            return float("nan")
+        ordered = sorted(self.quiz_latencies)
+        return ordered[min(len(ordered) - 1, int(quantile * len(ordered)))]
+
+    def summary(self) -> str:
+        return "\n".join([
+            f"sessions: {self.sessions} x {self.rounds} rounds in {self.seconds:.1f}s",
+            f"completed quizzes: {self.completed}, failures: {len(self.failures)}",
+            f"throughput: {self.throughput:.2f} quizzes/s",
+            f"quiz latency: p50 {self.latency(0.5) * 1000:.0f}ms, p99 {self.latency(0.99) * 1000:.0f}ms",
+            f"replicate: {self.replicate_calls}",
+            f"tts: {self.tts_calls}",
+            f"session store: {self.session_store_bytes / 1024:.0f} KiB "
+            f"({self.session_store_shared_bytes / 1024:.0f} KiB shared between sessions)",
+            f"peak RSS: {self.peak_rss_bytes / 1024 / 1024:.0f} MiB",
+        ])
+
+
+def peak_rss_bytes() -> int:
+    # ru_maxrss is reported in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def shared_runtime() -> Runtime:
+    # every AppTest run installs and tears down its own mock runtime and config, which breaks concurrent
+    # sessions, all sessions share one runtime and config instead like they would on a single Streamlit server
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    return runtime
+
+
+def click(at: AppTest, label: str, timeout: float):
+    button = next((button for button in at.button if button.label == label), None)
+    if button is None:
+        raise AssertionError(f"button {label} not found")
+    button.click().run(timeout=timeout)
+
+
+def play(session: int, rounds: int, timeout: float, seed: int | None) -> tuple[list[float], list[str]]:
+    rng = random.Random(None if seed is None else seed + session)
+    latencies, failures = [], []
+
+    at = AppTest.from_file(MAIN_SCRIPT, default_timeout=timeout)
+    at.run()
+
+    for _ in range(rounds):
+        at.radio[0].set_value(rng.choice(DB_MODELS))
+        at.select_slider[0].set_value(rng.choice(DIFFICULTIES))
+        at.run()
+
+        started = time.perf_counter()
+        click(at, START_BUTTON, timeout)
+        elapsed = time.perf_counter() - started
+
+        if at.exception or at.warning or not any(button.label in ANSWER_BUTTONS for button in at.button):
+            failures.append(f"session {session}: no quiz rendered")
+            at.session_state.app_state = at.session_state.app_state.__class__.START
+            at.run()
+            continue
+
+        latencies.append(elapsed)
+        click(at, rng.choice(ANSWER_BUTTONS), timeout)
+        if at.exception or (at.warning and "wrong" not in at.warning[0].value):
+            failures.append(f"session {session}: evaluation failed")
+        click(at, BACK_BUTTON, timeout)
+
+    return latencies, failures
+
+
+def run_load_test(
+    sessions: int,
+    rounds: int = 1,
+    replicate_config: FakeReplicateConfig | None = None,
+    tts_config: FakeTextToSpeechConfig | None = None,
+    timeout: float = 60.0,
+    seed: int | None = None
+) -> LoadTestReport:
+    os.environ.setdefault("REPLICATE_API_TOKEN", "dummy")
+
+    from audio_cache import AudioCache
+    from corpus import QuizCorpus
+    from pool import QuizPool
+    from registry import registry
+    from resources import ARCTIC_CLIENT, QUIZ_CORPUS, QUIZ_GENERATOR, QUIZ_POOL, TTS_CLIENT
+    from session_store import session_store
+    from shared_cache import MemoryBackend, SharedCache
+
+    replicate = FakeReplicate(replicate_config)
+    text_to_speech = FakeTextToSpeech(tts_config)
+    report = LoadTestReport(sessions=sessions, rounds=rounds, seconds=0.0)
+    lock = threading.Lock()
+
+    def session(number: int):
+        try:
+            latencies, failures = play(number, rounds, timeout, seed)
+        except Exception as e:
+            latencies, failures = [], [f"session {number}: {e!r}"]
+        with lock:
+            report.quiz_latencies.extend(latencies)
+            report.failures.extend(failures)
+
+    runtime = shared_runtime()
+    tts_client = registry.get(TTS_CLIENT)
+    get_resource = registry.get
+    cache_directory = tempfile.TemporaryDirectory()
+    quiz_generator = registry.get(QUIZ_GENERATOR)
+    # fake quizzes and audio must not end up in the real caches, and no refill may outlive the fakes
+    stand_ins = {
+        QUIZ_CORPUS: QuizCorpus(f"{cache_directory.name}/corpus.sqlite"),
+        QUIZ_POOL: QuizPool(quiz_generator.generate, batch_producer=quiz_generator.generate_batch)
+    }
+    stand_ins[QUIZ_POOL].start()
+
+    with (
+        cache_directory,
+        patch.object(tts_client, "cache", AudioCache(f"{cache_directory.name}/audio")),
+        patch.object(tts_client, "shared_cache", SharedCache(MemoryBackend(), "audio")),
+        patch.object(registry, "get", side_effect=lambda name: stand_ins.get(name) or get_resource(name)),
+        patch_config_options({"global.appTest": True}),
+        patch("streamlit.testing.v1.app_test.patch_config_options", return_value=nullcontext()),
+        patch.object(Runtime, "instance", return_value=runtime),
+        patch.object(Runtime, "exists", return_value=True),
+        fake_backends(registry.get(ARCTIC_CLIENT), tts_client, replicate, text_to_speech)
+    ):
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=sessions, thread_name_prefix="loadtest") as executor:
+            list(executor.map(session, range(sessions)))
+        report.seconds = time.perf_counter() - started
+        stand_ins[QUIZ_POOL].stop()
+        stand_ins[QUIZ_CORPUS].close()
+
+    report.replicate_calls = replicate.calls()
+    report.tts_calls = text_to_speech.calls()
+    report.peak_rss_bytes = peak_rss_bytes()
+    session_store_stats = session_store.stats()
+    report.session_store_bytes = session_store_stats.resident_bytes
+    report.session_store_shared_bytes = session_store_stats.deduplicated_bytes
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--rounds", type=int, default=2)
+    parser.add_argument("--ttft", type=float, default=0.3, help="median time to first token in seconds")
+    parser.add_argument("--ttft-sigma", type=float, default=0.5)
+    parser.add_argument("--tokens-per-second", type=float, default=400.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--tts-latency", type=float, default=0.2)
+    parser.add_argument("--tts-error-rate", type=float, default=0.0)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    report = run_load_test(
+        args.sessions,
+        args.rounds,
+        FakeReplicateConfig(
+            time_to_first_token=Latency(args.ttft, args.ttft_sigma),
+            tokens_per_second=args.tokens_per_second,
+            malformed_rate=args.malformed_rate,
+            error_rate=args.error_rate,
+            seed=args.seed
+        ),
+        FakeTextToSpeechConfig(latency=Latency(args.tts_latency, 0.3), error_rate=args.tts_error_rate, seed=args.seed),
+        timeout=args.timeout,
+        seed=args.seed
+    )
+    print(report.summary())
+    for failure in report.failures:
+        print(f"  {failure}")
+
+    from registry import registry
+    registry.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+Prompt and reply token budget per model and difficulty, before and after schema compaction.
+
+Uses the Arctic tokenizer when it is available locally (`--download` fetches it), otherwise the character based
+estimate. Run from the repository root, no request is sent to Replicate.
+
+    poetry run python benchmarks/prompt_tokens.py
+"""
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "arctic_query_quest"))
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from arctic import DEFAULT_MAX_NEW_TOKENS, PROMPT_TEMPLATE, quiz_reply_tokens  # noqa: E402
+from assets import AssetRegistry  # noqa: E402
+from common import MODEL_FILES  # noqa: E402
+from prompt import Difficulty, PromptGenerator  # noqa: E402
+from prompt_optimizer import PromptOptimizer  # noqa: E402
+from tokens import ARCTIC_TOKENIZER, TokenCounter  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokenizer", default=ARCTIC_TOKENIZER)
+    parser.add_argument("--download", action="store_true", help="download the tokenizer if it is not cached")
+    args = parser.parse_args()
+
+    token_counter = TokenCounter(args.tokenizer, local_files_only=not args.download)
+    prompt_generator = PromptGenerator(AssetRegistry())
+    prompt_optimizer = PromptOptimizer(token_counter)
+    # the system prompt is sent with every request as part of the prompt template
+    template_tokens = token_counter.count(PROMPT_TEMPLATE.format(prompt=""))
+
+    print(f"tokenizer: {args.tokenizer if token_counter.exact else 'estimate (~4 characters per token)'}")
+    print(f"{'model':<8}{'difficulty':<12}{'prompt before':>15}{'prompt after':>14}{'saved':>8}")
+    for model, path in MODEL_FILES.items():
+        sql = Path(path).read_text()
+        for difficulty in Difficulty:
+            before = prompt_generator.generate_prompt(model=sql, difficulty=difficulty)
+            after = prompt_generator.generate_prompt(
+                model=prompt_optimizer.compact(model, sql, difficulty),
+                difficulty=difficulty
+            )
+            before_tokens = template_tokens + token_counter.count(before)
+            after_tokens = template_tokens + token_counter.count(after)
+            print(
+                f"{model:<8}{difficulty.name.lower():<12}{before_tokens:>15}{after_tokens:>14}"
+                f"{1 - after_tokens / before_tokens:>8.0%}"
+            )
+
+    print(f"max_new_tokens: {DEFAULT_MAX_NEW_TOKENS} before, {quiz_reply_tokens(token_counter)} per quiz "
+          f"until observed reply sizes take over")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""
+Quiz generation latency against a local fake Replicate server: the LangChain wrapper, the polling Replicate SDK and
+the native streaming client.
+
+All paths stop reading once the quiz JSON object is complete, like the app. The LangChain wrapper looks up the model
+version and polls the prediction, the SDK path creates the prediction by model name and polls it, the native path
+streams the prediction as server-sent events over one pooled keep-alive connection. Polling uses the SDK default
+interval unless REPLICATE_POLL_INTERVAL is set. No request leaves the machine.
+
+    poetry run python benchmarks/replicate_stream.py --calls 20 --concurrency 4
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "arctic_query_quest"))
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from arctic import ARCTIC_MODEL, ArcticClient  # noqa: E402
+from json_stream import JsonStreamExtractor  # noqa: E402
+from tests.fake_replicate_server import FakeReplicateServer  # noqa: E402
+from tests.fakes import FakeReplicateConfig, Latency  # noqa: E402
+
+PROMPT = "Generate a quiz about joins"
+
+
+@dataclass
+class PathReport:
+    name: str
+    latencies: list[float] = field(default_factory=list)
+    first_tokens: list[float] = field(default_factory=list)
+    http_requests: int = 0
+    seconds: float = 0.0
+
+    def format(self) -> str:
+        latencies = sorted(self.latencies)
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        return (
+            f"{self.name:<10}{statistics.median(latencies) * 1000:>9.0f}ms{p95 * 1000:>9.0f}ms"
+            f"{statistics.median(self.first_tokens) * 1000:>9.0f}ms"
+            f"{len(latencies) / self.seconds:>10.2f}/s{self.http_requests / len(latencies):>11.1f}"
+        )
+
+
+def langchain_call(model_kwargs: dict) -> Callable[[], float]:
+    from langchain_community.llms.replicate import Replicate
+
+    llm = Replicate(model=ARCTIC_MODEL, model_kwargs=model_kwargs, streaming=True)
+
+    def call() -> float:
+        started = time.perf_counter()
+        first_token = None
+        extractor = JsonStreamExtractor()
+        with closing(llm.stream(PROMPT)) as chunks:
+            for chunk in chunks:
+                first_token = first_token or time.perf_counter() - started
+                if extractor.feed(chunk):
+                    break
+        return first_token
+
+    return call
+
+
+def sdk_call(model_kwargs: dict) -> Callable[[], float]:
+    import replicate
+
+    client = replicate.Client()
+
+    def call() -> float:
+        started = time.perf_counter()
+        first_token = None
+        extractor = JsonStreamExtractor()
+        prediction = client.models.predictions.create(ARCTIC_MODEL, input={**model_kwargs, "prompt": PROMPT})
+        for output in prediction.output_iterator():
+            first_token = first_token or time.perf_counter() - started
+            if extractor.feed(output):
+                prediction.cancel()
+                break
+        return first_token
+
+    return call
+
+
+def native_call(arctic_client: ArcticClient) -> Callable[[], float]:
+    def call() -> float:
+        arctic_client.invoke(PROMPT)
+        return arctic_client.recent_calls[-1].time_to_first_token
+
+    return call
+
+
+def measure(name: str, call: Callable[[], float], server: FakeReplicateServer, calls: int, concurrency: int) -> PathReport:
+    report = PathReport(name)
+    requests_before = server.http_requests
+
+    def timed() -> tuple[float, float]:
+        started = time.perf_counter()
+        first_token = call()
+        return time.perf_counter() - started, first_token
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        for latency, first_token in executor.map(lambda _: timed(), range(calls)):
+            report.latencies.append(latency)
+            report.first_tokens.append(first_token)
+    report.seconds = time.perf_counter() - started
+    report.http_requests = server.http_requests - requests_before
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=20, help="quizzes per path")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--time-to-first-token", type=float, default=0.3, help="median seconds")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    config = FakeReplicateConfig(
+        time_to_first_token=Latency(args.time_to_first_token, 0.3),
+        tokens_per_second=args.tokens_per_second,
+        seed=args.seed
+    )
+    with FakeReplicateServer(config) as server:
+        # read by the SDK, the LangChain wrapper and the native client
+        os.environ["REPLICATE_BASE_URL"] = server.base_url
+        os.environ.setdefault("REPLICATE_API_TOKEN", "dummy")
+
+        arctic_client = ArcticClient()
+        paths = {
+            "langchain": langchain_call(arctic_client.model_kwargs),
+            "sdk": sdk_call(arctic_client.model_kwargs),
+            "native": native_call(arctic_client),
+        }
+        print(f"{args.calls} quizzes per path, {args.concurrency} concurrent, fake server at {server.base_url}")
+        print(f"{'path':<10}{'p50':>11}{'p95':>11}{'TTFT p50':>11}{'throughput':>12}{'HTTP/call':>11}")
+        for name, call in paths.items():
+            print(measure(name, call, server, args.calls, args.concurrency).format())
+        arctic_client.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Cold start of the app: per-module import time and time to the first rendered START page.
+
+Renders the START page once with Streamlit's AppTest in a fresh interpreter, no request is sent upstream and the
+background warm-up is not started. The same report is printed by a running app started with
+ARCTIC_PROFILE_STARTUP=1.
+
+    poetry run python benchmarks/startup.py
+"""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "arctic_query_quest"))
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from startup import DEFAULT_REPORT_SIZE, ImportProfiler, startup  # noqa: E402
+
+MAIN_SCRIPT = str(Path(__file__).parent.parent / "arctic_query_quest" / "main.py")
+# the generation stack, only needed once QUIZ is entered
+GENERATION_MODULES = (
+    "langchain_community",
+    "langchain_core",
+    "replicate",
+    "httpx",
+    "google.cloud.texttospeech",
+    "google.oauth2",
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--limit", type=int, default=DEFAULT_REPORT_SIZE, help="number of modules to report")
+    args = parser.parse_args()
+
+    os.environ.setdefault("REPLICATE_API_TOKEN", "dummy")
+    # like in a running server, Streamlit is loaded before the app
+    import streamlit  # noqa: F401
+    from streamlit.testing.v1 import AppTest
+
+    profiler = ImportProfiler()
+    profiler.install()
+    at = AppTest.from_file(MAIN_SCRIPT, default_timeout=60)
+    startup.started = time.perf_counter()
+    with patch.object(startup, "warm_up"):
+        at.run()
+    profiler.uninstall()
+
+    if at.exception:
+        raise SystemExit(f"rendering the START page failed: {at.exception}")
+
+    print(f"time to first render: {startup.first_render_seconds * 1000:.0f}ms")
+    print(f"generation modules loaded by START: {[name for name in GENERATION_MODULES if name in sys.modules] or 'none'}")
+    print(profiler.format_report(args.limit))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,277 @@
+"""
+A local HTTP server speaking the subset of the Replicate API used by the app and by the LangChain wrapper.
+
+Replies and their timing come from `FakeReplicate`: the first token after the sampled time to first token, the rest
+at a steady rate. Predictions can be polled (`GET /v1/predictions/{id}`, what the SDK and the LangChain wrapper do)
+or streamed as server-sent events (`GET /v1/predictions/{id}/stream`, what `ReplicateStreamClient` does).
+
+    with FakeReplicateServer() as server:
+        client = ReplicateStreamClient(api_token="dummy", base_url=server.base_url)
+"""
+import json
+import re
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+from tests.fakes import CHARS_PER_TOKEN, FakeReplicate, FakeReplicateConfig, FakeUpstreamError
+
+MODEL_PATH = re.compile(r"^/v1/models/(?P<owner>[^/]+)/(?P<name>[^/]+)$")
+PREDICTIONS_PATH = re.compile(r"^/v1/models/(?P<owner>[^/]+)/(?P<name>[^/]+)/predictions$")
+PREDICTION_PATH = re.compile(r"^/v1/predictions/(?P<id>[^/]+)(?P<action>/stream|/cancel)?$")
+# the prompt is the first input of the model, like for Snowflake Arctic
+INPUT_SCHEMA = {"components": {"schemas": {"Input": {"properties": {"prompt": {"x-order": 0}}}}}}
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class ServerPrediction:
+
+    def __init__(self, server: "FakeReplicateServer", model: str, input: dict, text: str, time_to_first_token: float):
+        self.id = uuid.uuid4().hex
+        self.model = model
+        self.input = input
+        self.created_at = _now()
+        self._server = server
+        self._tokens = [text[start:start + CHARS_PER_TOKEN] for start in range(0, len(text), CHARS_PER_TOKEN)]
+        self._started = time.monotonic()
+        self._time_to_first_token = time_to_first_token
+        self._canceled_at: float | None = None
+        self._revealed = 0
+
+    def _available(self, now: float) -> int:
+        # number of tokens generated up to now
+        if self._canceled_at is not None:
+            now = min(now, self._canceled_at)
+        elapsed = now - self._started - self._time_to_first_token
+        if elapsed < 0:
+            return 0
+        tokens_per_second = self._server.replicate.config.tokens_per_second
+        if tokens_per_second <= 0:
+            return len(self._tokens)
+        return min(len(self._tokens), int(elapsed * tokens_per_second) + 1)
+
+    def _reveal(self, available: int):
+        with self._server.lock:
+            if available > self._revealed:
+                self._server.replicate.count(tokens=available - self._revealed)
+                self._revealed = available
+
+    @property
+    def status(self) -> str:
+        if self._canceled_at is not None:
+            return "canceled"
+        available = self._available(time.monotonic())
+        if available == len(self._tokens):
+            return "succeeded"
+        return "processing" if available else "starting"
+
+    def cancel(self):
+        if self._canceled_at is None:
+            self._canceled_at = time.monotonic()
+            self._server.replicate.count(cancels=1)
+
+    def payload(self) -> dict[str, Any]:
+        status = self.status
+        available = self._available(time.monotonic())
+        self._reveal(available)
+        base_url = self._server.base_url
+        return {
+            "id": self.id,
+            "model": self.model,
+            "version": "fake",
+            "status": status,
+            "input": self.input,
+            "output": self._tokens[:available] if available else None,
+            "logs": "",
+            "error": None,
+            "metrics": {},
+            "created_at": self.created_at,
+            "urls": {
+                "get": f"{base_url}/v1/predictions/{self.id}",
+                "cancel": f"{base_url}/v1/predictions/{self.id}/cancel",
+                "stream": f"{base_url}/v1/predictions/{self.id}/stream"
+            }
+        }
+
+    def events(self):
+        # yields the output tokens as they are generated, until the prediction succeeded or was canceled
+        sent = 0
+        while True:
+            now = time.monotonic()
+            available = self._available(now)
+            self._reveal(available)
+            for token in self._tokens[sent:available]:
+                yield "output", token
+            sent = available
+            if sent == len(self._tokens):
+                yield "done", "{}"
+                return
+            if self._canceled_at is not None:
+                yield "done", json.dumps({"reason": "canceled"})
+                return
+            time.sleep(self._next_token_delay(now, sent))
+
+    def _next_token_delay(self, now: float, sent: int) -> float:
+        tokens_per_second = self._server.replicate.config.tokens_per_second
+        due = self._started + self._time_to_first_token + (sent / tokens_per_second if tokens_per_second > 0 else 0)
+        return min(max(due - now, 0.001), 0.05)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps connections alive, every response has a length or is chunked
+    protocol_version = "HTTP/1.1"
+    server: "_Server"
+
+    def log_message(self, format: str, *args):
+        pass
+
+    def _json(self, status: int, payload: dict):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length)) if length else {}
+
+    def do_GET(self):
+        fake = self.server.fake
+        fake.count_request()
+        if match := MODEL_PATH.match(self.path):
+            return self._json(200, fake.model(match["owner"], match["name"]))
+        if (match := PREDICTION_PATH.match(self.path)) and match["action"] != "/cancel":
+            if (prediction := fake.predictions.get(match["id"])) is None:
+                return self._json(404, {"detail": "Not found."})
+            if match["action"] == "/stream":
+                return self._stream(prediction)
+            return self._json(200, prediction.payload())
+        self._json(404, {"detail": "Not found."})
+
+    def do_POST(self):
+        fake = self.server.fake
+        fake.count_request()
+        if match := PREDICTIONS_PATH.match(self.path):
+            body = self._read_json()
+            try:
+                prediction = fake.create(f"{match['owner']}/{match['name']}", body.get("input", {}))
+            except FakeUpstreamError as e:
+                return self._json(e.status, {"title": e.title, "detail": e.detail})
+            return self._json(201, prediction.payload())
+        if (match := PREDICTION_PATH.match(self.path)) and match["action"] == "/cancel":
+            self._read_json()
+            if (prediction := fake.predictions.get(match["id"])) is None:
+                return self._json(404, {"detail": "Not found."})
+            prediction.cancel()
+            return self._json(200, prediction.payload())
+        self._json(404, {"detail": "Not found."})
+
+    def _stream(self, prediction: ServerPrediction):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-store")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for event, data in prediction.events():
+                lines = "".join(f"data: {line}\n" for line in data.split("\n"))
+                self._chunk(f"event: {event}\n{lines}\n".encode("utf-8"))
+            self._chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            # the client went away mid-stream
+            self.close_connection = True
+
+    def _chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    fake: "FakeReplicateServer"
+
+    def handle_error(self, request, client_address):
+        # clients closing idle keep-alive connections are no errors
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+
+class FakeReplicateServer:
+
+    def __init__(self, config: FakeReplicateConfig | None = None, host: str = "127.0.0.1", port: int = 0):
+        self.replicate = FakeReplicate(config)
+        self.predictions: dict[str, ServerPrediction] = {}
+        self.lock = threading.Lock()
+        self.http_requests = 0
+        self._server = _Server((host, port), _Handler)
+        self._server.fake = self
+        self._thread: threading.Thread | None = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count_request(self):
+        with self.lock:
+            self.http_requests += 1
+
+    def model(self, owner: str, name: str) -> dict[str, Any]:
+        return {
+            "url": f"{self.base_url}/{owner}/{name}",
+            "owner": owner,
+            "name": name,
+            "description": None,
+            "visibility": "public",
+            "github_url": None,
+            "paper_url": None,
+            "license_url": None,
+            "run_count": 0,
+            "cover_image_url": None,
+            "default_example": None,
+            "latest_version": {
+                "id": "fake",
+                "created_at": _now(),
+                "cog_version": "0.9.0",
+                "openapi_schema": INPUT_SCHEMA
+            }
+        }
+
+    def create(self, model: str, input: dict) -> ServerPrediction:
+        fake_prediction = self.replicate.create_prediction(input.get("prompt", ""), input.get("max_new_tokens"))
+        prediction = ServerPrediction(
+            self,
+            model,
+            input,
+            fake_prediction._text,
+            self.replicate.sample(self.replicate.config.time_to_first_token)
+        )
+        with self.lock:
+            self.predictions[prediction.id] = prediction
+        return prediction
+
+    def start(self) -> "FakeReplicateServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-replicate", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> "FakeReplicateServer":
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
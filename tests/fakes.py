@@ -0,0 +1,332 @@
+"""
+Local stand-ins for Replicate and Google Text-to-Speech, used by the load test and the tests.
+
+The fakes mimic the small API surface the app relies on (`ReplicateStreamClient.create`, `stream` and `cancel`
+and `TextToSpeechClient.synthesize_speech`, plus their async variants) and never open a network connection. The
+Replicate SDK surface (`client.models.predictions.create` with a streaming `output_iterator`) is kept for the
+local fake server.
+"""
+import asyncio
+import json
+import math
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Iterator
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from replicate.exceptions import ReplicateError
+
+BATCH_PATTERN = re.compile(r"JSON array of (\d+) objects")
+CHARS_PER_TOKEN = 4
+
+
+def create_private_key() -> str:
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    return key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption()
+    ).decode()
+
+
+@dataclass(frozen=True)
+class Latency:
+    # log-normal distribution, which resembles the long tail of real upstream latencies
+    median: float
+    sigma: float = 0.0
+
+    def sample(self, rng: random.Random) -> float:
+        if self.median <= 0:
+            return 0.0
+        return self.median * math.exp(rng.gauss(0, self.sigma)) if self.sigma else self.median
+
+
+@dataclass
+class FakeReplicateConfig:
+    time_to_first_token: Latency = field(default_factory=lambda: Latency(0.3, 0.5))
+    tokens_per_second: float = 400.0
+    malformed_rate: float = 0.0
+    error_rate: float = 0.0
+    error_status: int = 503
+    seed: int | None = None
+
+
+@dataclass
+class FakeTextToSpeechConfig:
+    latency: Latency = field(default_factory=lambda: Latency(0.2, 0.3))
+    error_rate: float = 0.0
+    error_status: int = 503
+    seed: int | None = None
+
+
+@dataclass
+class UpstreamCalls:
+    requests: int = 0
+    errors: int = 0
+    malformed: int = 0
+    tokens: int = 0
+    cancels: int = 0
+
+
+class FakeUpstreamError(ReplicateError):
+    pass
+
+
+VOCABULARY = (
+    "customers", "orders", "products", "categories", "prices", "totals", "dates", "names", "players", "scores",
+    "books", "authors", "genres", "ratings", "distinct", "grouped", "sorted", "filtered", "joined", "aggregated",
+    "latest", "cheapest", "missing", "duplicate", "average", "maximum", "minimum", "monthly", "active", "top"
+)
+
+
+def fake_quiz(rng: random.Random) -> dict:
+    # random wording, so separate generations are no near-duplicates of each other
+    return {
+        "question": f"Which `JOIN` returns the {' '.join(rng.sample(VOCABULARY, 8))} rows?",
+        "answer_1": "`INNER JOIN`",
+        "answer_2": "`LEFT JOIN`",
+        "answer_3": "`CROSS JOIN`",
+        "correct_answer": 1,
+        "explanation": "An `INNER JOIN` only keeps rows with a match on both sides of the join condition."
+    }
+
+
+class FakePrediction:
+
+    def __init__(self, replicate: "FakeReplicate", prediction_id: str, text: str):
+        self.id = prediction_id
+        self.status = "starting"
+        self.created_seconds = 0.0
+        self._replicate = replicate
+        self._text = text
+        self._canceled = threading.Event()
+
+    def output_iterator(self) -> Iterator[str]:
+        config = self._replicate.config
+        # the first token is delayed by queueing and prompt processing, the rest follows at a steady rate
+        if self._canceled.wait(self._replicate.sample(config.time_to_first_token)):
+            return
+
+        self.status = "processing"
+        interval = 1 / config.tokens_per_second if config.tokens_per_second > 0 else 0.0
+        for start in range(0, len(self._text), CHARS_PER_TOKEN):
+            if self._canceled.is_set():
+                return
+            self._replicate.count(tokens=1)
+            yield self._text[start:start + CHARS_PER_TOKEN]
+            if interval:
+                time.sleep(interval)
+
+        self.status = "succeeded"
+
+    async def async_output_iterator(self) -> AsyncIterator[str]:
+        config = self._replicate.config
+        await asyncio.sleep(self._replicate.sample(config.time_to_first_token))
+
+        self.status = "processing"
+        interval = 1 / config.tokens_per_second if config.tokens_per_second > 0 else 0.0
+        for start in range(0, len(self._text), CHARS_PER_TOKEN):
+            if self._canceled.is_set():
+                return
+            self._replicate.count(tokens=1)
+            yield self._text[start:start + CHARS_PER_TOKEN]
+            await asyncio.sleep(interval)
+
+        self.status = "succeeded"
+
+    async def async_cancel(self):
+        self.cancel()
+
+    def cancel(self):
+        if not self._canceled.is_set():
+            self._canceled.set()
+            self.status = "canceled"
+            self._replicate.count(cancels=1)
+
+
+class _Predictions:
+
+    def __init__(self, replicate: "FakeReplicate"):
+        self._replicate = replicate
+
+    def create(self, model: str, input: dict, **kwargs) -> FakePrediction:
+        return self._replicate.create_prediction(input["prompt"], input.get("max_new_tokens"))
+
+    async def async_create(self, model: str, input: dict, **kwargs) -> FakePrediction:
+        return self._replicate.create_prediction(input["prompt"], input.get("max_new_tokens"))
+
+
+class _Models:
+
+    def __init__(self, replicate: "FakeReplicate"):
+        self.predictions = _Predictions(replicate)
+
+
+class FakeReplicate:
+
+    def __init__(self, config: FakeReplicateConfig | None = None):
+        self.config = config or FakeReplicateConfig()
+        self.models = _Models(self)
+        self._rng = random.Random(self.config.seed)
+        self._lock = threading.Lock()
+        self._calls = UpstreamCalls()
+
+    def sample(self, latency: Latency) -> float:
+        with self._lock:
+            return latency.sample(self._rng)
+
+    def chance(self, rate: float) -> bool:
+        with self._lock:
+            return self._rng.random() < rate
+
+    def count(self, **increments: int):
+        with self._lock:
+            for name, value in increments.items():
+                setattr(self._calls, name, getattr(self._calls, name) + value)
+
+    def calls(self) -> UpstreamCalls:
+        with self._lock:
+            return UpstreamCalls(**vars(self._calls))
+
+    def create(self, model: str, input: dict) -> FakePrediction:
+        return self.create_prediction(input["prompt"], input.get("max_new_tokens"))
+
+    async def acreate(self, model: str, input: dict) -> FakePrediction:
+        return self.create_prediction(input["prompt"], input.get("max_new_tokens"))
+
+    def stream(self, prediction: FakePrediction) -> Iterator[str]:
+        return prediction.output_iterator()
+
+    def astream(self, prediction: FakePrediction) -> AsyncIterator[str]:
+        return prediction.async_output_iterator()
+
+    def cancel(self, prediction: FakePrediction):
+        prediction.cancel()
+
+    async def acancel(self, prediction: FakePrediction):
+        prediction.cancel()
+
+    def healthy(self) -> bool:
+        return True
+
+    def close(self):
+        pass
+
+    async def aclose(self):
+        pass
+
+    def create_prediction(self, prompt: str, max_new_tokens: int | None = None) -> FakePrediction:
+        self.count(requests=1)
+        prediction_id = f"fake-{self.calls().requests}"
+
+        if self.chance(self.config.error_rate):
+            self.count(errors=1)
+            raise FakeUpstreamError(title="Injected error", status=self.config.error_status, detail=prediction_id)
+
+        with self._lock:
+            if match := BATCH_PATTERN.search(prompt):
+                payload = [fake_quiz(self._rng) for _ in range(int(match.group(1)))]
+            else:
+                payload = fake_quiz(self._rng)
+        text = f"Here is the generated quiz:\n{json.dumps(payload, indent=4)}\n"
+
+        if self.chance(self.config.malformed_rate):
+            # a truncated reply, like a generation which ran into the token limit
+            self.count(malformed=1)
+            text = text[:len(text) // 2]
+
+        if max_new_tokens is not None:
+            # the reply stops at the token limit, like the real model
+            text = text[:max_new_tokens * CHARS_PER_TOKEN]
+
+        return FakePrediction(self, prediction_id, text)
+
+
+@dataclass
+class FakeSynthesizeSpeechResponse:
+    audio_content: bytes
+
+
+class _FakeTransport:
+
+    def close(self):
+        pass
+
+
+class _FakeAsyncTransport:
+
+    async def close(self):
+        pass
+
+
+class FakeTextToSpeech:
+
+    def __init__(self, config: FakeTextToSpeechConfig | None = None):
+        self.config = config or FakeTextToSpeechConfig()
+        self.transport = _FakeTransport()
+        self._rng = random.Random(self.config.seed)
+        self._lock = threading.Lock()
+        self._calls = UpstreamCalls()
+
+    def calls(self) -> UpstreamCalls:
+        with self._lock:
+            return UpstreamCalls(**vars(self._calls))
+
+    def _request(self) -> tuple[float, bool]:
+        with self._lock:
+            self._calls.requests += 1
+            delay = self.config.latency.sample(self._rng)
+            failed = self._rng.random() < self.config.error_rate
+            if failed:
+                self._calls.errors += 1
+        return delay, failed
+
+    def _response(self, input, failed: bool) -> FakeSynthesizeSpeechResponse:
+        if failed:
+            raise FakeUpstreamError(title="Injected error", status=self.config.error_status)
+        # an empty ID3v2.4 tag followed by the text in place of the MP3 frames
+        return FakeSynthesizeSpeechResponse(audio_content=b"ID3\x04\x00\x00\x00\x00\x00\x00" + input.text.encode("utf-8"))
+
+    def synthesize_speech(self, input, voice, audio_config, **kwargs) -> FakeSynthesizeSpeechResponse:
+        delay, failed = self._request()
+        time.sleep(delay)
+        return self._response(input, failed)
+
+    def asynchronous(self) -> "FakeTextToSpeechAsync":
+        return FakeTextToSpeechAsync(self)
+
+
+class FakeTextToSpeechAsync:
+
+    def __init__(self, text_to_speech: FakeTextToSpeech):
+        self._text_to_speech = text_to_speech
+        self.transport = _FakeAsyncTransport()
+
+    async def synthesize_speech(self, input, voice, audio_config, **kwargs) -> FakeSynthesizeSpeechResponse:
+        delay, failed = self._text_to_speech._request()
+        await asyncio.sleep(delay)
+        return self._text_to_speech._response(input, failed)
+
+
+@contextmanager
+def fake_backends(arctic_client, tts_client, replicate: FakeReplicate, text_to_speech: FakeTextToSpeech):
+    # swap the upstream clients of live instances, everything holding a reference to them uses the fakes
+    replacements = [
+        (arctic_client, "client", replicate),
+        (arctic_client, "async_client", replicate),
+        (tts_client, "client", text_to_speech),
+        (tts_client, "async_client", text_to_speech.asynchronous()),
+    ]
+    originals = [(instance, name, getattr(instance, name)) for instance, name, _ in replacements]
+    for instance, name, fake in replacements:
+        setattr(instance, name, fake)
+    try:
+        yield
+    finally:
+        for instance, name, original in originals:
+            setattr(instance, name, original)
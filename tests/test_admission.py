@@ -0,0 +1,190 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from arctic_query_quest.admission import (
+    AdmissionController,
+    AdmissionRejected,
+    TokenBucket,
+    admission_session,
+    current_session
+)
+from arctic_query_quest.event_loop import BackgroundLoop
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def test_refill_up_to_burst(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=2.0, burst=2, clock=clock)
+
+        self.assertTrue(bucket.try_take())
+        self.assertTrue(bucket.try_take())
+        self.assertFalse(bucket.try_take())
+        self.assertAlmostEqual(bucket.time_until(1), 0.5)
+
+        clock.now = 10.0
+        self.assertEqual(bucket.available(), 2)
+
+
+class TestAdmissionController(unittest.TestCase):
+
+    def test_max_in_flight(self):
+        admission = AdmissionController("test", rate=1000, burst=1000, max_in_flight=2, deadline=5.0)
+        in_flight = []
+        peak = []
+        lock = threading.Lock()
+
+        def call():
+            with admission.admit():
+                with lock:
+                    in_flight.append(1)
+                    peak.append(len(in_flight))
+                time.sleep(0.05)
+                with lock:
+                    in_flight.pop()
+
+        threads = [threading.Thread(target=call) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(max(peak), 2)
+        stats = admission.stats()
+        self.assertEqual(stats.admitted, 6)
+        self.assertEqual(stats.in_flight, 0)
+        self.assertEqual(stats.queued, 0)
+
+    def test_sessions_are_served_round_robin(self):
+        admission = AdmissionController("test", rate=1000, burst=1000, max_in_flight=1, deadline=5.0)
+        order = []
+        queued = threading.Barrier(6)
+        release = threading.Event()
+
+        def blocker():
+            with admission.admit():
+                release.wait()
+
+        def call(session_id: str, number: int):
+            with admission_session(session_id):
+                queued.wait()
+                # the greedy session enqueues first, the second session must not wait for all of it
+                time.sleep(0.01 if session_id == "greedy" else 0.05 + number * 0.01)
+                with admission.admit():
+                    order.append(session_id)
+
+        blocking = threading.Thread(target=blocker)
+        blocking.start()
+        threads = [threading.Thread(target=call, args=("greedy", number)) for number in range(4)]
+        threads += [threading.Thread(target=call, args=("polite", number)) for number in range(2)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.3)
+        release.set()
+        for thread in [blocking, *threads]:
+            thread.join()
+
+        self.assertEqual(order[:4], ["greedy", "polite", "greedy", "polite"])
+
+    def test_reports_queue_position(self):
+        admission = AdmissionController("test", rate=1000, burst=1000, max_in_flight=1, deadline=5.0)
+        positions = []
+        release = threading.Event()
+
+        def blocker():
+            with admission.admit():
+                release.wait()
+
+        blocking = threading.Thread(target=blocker)
+        blocking.start()
+        threading.Timer(0.3, release.set).start()
+
+        with admission_session("session", on_wait=positions.append):
+            with admission.admit():
+                pass
+        blocking.join()
+
+        self.assertEqual(positions[0].position, 1)
+        self.assertEqual(positions[0].name, "test")
+
+    def test_sheds_calls_past_deadline(self):
+        admission = AdmissionController("test", rate=1, burst=1, max_in_flight=10, deadline=0.5)
+
+        with admission.admit():
+            pass
+        # the next token is a second away, past the deadline
+        with self.assertRaises(AdmissionRejected) as context:
+            with admission.admit():
+                pass
+
+        self.assertGreater(context.exception.estimated_wait, 0.5)
+        self.assertEqual(admission.stats().shed, 1)
+        self.assertEqual(admission.stats().queued, 0)
+
+    def test_times_out_waiting_for_slot(self):
+        admission = AdmissionController("test", rate=1000, burst=1000, max_in_flight=1, deadline=0.2)
+        release = threading.Event()
+
+        def blocker():
+            with admission.admit():
+                release.wait()
+
+        blocking = threading.Thread(target=blocker)
+        blocking.start()
+        time.sleep(0.05)
+        try:
+            with self.assertRaises(AdmissionRejected):
+                with admission.admit():
+                    pass
+        finally:
+            release.set()
+            blocking.join()
+
+        self.assertEqual(admission.stats().timed_out, 1)
+
+    def test_async_admit(self):
+        admission = AdmissionController("test", rate=1000, burst=1000, max_in_flight=3, deadline=5.0)
+        in_flight = 0
+        peak = 0
+
+        async def call():
+            nonlocal in_flight, peak
+            async with admission.aadmit():
+                in_flight += 1
+                peak = max(peak, in_flight)
+                await asyncio.sleep(0.02)
+                in_flight -= 1
+
+        async def call_all():
+            await asyncio.gather(*(call() for _ in range(12)))
+
+        asyncio.run(call_all())
+
+        self.assertEqual(peak, 3)
+        self.assertEqual(admission.stats().admitted, 12)
+
+    def test_session_is_carried_to_background_loop(self):
+        background_loop = BackgroundLoop(name="test-admission")
+        self.addCleanup(background_loop.stop)
+
+        async def session_id():
+            return current_session.get().session_id
+
+        with admission_session("session"):
+            self.assertEqual(background_loop.run(session_id(), timeout=2), "session")
+        self.assertIsNone(current_session.get())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -21,7 +21,6 @@ class TestApp(unittest.TestCase):
             "score",
             "app_state",
             "db_model",
-            "generated_quiz",
             "user_answer",
             "difficulty"
         ]
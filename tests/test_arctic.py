@@ -1,7 +1,9 @@
 import os
 import unittest
+from unittest.mock import MagicMock
 
-from arctic_query_quest.arctic import ArcticClient, ArcticQuiz
+from arctic_query_quest.arctic import ArcticClient, ArcticQuiz, QuizFieldScanner
+from arctic_query_quest.replicate_stream import StreamedPrediction
 
 
 class TestArctic(unittest.TestCase):
@@ -50,6 +52,113 @@ class TestArctic(unittest.TestCase):
         self.assertEqual(arctic_quiz.correct_answer, 1)
         self.assertEqual(arctic_quiz.explanation, "SQL stands for Structured Query Language")
 
+    def test_scan_fields_progressively(self):
+        chunks = [
+            'Here is the generated quiz:\n{\n    "question": "What st',
+            'ands \\"SQL\\" ',
+            'for?",\n    "answer_1": "Structured Query Language",',
+            '\n    "answer_2": "Standard Query Language",\n    "answer_3": "Simple Query Language",',
+            '\n    "correct_answer": 1,\n    "explanation": "SQL stands for Structured Query Language"\n}'
+        ]
+
+        scanner = QuizFieldScanner()
+        events = [scanner.feed(chunk) for chunk in chunks]
+
+        deltas = "".join(event.delta for batch in events for event in batch if event.field == "question")
+        self.assertEqual(deltas, 'What stands "SQL" for?')
+        self.assertEqual([event.delta for event in events[0]], ["What st"])
+
+        completed = [event.field for batch in events for event in batch if event.complete]
+        self.assertEqual(completed[0], "question")
+        self.assertEqual(
+            sorted(completed),
+            sorted(["question", "answer_1", "answer_2", "answer_3", "correct_answer", "explanation"])
+        )
+        self.assertEqual(scanner.completed["correct_answer"], 1)
+
+    def test_invoke_stops_stream_after_first_object(self):
+        chunks = [
+            "Here is the generated quiz:\n{",
+            '"question": "What stands SQL for?", "answer_1": "Structured Query Language", ',
+            '"answer_2": "Standard Query Language", "answer_3": "Simple Query Language", ',
+            '"correct_answer": 1, "explanation": "SQL stands for Structured Query Language"}',
+            "\nSome more text",
+            "\nand even more text"
+        ]
+        consumed = []
+
+        def output_iterator():
+            for chunk in chunks:
+                consumed.append(chunk)
+                yield chunk
+
+        os.environ["REPLICATE_API_TOKEN"] = "dummy"
+        arctic_client: ArcticClient = ArcticClient()
+        arctic_client.client = MagicMock()
+        arctic_client.client.create.return_value = StreamedPrediction("prediction", "/stream", "/cancel")
+        arctic_client.client.stream.side_effect = lambda prediction: output_iterator()
+
+        arctic_quiz: ArcticQuiz = arctic_client.invoke("prompt")
+
+        self.assertEqual(arctic_quiz.correct_answer, 1)
+        self.assertEqual(consumed, chunks[:4])
+        arctic_client.client.cancel.assert_called_once()
+        usage = arctic_client.recent_calls[-1]
+        self.assertEqual(usage.chunks, 4)
+        self.assertTrue(usage.canceled)
+        self.assertIsNotNone(usage.time_to_first_token)
+
+    def test_failed_cancel_keeps_the_quiz(self):
+        chunks = [
+            '{"question": "What stands SQL for?", "answer_1": "Structured Query Language", ',
+            '"answer_2": "Standard Query Language", "answer_3": "Simple Query Language", ',
+            '"correct_answer": 1, "explanation": "SQL stands for Structured Query Language"}',
+            "\nSome more text"
+        ]
+
+        os.environ["REPLICATE_API_TOKEN"] = "dummy"
+        arctic_client: ArcticClient = ArcticClient()
+        arctic_client.client = MagicMock()
+        arctic_client.client.create.return_value = StreamedPrediction("prediction", "/stream", "/cancel")
+        arctic_client.client.stream.return_value = (chunk for chunk in chunks)
+        arctic_client.client.cancel.side_effect = ConnectionError("reset")
+
+        with self.assertLogs("arctic_query_quest.arctic", level="WARNING"):
+            arctic_quiz: ArcticQuiz = arctic_client.invoke("prompt")
+
+        self.assertEqual(arctic_quiz.correct_answer, 1)
+        arctic_client.client.cancel.assert_called_once()
+
+    def test_scan_fails_fast_on_invalid_field(self):
+        scanner = QuizFieldScanner()
+        with self.assertRaises(ValueError):
+            scanner.feed('{"question": "What stands SQL for?", "correct_answer": "first",')
+
+    def test_invoke_batch_drops_invalid_items(self):
+        chunks = [
+            'Here are your quizzes:\n[{"question": "What stands SQL for?", "answer_1": "Structured Query Language", ',
+            '"answer_2": "Standard Query Language", "answer_3": "Simple Query Language", "correct_answer": 1, ',
+            '"explanation": "SQL stands for Structured Query Language"}, {"question": "Incomplete quiz"}, ',
+            '{"question": "What does `COUNT(*)` return?", "answer_1": "Number of rows", "answer_2": "Sum of values", ',
+            '"answer_3": "Number of columns", "correct_answer": 1, "explanation": "It counts rows"}]',
+            "\nSome more text"
+        ]
+
+        os.environ["REPLICATE_API_TOKEN"] = "dummy"
+        arctic_client: ArcticClient = ArcticClient()
+        arctic_client.client = MagicMock()
+        arctic_client.client.create.return_value = StreamedPrediction("prediction", "/stream", "/cancel")
+        arctic_client.client.stream.return_value = (chunk for chunk in chunks)
+
+        quiz_batch = arctic_client.invoke_batch("prompt", 3)
+
+        self.assertEqual([quiz.question for quiz in quiz_batch.quizzes], ["What stands SQL for?", "What does `COUNT(*)` return?"])
+        self.assertEqual(quiz_batch.stats.requested, 3)
+        self.assertEqual(quiz_batch.stats.dropped, 1)
+        self.assertEqual(quiz_batch.stats.estimated_output_tokens, 5)
+        self.assertGreater(quiz_batch.stats.estimated_tokens_per_quiz, 0)
+        arctic_client.client.cancel.assert_called_once()
+
 
 if __name__ == '__main__':
     unittest.main()
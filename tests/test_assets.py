@@ -0,0 +1,80 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+from arctic_query_quest.assets import AssetRegistry
+from arctic_query_quest.prompt import Difficulty, PromptGenerator
+
+
+class TestAssetRegistry(unittest.TestCase):
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.base_path = Path(tmp_dir.name)
+
+        (self.base_path / "templates" / "difficulty").mkdir(parents=True)
+        (self.base_path / "models").mkdir()
+        (self.base_path / "templates" / "prompt.jinja").write_text("{{ model }} | {{ difficulty }} | {{ count }}")
+        for difficulty in Difficulty:
+            (self.base_path / "templates" / "difficulty" / difficulty.value).write_text(difficulty.name.lower())
+        (self.base_path / "models" / "shop.sql").write_text("CREATE TABLE product (id INTEGER);")
+
+    def write(self, path: str, text: str):
+        file = self.base_path / path
+        mtime_ns = file.stat().st_mtime_ns
+        file.write_text(text)
+        os.utime(file, ns=(mtime_ns + 1_000_000_000, mtime_ns + 1_000_000_000))
+
+    def test_preload_and_compile_once(self):
+        asset_registry = AssetRegistry(str(self.base_path), check_interval=3600)
+        asset_registry.preload()
+
+        self.assertEqual(asset_registry.text("models/shop.sql"), "CREATE TABLE product (id INTEGER);")
+        self.assertIs(asset_registry.template("templates/prompt.jinja"), asset_registry.template("templates/prompt.jinja"))
+
+    def test_invalidate_only_on_content_change(self):
+        asset_registry = AssetRegistry(str(self.base_path), check_interval=3600)
+        asset_registry.preload()
+        template = asset_registry.template("templates/prompt.jinja")
+
+        self.write("templates/prompt.jinja", "{{ model }} | {{ difficulty }} | {{ count }}")
+        self.assertFalse(asset_registry.refresh())
+        self.assertIs(asset_registry.template("templates/prompt.jinja"), template)
+
+        self.write("models/shop.sql", "CREATE TABLE customer (id INTEGER);")
+        self.assertTrue(asset_registry.refresh())
+        self.assertEqual(asset_registry.version, 1)
+        self.assertEqual(asset_registry.text("models/shop.sql"), "CREATE TABLE customer (id INTEGER);")
+
+    def test_json_is_parsed_once(self):
+        (self.base_path / "animations").mkdir()
+        (self.base_path / "animations" / "start.json").write_text('{"v": "5.7.4", "layers": []}')
+        asset_registry = AssetRegistry(str(self.base_path), check_interval=3600)
+        asset_registry.preload()
+
+        animation = asset_registry.json("animations/start.json")
+        self.assertEqual(animation, {"v": "5.7.4", "layers": []})
+        self.assertIs(asset_registry.json("animations/start.json"), animation)
+
+        self.write("animations/start.json", '{"v": "5.7.4", "layers": [{}]}')
+        asset_registry.refresh()
+        self.assertEqual(asset_registry.json("animations/start.json"), {"v": "5.7.4", "layers": [{}]})
+
+    def test_prompts_are_rendered_once_and_invalidated(self):
+        asset_registry = AssetRegistry(str(self.base_path), check_interval=3600)
+        prompt_generator = PromptGenerator(asset_registry)
+        prompt_generator.warm_up(["MODEL"])
+
+        prompt = prompt_generator.generate_prompt("MODEL", Difficulty.HARD)
+        self.assertEqual(prompt, "MODEL | hard | 1")
+        self.assertIs(prompt_generator.generate_prompt("MODEL", Difficulty.HARD), prompt)
+
+        self.write("templates/difficulty/hard.jinja", "very hard")
+        asset_registry.refresh()
+        self.assertEqual(prompt_generator.generate_prompt("MODEL", Difficulty.HARD), "MODEL | very hard | 1")
+
+
+if __name__ == '__main__':
+    unittest.main()
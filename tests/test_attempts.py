@@ -0,0 +1,112 @@
+import threading
+import time
+import unittest
+
+from arctic_query_quest.attempts import AttemptRegistry, new_attempt_id
+from arctic_query_quest.prompt import Difficulty
+
+
+class TestAttemptRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.attempts = AttemptRegistry(max_workers=4)
+        self.addCleanup(self.attempts.shutdown)
+
+    def test_single_flight(self):
+        calls = []
+        release = threading.Event()
+
+        def produce(attempt):
+            calls.append(attempt.attempt_id)
+            release.wait(2)
+            return "quiz"
+
+        attempt_id = new_attempt_id()
+        attempt, reused = self.attempts.start(attempt_id, "Shop", Difficulty.EASY, produce)
+        # a rerun while the quiz is still generated attaches to the running production
+        rerun, rerun_reused = self.attempts.start(attempt_id, "Shop", Difficulty.EASY, produce)
+        release.set()
+
+        self.assertFalse(reused)
+        self.assertTrue(rerun_reused)
+        self.assertIs(rerun, attempt)
+        self.assertEqual(attempt.future.result(timeout=2), "quiz")
+        self.assertEqual(len(calls), 1)
+
+        stats = self.attempts.stats()
+        self.assertEqual(stats.started, 1)
+        self.assertEqual(stats.reused, 1)
+        self.assertEqual(stats.active, 0)
+
+    def test_events_are_replayed(self):
+        release = threading.Event()
+
+        def produce(attempt):
+            attempt.emit("delta", "Which ")
+            attempt.emit("delta", "table?")
+            release.wait(2)
+            attempt.emit("question")
+            return "quiz"
+
+        attempt, _ = self.attempts.start(new_attempt_id(), "Shop", Difficulty.EASY, produce)
+        threading.Timer(0.1, release.set).start()
+
+        first = [(event.kind, event.value) for event in attempt.events()]
+        # a later run sees the same events, without waiting
+        second = [(event.kind, event.value) for event in attempt.events()]
+
+        expected = [("delta", "Which "), ("delta", "table?"), ("question", None)]
+        self.assertEqual(first, expected)
+        self.assertEqual(second, expected)
+
+    def test_events_time_out(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        def produce(attempt):
+            attempt.emit("progress", "pool")
+            release.wait(2)
+            return "quiz"
+
+        attempt, _ = self.attempts.start(new_attempt_id(), "Shop", Difficulty.EASY, produce)
+        events = []
+
+        with self.assertRaises(TimeoutError):
+            for event in attempt.events(timeout=0.1):
+                events.append(event.kind)
+        self.assertEqual(events, ["progress"])
+
+    def test_errors_are_kept(self):
+        def produce(attempt):
+            raise ValueError("no quiz")
+
+        attempt, _ = self.attempts.start(new_attempt_id(), "Shop", Difficulty.EASY, produce)
+
+        self.assertEqual(list(attempt.events()), [])
+        with self.assertRaises(ValueError):
+            attempt.future.result(timeout=2)
+
+    def test_finished_attempts_expire(self):
+        attempts = AttemptRegistry(max_attempts=2, ttl=0.05)
+        self.addCleanup(attempts.shutdown)
+        release = threading.Event()
+
+        finished, _ = attempts.start("finished", "Shop", Difficulty.EASY, lambda attempt: "quiz")
+        finished.future.result(timeout=2)
+        running, _ = attempts.start("running", "Shop", Difficulty.EASY, lambda attempt: release.wait(2))
+        time.sleep(0.1)
+
+        self.assertIsNone(attempts.get("finished"))
+        # running attempts are kept until they are done
+        self.assertIs(attempts.get("running"), running)
+        release.set()
+
+    def test_record_saved(self):
+        self.attempts.record_saved(7)
+        self.attempts.record_saved(3)
+
+        self.assertEqual(self.attempts.stats().calls_saved, 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from arctic_query_quest.audio_cache import AudioCache, cache_key
+
+
+class TestAudioCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+
+    def test_cache_key_depends_on_all_parts(self):
+        self.assertEqual(cache_key(b"text", b"voice"), cache_key(b"text", b"voice"))
+        self.assertNotEqual(cache_key(b"text", b"voice"), cache_key(b"text", b"other voice"))
+        self.assertNotEqual(cache_key(b"ab", b"c"), cache_key(b"a", b"bc"))
+
+    def test_memory_and_disk_hits(self):
+        audio_cache = AudioCache(self.tmp_dir.name)
+        key = cache_key(b"What stands SQL for?")
+
+        self.assertIsNone(audio_cache.get(key))
+        audio_cache.put(key, b"mp3")
+        self.assertEqual(audio_cache.get(key), b"mp3")
+
+        reopened_cache = AudioCache(self.tmp_dir.name)
+        self.assertEqual(reopened_cache.get(key), b"mp3")
+        self.assertEqual(reopened_cache.get(key), b"mp3")
+
+        stats = reopened_cache.stats()
+        self.assertEqual(stats.disk_hits, 1)
+        self.assertEqual(stats.memory_hits, 1)
+        self.assertEqual(stats.bytes_stored, 3)
+        self.assertEqual(audio_cache.stats().misses, 1)
+
+    def test_lru_eviction(self):
+        audio_cache = AudioCache(self.tmp_dir.name, max_bytes=10, memory_max_bytes=0)
+        keys = [cache_key(str(i).encode()) for i in range(3)]
+
+        audio_cache.put(keys[0], b"aaaa")
+        audio_cache.put(keys[1], b"bbbb")
+        audio_cache.get(keys[0])
+        audio_cache.put(keys[2], b"cccc")
+
+        self.assertEqual(audio_cache.get(keys[0]), b"aaaa")
+        self.assertIsNone(audio_cache.get(keys[1]))
+        self.assertEqual(audio_cache.get(keys[2]), b"cccc")
+
+        stats = audio_cache.stats()
+        self.assertEqual(stats.evictions, 1)
+        self.assertEqual(stats.bytes_stored, 8)
+        self.assertEqual(list(Path(self.tmp_dir.name).glob("*/*.tmp")), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import tempfile
+import unittest
+
+from arctic_query_quest.arctic import ArcticQuiz
+from arctic_query_quest.corpus import QuizCorpus, hamming_distance, simhash
+from arctic_query_quest.pool import PooledQuiz
+from arctic_query_quest.prompt import Difficulty
+
+
+def create_quiz(question: str, answers: tuple[str, str, str] = ("`WHERE`", "`HAVING`", "`GROUP BY`")) -> PooledQuiz:
+    return PooledQuiz(
+        quiz=ArcticQuiz(
+            question=question,
+            answer_1=answers[0],
+            answer_2=answers[1],
+            answer_3=answers[2],
+            correct_answer=1,
+            explanation="`WHERE` filters rows before they are grouped"
+        ),
+        speech_question=question.encode("utf-8")
+    )
+
+
+FILTER_QUESTION = "Which SQL clause is used to filter rows of the `product` table by price before grouping them?"
+FILTER_QUESTION_REPHRASED = "Which SQL clause is used to filter the rows of the `product` table by price before grouping?"
+COUNT_QUESTION = "How many customers have placed at least one order in the `shop_order` table?"
+
+
+class TestQuizCorpus(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.path = f"{self.tmp_dir.name}/corpus.sqlite"
+        self.corpus = QuizCorpus(self.path)
+        self.addCleanup(self.corpus.close)
+
+    def test_simhash_distance(self):
+        self.assertLessEqual(hamming_distance(simhash(FILTER_QUESTION), simhash(FILTER_QUESTION_REPHRASED)), 7)
+        self.assertGreater(hamming_distance(simhash(FILTER_QUESTION), simhash(COUNT_QUESTION)), 7)
+
+    def test_near_duplicates_are_rejected(self):
+        quiz_id = self.corpus.add("Shop", Difficulty.EASY, create_quiz(FILTER_QUESTION))
+
+        self.assertEqual(self.corpus.add("Shop", Difficulty.MEDIUM, create_quiz(FILTER_QUESTION_REPHRASED)), quiz_id)
+        self.assertNotEqual(self.corpus.add("Game", Difficulty.EASY, create_quiz(FILTER_QUESTION_REPHRASED)), quiz_id)
+        self.assertNotEqual(self.corpus.add("Shop", Difficulty.EASY, create_quiz(COUNT_QUESTION, ("1", "2", "3"))), quiz_id)
+
+        stats = self.corpus.stats()
+        self.assertEqual(stats.inserts, 3)
+        self.assertEqual(stats.duplicates, 1)
+
+    def test_sampling_skips_seen_quizzes(self):
+        first = self.corpus.add("Shop", Difficulty.EASY, create_quiz(FILTER_QUESTION))
+        second = self.corpus.add("Shop", Difficulty.EASY, create_quiz(COUNT_QUESTION, ("1", "2", "3")))
+
+        seen = {first}
+        corpus_quiz = self.corpus.sample("Shop", Difficulty.EASY, seen)
+        self.assertEqual(corpus_quiz.id, second)
+        self.assertEqual(corpus_quiz.pooled_quiz.quiz.question, COUNT_QUESTION)
+        self.assertEqual(corpus_quiz.pooled_quiz.speech_question, COUNT_QUESTION.encode("utf-8"))
+
+        seen.add(second)
+        self.assertIsNone(self.corpus.sample("Shop", Difficulty.EASY, seen))
+        self.assertIsNone(self.corpus.sample("Shop", Difficulty.HARD))
+
+    def test_persistence(self):
+        quiz_id = self.corpus.add("Books", Difficulty.HARD, create_quiz(FILTER_QUESTION))
+        self.corpus.close()
+
+        reopened = QuizCorpus(self.path)
+        self.addCleanup(reopened.close)
+        self.assertEqual(reopened.count("Books", Difficulty.HARD), 1)
+        self.assertEqual(reopened.sample("Books", Difficulty.HARD).id, quiz_id)
+        self.assertEqual(reopened.find_duplicate("Books", create_quiz(FILTER_QUESTION_REPHRASED).quiz), quiz_id)
+
+
+if __name__ == '__main__':
+    unittest.main()
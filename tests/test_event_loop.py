@@ -0,0 +1,51 @@
+import asyncio
+import concurrent.futures
+import unittest
+
+from arctic_query_quest.event_loop import BackgroundLoop
+
+
+class TestBackgroundLoop(unittest.TestCase):
+
+    def setUp(self):
+        self.background_loop = BackgroundLoop(name="test-loop")
+
+    def tearDown(self):
+        self.background_loop.stop()
+
+    def test_run_coroutines_concurrently(self):
+        async def generate(number: int) -> int:
+            await asyncio.sleep(0.05)
+            return number
+
+        async def generate_all():
+            return await asyncio.gather(*(generate(number) for number in range(200)))
+
+        self.assertEqual(self.background_loop.run(generate_all(), timeout=2), list(range(200)))
+        self.assertTrue(self.background_loop.running)
+
+    def test_timeout_cancels_task(self):
+        cancelled = concurrent.futures.Future()
+
+        async def slow():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set_result(True)
+                raise
+
+        with self.assertRaises(concurrent.futures.TimeoutError):
+            self.background_loop.run(slow(), timeout=0.05)
+
+        self.assertTrue(cancelled.result(timeout=1))
+
+    def test_stop_cancels_pending_tasks(self):
+        future = self.background_loop.submit(asyncio.sleep(10))
+        self.background_loop.stop()
+
+        self.assertTrue(future.cancelled())
+        self.assertFalse(self.background_loop.running)
+
+
+if __name__ == '__main__':
+    unittest.main()
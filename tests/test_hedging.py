@@ -0,0 +1,80 @@
+import threading
+import time
+import unittest
+
+from arctic_query_quest.hedging import HedgeCancelled, Hedger, LatencyTracker
+
+
+class TestHedging(unittest.TestCase):
+
+    def test_latency_quantile(self):
+        tracker = LatencyTracker()
+        self.assertIsNone(tracker.quantile(0.9))
+
+        for latency in range(1, 11):
+            tracker.record(float(latency))
+        self.assertEqual(tracker.quantile(0.9), 10.0)
+        self.assertEqual(tracker.quantile(0.5), 6.0)
+
+    def test_fast_request_is_not_hedged(self):
+        hedger = Hedger(default_delay=1.0)
+        self.assertEqual(hedger.run(lambda cancel: "quiz"), "quiz")
+
+        stats = hedger.stats()
+        self.assertEqual(stats.requests, 1)
+        self.assertEqual(stats.hedges_fired, 0)
+
+    def test_slow_request_is_hedged_and_cancelled(self):
+        hedger = Hedger(default_delay=0.05)
+        calls = []
+        first_cancelled = threading.Event()
+
+        def generate(cancel: threading.Event) -> str:
+            index = len(calls)
+            calls.append(index)
+            if index == 0:
+                while not cancel.wait(0.01):
+                    pass
+                first_cancelled.set()
+                raise HedgeCancelled()
+            return "hedged quiz"
+
+        self.assertEqual(hedger.run(generate), "hedged quiz")
+        self.assertTrue(first_cancelled.wait(1))
+
+        stats = hedger.stats()
+        self.assertEqual(stats.hedges_fired, 1)
+        self.assertEqual(stats.hedges_won, 1)
+
+    def test_extra_in_flight_cap(self):
+        hedger = Hedger(default_delay=0.01, max_extra_in_flight=1)
+        hedger._extra_in_flight.acquire()
+
+        def generate(cancel: threading.Event) -> str:
+            time.sleep(0.05)
+            return "quiz"
+
+        self.assertEqual(hedger.run(generate), "quiz")
+        self.assertEqual(hedger.stats().hedges_fired, 0)
+        self.assertEqual(hedger.stats().hedges_skipped, 1)
+
+    def test_errors_are_raised_when_all_attempts_fail(self):
+        hedger = Hedger(default_delay=1.0)
+
+        def generate(cancel: threading.Event) -> str:
+            raise ValueError("malformed")
+
+        with self.assertRaises(ValueError):
+            hedger.run(generate)
+
+    def test_adaptive_threshold(self):
+        hedger = Hedger(default_delay=10.0, min_delay=0.5, min_samples=3)
+        self.assertEqual(hedger.threshold(), 10.0)
+
+        for latency in (1.0, 2.0, 3.0):
+            hedger.latencies.record(latency)
+        self.assertEqual(hedger.threshold(), 3.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import json
+import unittest
+
+from arctic_query_quest.json_stream import JsonStreamError, JsonStreamExtractor
+
+ARCTIC_REPLY = """
+    Here is the generated quiz:
+    {
+        "question": "What does `{}` mean in \\"SQL\\"?",
+        "answer_1": "Structured Query Language",
+        "answer_2": "Standard Query Language",
+        "answer_3": "Simple Query Language",
+        "correct_answer": 1,
+        "explanation": "SQL stands for Structured Query Language"
+    }
+    Some more text {"with": "another object"}
+"""
+
+
+def chunked(text: str, size: int) -> list[str]:
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+class TestJsonStreamExtractor(unittest.TestCase):
+
+    def test_extract_first_object_from_chunks(self):
+        for size in (1, 3, 7, 64, len(ARCTIC_REPLY)):
+            extractor = JsonStreamExtractor()
+            consumed = 0
+            for chunk in chunked(ARCTIC_REPLY, size):
+                consumed += 1
+                if extractor.feed(chunk):
+                    break
+
+            quiz = json.loads(extractor.text)
+            self.assertEqual(quiz["question"], 'What does `{}` mean in "SQL"?')
+            self.assertEqual(quiz["correct_answer"], 1)
+            if size < 64:
+                self.assertLess(consumed, len(chunked(ARCTIC_REPLY, size)))
+            self.assertEqual(extractor.members["correct_answer"], "1")
+            self.assertEqual(json.loads(extractor.members["answer_2"]), "Standard Query Language")
+
+    def test_open_member(self):
+        extractor = JsonStreamExtractor()
+        extractor.feed('{"question": "What does')
+        self.assertEqual(extractor.open_member, ("question", "What does"))
+
+        extractor.feed(' SQL mean?", "answer_1": ')
+        self.assertIsNone(extractor.open_member)
+        self.assertEqual(extractor.members, {"question": '"What does SQL mean?"'})
+
+    def test_array_root(self):
+        extractor = JsonStreamExtractor(root="[")
+        self.assertTrue(extractor.feed('Quizzes: [{"question": "a", "nested": [1, 2]}, {"question": "b"}] done'))
+        self.assertEqual(extractor.items, ['{"question": "a", "nested": [1, 2]}', '{"question": "b"}'])
+
+    def test_fail_fast_without_json(self):
+        extractor = JsonStreamExtractor(max_preamble=10)
+        with self.assertRaises(JsonStreamError):
+            extractor.feed("I am sorry, I cannot generate a quiz")
+
+    def test_fail_fast_on_oversized_json(self):
+        extractor = JsonStreamExtractor(max_length=20)
+        with self.assertRaises(JsonStreamError):
+            extractor.feed('{"question": "' + "x" * 50)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+import asyncio
+import os
+import unittest
+
+from replicate.exceptions import ReplicateError
+
+from arctic_query_quest.arctic import ArcticClient
+from arctic_query_quest.tokens import OutputBudget
+from benchmarks.loadtest import run_load_test
+from tests.fakes import FakeReplicate, FakeReplicateConfig, FakeTextToSpeechConfig, Latency
+
+FAST = Latency(0.0)
+
+
+class TestFakeReplicate(unittest.TestCase):
+
+    def setUp(self):
+        os.environ["REPLICATE_API_TOKEN"] = "dummy"
+        self.arctic_client = ArcticClient()
+
+    def tearDown(self):
+        self.arctic_client.close()
+
+    def test_stream_quiz(self):
+        replicate = FakeReplicate(FakeReplicateConfig(time_to_first_token=FAST, tokens_per_second=0))
+        self.arctic_client.client = replicate
+
+        arctic_quiz = self.arctic_client.invoke("Generate a quiz")
+
+        self.assertEqual(arctic_quiz.correct_answer, 1)
+        calls = replicate.calls()
+        self.assertEqual(calls.requests, 1)
+        self.assertGreater(calls.tokens, 0)
+        # the trailing text after the JSON object is never consumed
+        self.assertEqual(calls.cancels, 1)
+
+    def test_ainvoke(self):
+        replicate = FakeReplicate(FakeReplicateConfig(time_to_first_token=FAST, tokens_per_second=0))
+        self.arctic_client.async_client = replicate
+
+        arctic_quiz = asyncio.run(self.arctic_client.ainvoke("Generate a quiz"))
+
+        self.assertEqual(arctic_quiz.correct_answer, 1)
+        self.assertEqual(replicate.calls().cancels, 1)
+
+    def test_ainvoke_cancellation_stops_prediction(self):
+        replicate = FakeReplicate(FakeReplicateConfig(time_to_first_token=FAST, tokens_per_second=20))
+        self.arctic_client.async_client = replicate
+
+        async def cancel_early():
+            task = asyncio.create_task(self.arctic_client.ainvoke("Generate a quiz"))
+            await asyncio.sleep(0.2)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(cancel_early())
+
+        calls = replicate.calls()
+        self.assertEqual(calls.cancels, 1)
+        self.assertLess(calls.tokens, 10)
+
+    def test_truncated_reply_widens_output_budget(self):
+        output_budget = OutputBudget(prior=60, ceiling=7000)
+        arctic_client = ArcticClient(output_budget=output_budget)
+        self.addCleanup(arctic_client.close)
+        replicate = FakeReplicate(FakeReplicateConfig(time_to_first_token=FAST, tokens_per_second=0, seed=1))
+        arctic_client.client = replicate
+
+        arctic_quiz = arctic_client.invoke("Generate a quiz")
+
+        self.assertEqual(arctic_quiz.correct_answer, 1)
+        self.assertEqual(replicate.calls().requests, 2)
+        self.assertEqual(output_budget.truncations, 1)
+
+    def test_max_new_tokens_override(self):
+        replicate = FakeReplicate(FakeReplicateConfig(time_to_first_token=FAST, tokens_per_second=0))
+        self.arctic_client.client = replicate
+
+        with self.assertRaises(ValueError):
+            ArcticClient._extract_json("".join(self.arctic_client._stream("Generate a quiz", max_new_tokens=10)))
+
+        self.assertEqual(replicate.calls().tokens, 10)
+
+    def test_batch(self):
+        self.arctic_client.client = FakeReplicate(FakeReplicateConfig(time_to_first_token=FAST, tokens_per_second=0))
+
+        quiz_batch = self.arctic_client.invoke_batch("ONLY contain a JSON array of 3 objects", 3)
+
+        self.assertEqual(len(quiz_batch.quizzes), 3)
+
+    def test_malformed_reply(self):
+        replicate = FakeReplicate(FakeReplicateConfig(time_to_first_token=FAST, tokens_per_second=0, malformed_rate=1.0))
+
+        prediction = replicate.models.predictions.create("model", input={"prompt": "Generate a quiz"})
+        text = "".join(prediction.output_iterator())
+
+        self.assertEqual(replicate.calls().malformed, 1)
+        with self.assertRaises(ValueError):
+            ArcticClient._extract_json(text)
+
+    def test_error_injection(self):
+        replicate = FakeReplicate(FakeReplicateConfig(error_rate=1.0, error_status=429))
+
+        with self.assertRaises(ReplicateError) as context:
+            replicate.models.predictions.create("model", input={"prompt": "Generate a quiz"})
+
+        self.assertEqual(context.exception.status, 429)
+        self.assertEqual(replicate.calls().errors, 1)
+
+
+class TestLoadTest(unittest.TestCase):
+
+    def test_concurrent_sessions(self):
+        report = run_load_test(
+            sessions=2,
+            replicate_config=FakeReplicateConfig(time_to_first_token=Latency(0.05), tokens_per_second=0, seed=1),
+            tts_config=FakeTextToSpeechConfig(latency=FAST, seed=1),
+            seed=1
+        )
+
+        self.assertEqual(report.failures, [])
+        self.assertEqual(report.completed, 2)
+        self.assertGreater(report.throughput, 0)
+        self.assertGreaterEqual(report.replicate_calls.requests, 1)
+        self.assertGreater(report.peak_rss_bytes, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import json
+import unittest
+
+from arctic_query_quest.metrics import MetricsRegistry
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_span_quantiles(self):
+        registry = MetricsRegistry()
+        for value in range(1, 101):
+            registry.observe("stage_seconds", value / 100, stage="tts")
+
+        with registry.span("parse"):
+            pass
+
+        histograms = {h["labels"]["stage"]: h for h in registry.snapshot()["histograms"]}
+        self.assertEqual(histograms["tts"]["count"], 100)
+        self.assertEqual(histograms["tts"]["p50"], 0.51)
+        self.assertEqual(histograms["tts"]["p99"], 1.0)
+        self.assertEqual(histograms["parse"]["count"], 1)
+
+    def test_span_records_errors(self):
+        registry = MetricsRegistry()
+        with self.assertRaises(ValueError):
+            with registry.span("parse"):
+                raise ValueError("malformed")
+
+        self.assertEqual(registry.snapshot()["histograms"][0]["count"], 1)
+
+    def test_export(self):
+        registry = MetricsRegistry()
+        registry.observe("stage_seconds", 0.25, stage="generation")
+        registry.increment("retries", function="invoke", kind="parse")
+        registry.register_gauge("quiz_pool", lambda: {"hits": 3})
+
+        exported = json.loads(registry.to_json())
+        self.assertEqual(exported["counters"][0]["value"], 1)
+        self.assertEqual(exported["gauges"][0], {"name": "quiz_pool", "labels": {"key": "hits"}, "value": 3})
+
+        prometheus = registry.to_prometheus()
+        self.assertIn("# TYPE arctic_query_quest_stage_seconds summary", prometheus)
+        self.assertIn('arctic_query_quest_stage_seconds{stage="generation",quantile="0.5"} 0.25', prometheus)
+        self.assertIn('arctic_query_quest_retries_total{function="invoke",kind="parse"} 1', prometheus)
+        self.assertIn('arctic_query_quest_quiz_pool{key="hits"} 3', prometheus)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+import threading
+import time
+import unittest
+
+from arctic_query_quest.arctic import ArcticQuiz
+from arctic_query_quest.pool import PooledQuiz, QuizPool
+from arctic_query_quest.prompt import Difficulty
+
+
+def create_quiz(question: str) -> PooledQuiz:
+    return PooledQuiz(
+        quiz=ArcticQuiz(
+            question=question,
+            answer_1="Structured Query Language",
+            answer_2="Standard Query Language",
+            answer_3="Simple Query Language",
+            correct_answer=1,
+            explanation="SQL stands for Structured Query Language"
+        ),
+        speech_question=b"mp3"
+    )
+
+
+def wait_for(condition, timeout: float = 2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise TimeoutError("condition not met")
+        time.sleep(0.01)
+
+
+class TestQuizPool(unittest.TestCase):
+
+    def test_miss_falls_back_to_live_generation(self):
+        calls = []
+
+        def producer(db_model, difficulty):
+            calls.append((db_model, difficulty))
+            return create_quiz(f"{db_model}-{difficulty.name}")
+
+        quiz_pool = QuizPool(producer)
+        pooled_quiz = quiz_pool.take("Shop", Difficulty.EASY)
+
+        self.assertEqual(pooled_quiz.quiz.question, "Shop-EASY")
+        self.assertEqual(calls, [("Shop", Difficulty.EASY)])
+        self.assertEqual(quiz_pool.stats().misses, 1)
+        self.assertEqual(quiz_pool.stats().hits, 0)
+
+    def test_background_refill_up_to_high_watermark(self):
+        counter = iter(range(1000))
+        quiz_pool = QuizPool(lambda db_model, difficulty: create_quiz(str(next(counter))), low_watermark=1, high_watermark=3)
+        quiz_pool.start()
+
+        try:
+            self.assertIsNone(quiz_pool.get("Game", Difficulty.HARD))
+            wait_for(lambda: quiz_pool.stats().sizes.get("Game/HARD") == 3)
+
+            self.assertIsNotNone(quiz_pool.get("Game", Difficulty.HARD))
+            stats = quiz_pool.stats()
+            self.assertEqual(stats.hits, 1)
+            self.assertEqual(stats.misses, 1)
+            self.assertEqual(stats.refills, 3)
+            self.assertGreater(stats.last_refill_lag, 0)
+            self.assertNotIn("Shop/EASY", stats.sizes)
+        finally:
+            quiz_pool.stop(timeout=1)
+
+    def test_refill_errors_are_counted(self):
+        failed = threading.Event()
+
+        def producer(db_model, difficulty):
+            failed.set()
+            raise RuntimeError("replicate unavailable")
+
+        quiz_pool = QuizPool(producer, error_backoff=0.01)
+        quiz_pool.start()
+
+        try:
+            quiz_pool.get("Books", Difficulty.MEDIUM)
+            self.assertTrue(failed.wait(1))
+            wait_for(lambda: quiz_pool.stats().refill_errors >= 1)
+        finally:
+            quiz_pool.stop(timeout=1)
+
+    def test_batch_refill(self):
+        batches = []
+
+        def batch_producer(db_model, difficulty, count):
+            batches.append(count)
+            return [create_quiz(str(i)) for i in range(count)]
+
+        quiz_pool = QuizPool(
+            lambda db_model, difficulty: create_quiz("single"),
+            low_watermark=1,
+            high_watermark=4,
+            batch_producer=batch_producer
+        )
+        quiz_pool.start()
+
+        try:
+            quiz_pool.get("Shop", Difficulty.EASY)
+            wait_for(lambda: quiz_pool.stats().sizes.get("Shop/EASY") == 4)
+            self.assertEqual(batches, [4])
+        finally:
+            quiz_pool.stop(timeout=1)
+
+    def test_put_back_keeps_items_for_other_sessions(self):
+        quiz_pool = QuizPool(lambda db_model, difficulty: create_quiz("live"))
+        quiz_pool.put_back("Shop", Difficulty.EASY, [create_quiz("seen"), create_quiz("fresh")])
+        seen = quiz_pool.get("Shop", Difficulty.EASY)
+        quiz_pool.put_back("Shop", Difficulty.EASY, [seen])
+
+        self.assertEqual(quiz_pool.get("Shop", Difficulty.EASY).quiz.question, "fresh")
+        self.assertEqual(quiz_pool.get("Shop", Difficulty.EASY).quiz.question, "seen")
+
+    def test_invalid_watermarks(self):
+        with self.assertRaises(ValueError):
+            QuizPool(lambda db_model, difficulty: None, low_watermark=4, high_watermark=2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+
+from arctic_query_quest.prompt import Difficulty
+from arctic_query_quest.prompt_optimizer import (
+    PromptOptimizer,
+    SchemaProfile,
+    compact_schema,
+    minify_statement,
+    split_statements
+)
+from arctic_query_quest.tokens import TokenCounter
+
+SCHEMA = """
+CREATE TABLE category (
+    id INTEGER PRIMARY KEY,
+    name VARCHAR
+);
+
+-- products belong to a category
+CREATE TABLE product (
+    id INTEGER PRIMARY KEY,
+    category_id INTEGER,
+    FOREIGN KEY (category_id) REFERENCES category (id)
+);
+
+CREATE TABLE customer (
+    id INTEGER PRIMARY KEY,
+    name VARCHAR
+);
+
+INSERT INTO category (id, name) VALUES (1, 'Games;  and   more');
+INSERT INTO category (id, name) VALUES (2, 'Books');
+INSERT INTO product (id, category_id) VALUES (1, 1);
+INSERT INTO customer (id, name) VALUES (1, 'Alice');
+"""
+
+
+class TestSchemaCompaction(unittest.TestCase):
+
+    def test_split_statements_respects_literals_and_comments(self):
+        statements = split_statements(SCHEMA)
+
+        self.assertEqual(len(statements), 7)
+        self.assertFalse(any("--" in statement for statement in statements))
+        self.assertIn("'Games;  and   more'", statements[3])
+
+    def test_minify_keeps_literals(self):
+        self.assertEqual(
+            minify_statement("INSERT INTO t (a,  b)\n  VALUES (1, 'It''s  here')"),
+            "INSERT INTO t(a,b)VALUES(1,'It''s  here')"
+        )
+
+    def test_full_profile_keeps_everything(self):
+        compacted = compact_schema(SCHEMA)
+
+        self.assertEqual(compacted.count("CREATE TABLE"), 3)
+        self.assertEqual(compacted.count("INSERT INTO"), 4)
+        self.assertLess(len(compacted), len(SCHEMA))
+
+    def test_referenced_tables_are_kept(self):
+        compacted = compact_schema(SCHEMA, SchemaProfile(max_tables=1, sample_rows=1))
+
+        self.assertIn("CREATE TABLE category", compacted)
+        self.assertNotIn("CREATE TABLE product", compacted)
+        self.assertNotIn("customer", compacted)
+        self.assertEqual(compacted.count("INSERT INTO category"), 1)
+
+        compacted = compact_schema(SCHEMA, SchemaProfile(max_tables=2))
+        self.assertIn("CREATE TABLE product", compacted)
+        self.assertIn("CREATE TABLE category", compacted)
+
+
+class TestPromptOptimizer(unittest.TestCase):
+
+    def test_compact_reports_token_counts(self):
+        prompt_optimizer = PromptOptimizer(TokenCounter(tokenizer_name=None))
+
+        schema = prompt_optimizer.compact("Shop", SCHEMA, Difficulty.EASY)
+
+        self.assertIs(prompt_optimizer.compact("Shop", SCHEMA, Difficulty.EASY), schema)
+        tokens = prompt_optimizer.report()[("Shop", Difficulty.EASY)]
+        self.assertGreater(tokens.saved, 0)
+        self.assertEqual(tokens.compacted, TokenCounter(tokenizer_name=None).count(schema))
+
+    def test_changed_model_is_compacted_again(self):
+        prompt_optimizer = PromptOptimizer(TokenCounter(tokenizer_name=None), minify=False)
+
+        prompt_optimizer.compact("Shop", SCHEMA, Difficulty.HARD)
+        schema = prompt_optimizer.compact("Shop", SCHEMA.replace("customer", "client"), Difficulty.HARD)
+
+        self.assertIn("client", schema)
+
+
+if __name__ == '__main__':
+    unittest.main()
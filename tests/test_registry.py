@@ -0,0 +1,86 @@
+import threading
+import unittest
+
+from arctic_query_quest.registry import ResourceRegistry
+
+
+class Resource:
+
+    def __init__(self):
+        self.closed = False
+
+    def healthy(self) -> bool:
+        return not self.closed
+
+    def close(self):
+        self.closed = True
+
+
+class TestResourceRegistry(unittest.TestCase):
+
+    def test_lazy_single_construction(self):
+        registry = ResourceRegistry()
+        created = []
+        barrier = threading.Barrier(8)
+
+        def factory():
+            created.append(1)
+            return Resource()
+
+        registry.register("resource", factory)
+        self.assertEqual(created, [])
+
+        instances = []
+
+        def get():
+            barrier.wait()
+            instances.append(registry.get("resource"))
+
+        threads = [threading.Thread(target=get) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(created), 1)
+        self.assertTrue(all(instance is instances[0] for instance in instances))
+
+    def test_unhealthy_resource_is_rebuilt(self):
+        registry = ResourceRegistry()
+        registry.register("resource", Resource, health_check=Resource.healthy, close=Resource.close, health_interval=0)
+
+        first = registry.get("resource")
+        first.closed = True
+        self.assertEqual(registry.health(), {"resource": False})
+
+        second = registry.get("resource")
+        self.assertIsNot(first, second)
+        self.assertEqual(registry.health(), {"resource": True})
+
+    def test_dependents_are_rebuilt_with_unhealthy_dependency(self):
+        registry = ResourceRegistry()
+        registry.register("client", Resource, health_check=Resource.healthy, close=Resource.close, health_interval=0)
+        registry.register("generator", lambda: [registry.get("client")], depends_on=("client",))
+
+        first = registry.get("generator")
+        first[0].closed = True
+
+        second = registry.get("generator")
+        self.assertIsNot(first, second)
+        self.assertFalse(second[0].closed)
+
+    def test_shutdown_closes_in_reverse_order(self):
+        registry = ResourceRegistry()
+        closed = []
+        registry.register("first", Resource, close=lambda resource: closed.append("first"))
+        registry.register("second", lambda: registry.get("first"), close=lambda resource: closed.append("second"))
+
+        registry.get("second")
+        registry.shutdown()
+
+        self.assertEqual(closed, ["second", "first"])
+        self.assertEqual(registry.health(), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+import asyncio
+import os
+import time
+import unittest
+from contextlib import aclosing
+
+from arctic_query_quest.arctic import ArcticClient
+from arctic_query_quest.replicate_stream import (
+    MAX_CONNECTION_ERRORS,
+    EventParser,
+    ReplicateAPIError,
+    ReplicateStreamClient,
+    ServerSentEvent,
+)
+from arctic_query_quest.resilience import ErrorKind, classify_error
+from tests.fake_replicate_server import FakeReplicateServer
+from tests.fakes import FakeReplicateConfig, Latency
+
+MODEL = "snowflake/snowflake-arctic-instruct"
+
+
+class TestEventParser(unittest.TestCase):
+
+    def test_events(self):
+        parser = EventParser()
+        lines = [": keep-alive", "", "event: output", "data: SELECT", "", "event: output", "data: a", "data: b", "",
+                 "event: done", "data: {}", ""]
+        events = [event for line in lines if (event := parser.feed(line)) is not None]
+
+        self.assertEqual(events, [
+            ServerSentEvent(event="output", data="SELECT"),
+            ServerSentEvent(event="output", data="a\nb"),
+            ServerSentEvent(event="done", data="{}")
+        ])
+
+    def test_data_keeps_inner_spaces(self):
+        parser = EventParser()
+        parser.feed("event: output")
+        parser.feed("data:  JOIN")
+
+        self.assertEqual(parser.feed(""), ServerSentEvent(event="output", data=" JOIN"))
+
+
+class TestReplicateStreamClient(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeReplicateServer(FakeReplicateConfig(time_to_first_token=Latency(0.0), tokens_per_second=100))
+        self.server.start()
+        self.addCleanup(self.server.stop)
+        self.client = ReplicateStreamClient(api_token="dummy", base_url=self.server.base_url)
+        self.addCleanup(self.client.close)
+
+    def test_stream(self):
+        prediction = self.client.create(MODEL, {"prompt": "Generate a quiz"})
+        text = "".join(self.client.stream(prediction))
+
+        self.assertIn('"correct_answer": 1', text)
+        self.assertEqual(self.server.replicate.calls().cancels, 0)
+
+    def test_cancel_mid_stream(self):
+        prediction = self.client.create(MODEL, {"prompt": "Generate a quiz"})
+        outputs = self.client.stream(prediction)
+        next(outputs)
+        outputs.close()
+        self.client.cancel(prediction)
+        time.sleep(0.1)
+
+        calls = self.server.replicate.calls()
+        self.assertEqual(calls.cancels, 1)
+        self.assertLess(calls.tokens, 20)
+
+    def test_error_status(self):
+        self.server.replicate.config.error_rate = 1.0
+
+        with self.assertRaises(ReplicateAPIError) as context:
+            self.client.create(MODEL, {"prompt": "Generate a quiz"})
+
+        self.assertEqual(context.exception.status, 503)
+        self.assertEqual(classify_error(context.exception), ErrorKind.TRANSIENT)
+
+    def test_connection_errors_make_client_unhealthy(self):
+        import httpx
+
+        client = ReplicateStreamClient(api_token="dummy", base_url=self.server.base_url)
+        self.addCleanup(client.close)
+        self.server.stop()
+
+        for _ in range(MAX_CONNECTION_ERRORS):
+            self.assertTrue(client.healthy())
+            with self.assertRaises(httpx.TransportError):
+                client.create(MODEL, {"prompt": "Generate a quiz"})
+
+        self.assertFalse(client.healthy())
+
+    def test_astream(self):
+        async def stream() -> str:
+            prediction = await self.client.acreate(MODEL, {"prompt": "Generate a quiz"})
+            async with aclosing(self.client.astream(prediction)) as outputs:
+                text = "".join([output async for output in outputs])
+            await self.client.aclose()
+            return text
+
+        self.assertIn('"correct_answer": 1', asyncio.run(stream()))
+
+    def test_arctic_client_records_usage(self):
+        os.environ["REPLICATE_API_TOKEN"] = "dummy"
+        arctic_client = ArcticClient()
+        self.addCleanup(arctic_client.close)
+        arctic_client.client = self.client
+
+        arctic_quiz = arctic_client.invoke("Generate a quiz")
+
+        self.assertEqual(arctic_quiz.correct_answer, 1)
+        usage = arctic_client.recent_calls[-1]
+        self.assertIsNotNone(usage.prediction_id)
+        self.assertGreater(usage.chunks, 0)
+        self.assertGreater(usage.seconds, usage.time_to_first_token)
+        # the trailing text after the JSON object is never streamed
+        self.assertTrue(usage.canceled)
+        self.assertEqual(self.server.replicate.calls().cancels, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,181 @@
+import asyncio
+import json
+import unittest
+
+from arctic_query_quest.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    CircuitState,
+    ErrorKind,
+    RetryBudget,
+    RetryPolicy,
+    classify_error,
+    resilient,
+)
+
+
+class StatusError(Exception):
+
+    def __init__(self, status: int):
+        super().__init__(f"status {status}")
+        self.status = status
+
+
+class TestResilience(unittest.TestCase):
+
+    def test_classify_error(self):
+        self.assertEqual(classify_error(json.JSONDecodeError("invalid", "", 0)), ErrorKind.PARSE)
+        self.assertEqual(classify_error(StatusError(429)), ErrorKind.TRANSIENT)
+        self.assertEqual(classify_error(StatusError(503)), ErrorKind.TRANSIENT)
+        self.assertEqual(classify_error(StatusError(401)), ErrorKind.FATAL)
+        self.assertEqual(classify_error(ConnectionError("reset")), ErrorKind.TRANSIENT)
+
+    def test_backoff_with_jitter(self):
+        policy = RetryPolicy(base_delay=1.0, max_delay=5.0)
+        for attempt in range(6):
+            delay = policy.delay(attempt, ErrorKind.TRANSIENT)
+            self.assertGreaterEqual(delay, 0)
+            self.assertLessEqual(delay, min(5.0, 2 ** attempt))
+        self.assertEqual(policy.delay(5, ErrorKind.PARSE), policy.parse_delay)
+
+    def test_retries_until_success(self):
+        delays = []
+        calls = iter([ValueError("malformed"), StatusError(429), "quiz"])
+
+        @resilient(RetryPolicy(max_attempts=3), budget=None, sleep=delays.append)
+        def invoke():
+            result = next(calls)
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        self.assertEqual(invoke(), "quiz")
+        self.assertEqual(len(delays), 2)
+        self.assertEqual(delays[0], RetryPolicy().parse_delay)
+
+    def test_retries_coroutines(self):
+        delays = []
+        calls = iter([StatusError(503), "quiz"])
+
+        async def sleep(delay: float):
+            delays.append(delay)
+
+        @resilient(RetryPolicy(max_attempts=3), breaker=CircuitBreaker("async"), budget=None, async_sleep=sleep)
+        async def ainvoke():
+            result = next(calls)
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        self.assertEqual(asyncio.run(ainvoke()), "quiz")
+        self.assertEqual(len(delays), 1)
+
+    def test_fatal_errors_are_not_retried(self):
+        calls = []
+
+        @resilient(RetryPolicy(max_attempts=5), budget=None, sleep=lambda _: None)
+        def invoke():
+            calls.append(1)
+            raise StatusError(401)
+
+        with self.assertRaises(StatusError):
+            invoke()
+        self.assertEqual(len(calls), 1)
+
+    def test_only_listed_errors_are_retried(self):
+        calls = []
+
+        @resilient(RetryPolicy(max_attempts=5), budget=None, sleep=lambda _: None, retry_on=(ValueError,))
+        def invoke():
+            calls.append(1)
+            raise StatusError(503) if len(calls) > 1 else ValueError("rejected")
+
+        with self.assertRaises(StatusError):
+            invoke()
+        self.assertEqual(len(calls), 2)
+
+    def test_keyboard_interrupt_is_not_retried(self):
+        calls = []
+
+        @resilient(RetryPolicy(max_attempts=5), budget=None, sleep=lambda _: None)
+        def invoke():
+            calls.append(1)
+            raise KeyboardInterrupt()
+
+        with self.assertRaises(KeyboardInterrupt):
+            invoke()
+        self.assertEqual(len(calls), 1)
+
+    def test_retry_budget(self):
+        budget = RetryBudget(ratio=0.5, min_per_second=0, max_tokens=1)
+        calls = []
+
+        @resilient(RetryPolicy(max_attempts=5), budget=budget, sleep=lambda _: None)
+        def invoke():
+            calls.append(1)
+            raise StatusError(503)
+
+        with self.assertRaises(StatusError):
+            invoke()
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(budget.exhausted, 1)
+
+    def test_circuit_breaker_opens_and_recovers(self):
+        breaker = CircuitBreaker("test", failure_rate=0.5, window=4, min_calls=4, open_duration=0)
+
+        for _ in range(4):
+            breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitState.HALF_OPEN)
+
+        breaker.allow()
+        with self.assertRaises(CircuitOpenError):
+            breaker.allow()
+
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitState.CLOSED)
+
+    def test_circuit_breaker_short_circuits_calls(self):
+        breaker = CircuitBreaker("test", window=2, min_calls=2, open_duration=60)
+        calls = []
+
+        @resilient(RetryPolicy(max_attempts=2), breaker=breaker, budget=None, sleep=lambda _: None)
+        def invoke():
+            calls.append(1)
+            raise StatusError(503)
+
+        with self.assertRaises(StatusError):
+            invoke()
+
+        with self.assertRaises(CircuitOpenError) as context:
+            invoke()
+        self.assertEqual(len(calls), 2)
+        self.assertGreater(context.exception.retry_after, 0)
+
+    def test_parse_errors_do_not_open_circuit(self):
+        breaker = CircuitBreaker("test", window=2, min_calls=2)
+
+        for _ in range(5):
+            with self.assertRaises(ValueError):
+                with breaker.guard():
+                    raise ValueError("malformed")
+
+        self.assertEqual(breaker.state, CircuitState.CLOSED)
+
+    def test_cancelled_probe_releases_half_open_circuit(self):
+        breaker = CircuitBreaker("test", window=2, min_calls=2, open_duration=0)
+        breaker.record_failure()
+        breaker.record_failure()
+
+        with self.assertRaises(asyncio.CancelledError):
+            with breaker.guard():
+                raise asyncio.CancelledError()
+
+        # the next call probes instead of being rejected forever
+        self.assertEqual(breaker.state, CircuitState.HALF_OPEN)
+        with breaker.guard():
+            pass
+        self.assertEqual(breaker.state, CircuitState.CLOSED)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import unittest
+
+from arctic_query_quest.arctic import ArcticQuiz
+from arctic_query_quest.session_store import ANSWERS_AUDIO, EXPLANATION_AUDIO, SessionStore
+
+
+def create_quiz(question: str = "What stands SQL for?") -> ArcticQuiz:
+    return ArcticQuiz(
+        question=question,
+        answer_1="Structured Query Language",
+        answer_2="Standard Query Language",
+        answer_3="Simple Query Language",
+        correct_answer=1,
+        explanation="SQL stands for Structured Query Language"
+    )
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestSessionStore(unittest.TestCase):
+
+    def test_audio_is_shared_between_sessions(self):
+        session_store = SessionStore()
+        for session_id in ("first", "second"):
+            session_store.set_quiz(session_id, create_quiz())
+            session_store.set_audio(session_id, EXPLANATION_AUDIO, b"x" * 1000)
+
+        stats = session_store.stats()
+        self.assertEqual(session_store.audio("second", EXPLANATION_AUDIO), b"x" * 1000)
+        self.assertEqual(stats.audio_entries, 1)
+        self.assertEqual(stats.deduplicated_bytes, 1000)
+
+        session_store.drop("first")
+        session_store.drop("second")
+        self.assertEqual(session_store.stats().resident_bytes, 0)
+
+    def test_new_quiz_releases_audio(self):
+        session_store = SessionStore()
+        session_store.set_quiz("session", create_quiz())
+        session_store.set_audio("session", EXPLANATION_AUDIO, b"x" * 1000)
+        # a rerun showing the same quiz keeps its audio
+        session_store.set_quiz("session", create_quiz())
+        self.assertIsNotNone(session_store.audio("session", EXPLANATION_AUDIO))
+
+        session_store.set_quiz("session", create_quiz("What does `COUNT(*)` return?"))
+
+        self.assertIsNone(session_store.audio("session", EXPLANATION_AUDIO))
+        self.assertEqual(session_store.stats().audio_entries, 0)
+
+    def test_audio_of_replaced_quiz_is_dropped(self):
+        session_store = SessionStore()
+        first_quiz = create_quiz()
+        session_store.set_quiz("session", first_quiz)
+        session_store.set_quiz("session", create_quiz("What does `COUNT(*)` return?"))
+
+        # speech of the first quiz finished after the session moved on
+        self.assertFalse(session_store.set_audio("session", EXPLANATION_AUDIO, b"x" * 1000, quiz=first_quiz))
+        self.assertIsNone(session_store.audio("session", EXPLANATION_AUDIO))
+        self.assertFalse(session_store.set_audio("dropped", EXPLANATION_AUDIO, b"x" * 1000, quiz=first_quiz))
+        self.assertIsNone(session_store.quiz("dropped"))
+        self.assertEqual(session_store.stats().audio_entries, 0)
+
+        current_quiz = session_store.quiz("session")
+        self.assertTrue(session_store.set_audio("session", EXPLANATION_AUDIO, b"x" * 1000, quiz=current_quiz))
+        self.assertIsNotNone(session_store.audio("session", EXPLANATION_AUDIO))
+
+    def test_session_limit_evicts_oldest_audio(self):
+        session_store = SessionStore(max_session_bytes=2000)
+        session_store.set_quiz("session", create_quiz())
+        session_store.set_audio("session", ANSWERS_AUDIO, b"a" * 1000)
+        session_store.set_audio("session", EXPLANATION_AUDIO, b"e" * 1000)
+
+        self.assertIsNone(session_store.audio("session", ANSWERS_AUDIO))
+        self.assertIsNotNone(session_store.audio("session", EXPLANATION_AUDIO))
+        self.assertLessEqual(session_store.session_bytes("session"), 2000)
+        self.assertEqual(session_store.stats().evicted_audio, 1)
+
+    def test_total_limit_evicts_least_recently_seen(self):
+        session_store = SessionStore(max_total_bytes=2000)
+        session_store.set_quiz("idle", create_quiz())
+        session_store.set_audio("idle", EXPLANATION_AUDIO, b"i" * 1000)
+        session_store.set_quiz("active", create_quiz())
+        session_store.set_audio("active", EXPLANATION_AUDIO, b"a" * 1000)
+
+        self.assertIsNone(session_store.audio("idle", EXPLANATION_AUDIO))
+        self.assertIsNotNone(session_store.quiz("idle"))
+        self.assertIsNotNone(session_store.audio("active", EXPLANATION_AUDIO))
+        self.assertLessEqual(session_store.stats().resident_bytes, 2000)
+
+    def test_stale_sessions_are_evicted(self):
+        clock = FakeClock()
+        session_store = SessionStore(idle_ttl=60, clock=clock)
+        session_store.set_quiz("stale", create_quiz())
+        session_store.set_audio("stale", EXPLANATION_AUDIO, b"x" * 1000)
+        clock.now = 30
+        session_store.set_quiz("fresh", create_quiz())
+
+        clock.now = 70
+        self.assertEqual(session_store.evict_stale(), 1)
+
+        self.assertIsNone(session_store.quiz("stale"))
+        self.assertIsNotNone(session_store.quiz("fresh"))
+        stats = session_store.stats()
+        self.assertEqual(stats.evicted_sessions, 1)
+        self.assertEqual(stats.audio_entries, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
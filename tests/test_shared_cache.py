@@ -0,0 +1,269 @@
+import asyncio
+import tempfile
+import threading
+import time
+import unittest
+
+from arctic_query_quest.shared_cache import (
+    CacheBackend,
+    KeyValueBackend,
+    LocalKeyValueStore,
+    MemoryBackend,
+    SharedCache,
+    SQLiteBackend,
+    create_backend
+)
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class BrokenBackend(CacheBackend):
+
+    def get(self, key: str) -> bytes | None:
+        raise ConnectionError("unreachable")
+
+    def set(self, key: str, value: bytes, ttl: float | None = None):
+        raise ConnectionError("unreachable")
+
+    def add(self, key: str, value: bytes, ttl: float | None = None) -> bool:
+        raise ConnectionError("unreachable")
+
+    def delete(self, key: str):
+        raise ConnectionError("unreachable")
+
+    def delete_if(self, key: str, value: bytes) -> bool:
+        raise ConnectionError("unreachable")
+
+
+class HandOverBackend(MemoryBackend):
+    # another replica holds the lease, stores its value and releases the lease right after the second lookup
+
+    def __init__(self):
+        super().__init__()
+        self.lookups = 0
+
+    def get(self, key: str) -> bytes | None:
+        value = super().get(key)
+        self.lookups += 1
+        if self.lookups == 2:
+            super().set(key, b"shared")
+        return value
+
+    def add(self, key: str, value: bytes, ttl: float | None = None) -> bool:
+        return self.lookups >= 2 and super().add(key, value, ttl)
+
+
+class TestBackends(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.clock = FakeClock()
+
+    def backends(self) -> dict[str, CacheBackend]:
+        sqlite = SQLiteBackend(f"{self.directory.name}/shared.sqlite", clock=self.clock)
+        self.addCleanup(sqlite.close)
+        return {
+            "memory": MemoryBackend(clock=self.clock),
+            "sqlite": sqlite,
+            "key-value": KeyValueBackend(LocalKeyValueStore(clock=self.clock))
+        }
+
+    def test_ttl(self):
+        for name, backend in self.backends().items():
+            with self.subTest(name):
+                backend.set("key", b"value", ttl=10)
+                backend.set("forever", b"value")
+                self.assertEqual(backend.get("key"), b"value")
+
+                self.clock.now += 11
+                self.assertIsNone(backend.get("key"))
+                self.assertEqual(backend.get("forever"), b"value")
+
+    def test_add_only_if_absent(self):
+        for name, backend in self.backends().items():
+            with self.subTest(name):
+                self.assertTrue(backend.add("lease", b"first", ttl=5))
+                self.assertFalse(backend.add("lease", b"second", ttl=5))
+                self.assertEqual(backend.get("lease"), b"first")
+
+                # an expired lease can be taken over
+                self.clock.now += 6
+                self.assertTrue(backend.add("lease", b"second", ttl=5))
+
+                backend.delete("lease")
+                self.assertIsNone(backend.get("lease"))
+
+    def test_delete_only_own_value(self):
+        for name, backend in self.backends().items():
+            with self.subTest(name):
+                backend.add("lease", b"first", ttl=5)
+                self.assertFalse(backend.delete_if("lease", b"second"))
+                self.assertEqual(backend.get("lease"), b"first")
+
+                self.assertTrue(backend.delete_if("lease", b"first"))
+                self.assertIsNone(backend.get("lease"))
+
+    def test_memory_evicts_least_recently_used(self):
+        backend = MemoryBackend(max_bytes=10)
+        backend.set("first", b"12345")
+        backend.set("second", b"12345")
+        backend.get("first")
+        backend.set("third", b"12345")
+
+        self.assertEqual(backend.get("first"), b"12345")
+        self.assertIsNone(backend.get("second"))
+
+    def test_sqlite_is_shared_and_bounded(self):
+        path = f"{self.directory.name}/bounded.sqlite"
+        first = SQLiteBackend(path, max_bytes=10, clock=self.clock)
+        second = SQLiteBackend(path, max_bytes=10, clock=self.clock)
+        self.addCleanup(first.close)
+        self.addCleanup(second.close)
+
+        first.set("first", b"12345")
+        self.clock.now += 1
+        second.set("second", b"12345")
+        self.clock.now += 1
+        self.assertEqual(second.get("first"), b"12345")
+        self.clock.now += 1
+        first.set("third", b"12345")
+
+        self.assertEqual(second.get("first"), b"12345")
+        self.assertIsNone(second.get("second"))
+        self.assertEqual(second.get("third"), b"12345")
+
+    def test_create_backend(self):
+        self.assertIsInstance(create_backend(), MemoryBackend)
+        self.assertIsInstance(create_backend("local"), KeyValueBackend)
+        with self.assertRaises(ValueError):
+            create_backend("unknown")
+
+
+class TestSharedCache(unittest.TestCase):
+
+    def test_single_flight_within_process(self):
+        cache = SharedCache(MemoryBackend(), "test")
+        calls = []
+        started = threading.Barrier(8)
+
+        def compute() -> bytes:
+            calls.append(1)
+            time.sleep(0.1)
+            return b"audio"
+
+        def call():
+            started.wait()
+            return cache.get_or_compute("key", compute)
+
+        threads = [threading.Thread(target=call) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(cache.get("key"), b"audio")
+        self.assertEqual(cache.stats().computed, 1)
+
+    def test_single_flight_across_replicas(self):
+        # two replicas on one host, sharing a SQLite store
+        with tempfile.TemporaryDirectory() as directory:
+            first_backend = SQLiteBackend(f"{directory}/shared.sqlite")
+            second_backend = SQLiteBackend(f"{directory}/shared.sqlite")
+            first = SharedCache(first_backend, "audio", wait_interval=0.01)
+            second = SharedCache(second_backend, "audio", wait_interval=0.01)
+            computing = threading.Event()
+            calls = []
+
+            def compute() -> bytes:
+                calls.append(1)
+                computing.set()
+                time.sleep(0.2)
+                return b"audio"
+
+            leader = threading.Thread(target=first.get_or_compute, args=("key", compute))
+            leader.start()
+            computing.wait(2)
+            value = second.get_or_compute("key", compute)
+            leader.join()
+            first_backend.close()
+            second_backend.close()
+
+        self.assertEqual(value, b"audio")
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(second.stats().shared, 1)
+
+    def test_value_landed_before_lease_release_is_not_computed_again(self):
+        cache = SharedCache(HandOverBackend(), "audio", wait_interval=0)
+
+        self.assertEqual(cache.get_or_compute("key", lambda: b"computed"), b"shared")
+        self.assertEqual(cache.stats().shared, 1)
+
+    def test_failures_are_not_cached(self):
+        cache = SharedCache(MemoryBackend(), "test")
+
+        def fail() -> bytes:
+            raise ValueError("rejected")
+
+        with self.assertRaises(ValueError):
+            cache.get_or_compute("key", fail)
+
+        # the lease is released, the next call computes again
+        self.assertEqual(cache.get_or_compute("key", lambda: b"value"), b"value")
+
+    def test_unavailable_backend_degrades_to_computing(self):
+        cache = SharedCache(BrokenBackend(), "test")
+
+        self.assertEqual(cache.get_or_compute("key", lambda: b"value"), b"value")
+        self.assertGreater(cache.stats().errors, 0)
+
+    def test_async_single_flight(self):
+        cache = SharedCache(KeyValueBackend(LocalKeyValueStore()), "test")
+        calls = []
+
+        async def compute() -> bytes:
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return b"audio"
+
+        async def call_all():
+            return await asyncio.gather(*(cache.aget_or_compute("key", compute) for _ in range(5)))
+
+        self.assertEqual(asyncio.run(call_all()), [b"audio"] * 5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(cache.stats().coalesced, 4)
+
+    def test_cancelled_leader_hands_over_to_follower(self):
+        cache = SharedCache(KeyValueBackend(LocalKeyValueStore()), "test")
+        calls = []
+
+        async def compute() -> bytes:
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return b"audio"
+
+        async def cancel_leader():
+            leader = asyncio.create_task(cache.aget_or_compute("key", compute))
+            while not calls:
+                await asyncio.sleep(0.001)
+            follower = asyncio.create_task(cache.aget_or_compute("key", compute))
+            await asyncio.sleep(0.01)
+            leader.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await leader
+            return await follower
+
+        self.assertEqual(asyncio.run(cancel_leader()), b"audio")
+        self.assertEqual(len(calls), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
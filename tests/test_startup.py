@@ -0,0 +1,117 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+from arctic_query_quest.startup import ImportProfiler, Startup
+
+ROOT = Path(__file__).parent.parent
+# importing the entry point on top of Streamlit took about 1.6s with these modules loaded eagerly, about four times
+# as long as Streamlit itself, and takes about as long as Streamlit without them
+IMPORT_BUDGET_RATIO = 2.0
+GENERATION_MODULES = (
+    "langchain_community",
+    "langchain_core",
+    "replicate",
+    "google.cloud.texttospeech",
+    "google.oauth2",
+    "streamlit_lottie",
+    "streamlit_js_eval",
+)
+
+MEASURE_IMPORT = f"""
+import json, sys, time
+started = time.perf_counter()
+import streamlit
+streamlit_loaded = time.perf_counter()
+import main
+print(json.dumps({{
+    "streamlit_seconds": streamlit_loaded - started,
+    "main_seconds": time.perf_counter() - streamlit_loaded,
+    "loaded": [name for name in {GENERATION_MODULES!r} if name in sys.modules]
+}}))
+"""
+
+
+class TestImportTime(unittest.TestCase):
+
+    def test_entry_point_imports_no_generation_stack(self):
+        environment = {**os.environ, "PYTHONPATH": os.pathsep.join([str(ROOT), str(ROOT / "arctic_query_quest")])}
+        result = subprocess.run(
+            [sys.executable, "-c", MEASURE_IMPORT],
+            cwd=ROOT,
+            env=environment,
+            capture_output=True,
+            text=True,
+            timeout=60,
+            check=True
+        )
+        measurement = json.loads(result.stdout.strip().splitlines()[-1])
+
+        self.assertEqual(measurement["loaded"], [])
+        # relative to Streamlit measured in the same process, so a slow machine slows down both
+        self.assertLess(measurement["main_seconds"], IMPORT_BUDGET_RATIO * measurement["streamlit_seconds"])
+
+
+class TestImportProfiler(unittest.TestCase):
+
+    def test_nested_imports(self):
+        with tempfile.TemporaryDirectory() as directory:
+            Path(directory, "profiled_outer.py").write_text("import time\nimport profiled_inner\ntime.sleep(0.02)\n")
+            Path(directory, "profiled_inner.py").write_text("import time\ntime.sleep(0.05)\nVALUE = 1\n")
+            sys.path.insert(0, directory)
+            profiler = ImportProfiler()
+            profiler.install()
+            try:
+                import profiled_outer
+            finally:
+                profiler.uninstall()
+                sys.path.remove(directory)
+                sys.modules.pop("profiled_outer", None)
+                sys.modules.pop("profiled_inner", None)
+
+        times = {import_time.module: import_time for import_time in profiler.report()}
+        self.assertEqual(profiled_outer.profiled_inner.VALUE, 1)
+        self.assertGreaterEqual(times["profiled_inner"].seconds, 0.05)
+        self.assertGreaterEqual(times["profiled_outer"].seconds, 0.07)
+        # the inner import is not counted as time of its own of the outer module
+        self.assertLess(times["profiled_outer"].own_seconds, 0.05)
+        # modules keep their original loader
+        self.assertNotIn("_TimedLoader", type(profiled_outer.__loader__).__name__)
+
+
+class TestStartup(unittest.TestCase):
+
+    def test_first_render_is_recorded_once(self):
+        startup = Startup()
+        startup.first_render()
+        first = startup.first_render_seconds
+        startup.first_render()
+
+        self.assertIsNotNone(first)
+        self.assertEqual(startup.first_render_seconds, first)
+
+    def test_warm_up_runs_once(self):
+        startup = Startup()
+        calls = []
+        done = threading.Event()
+
+        def load():
+            calls.append(1)
+            done.set()
+
+        startup.warm_up(load)
+        startup.warm_up(load)
+        done.wait(2)
+        startup._warm_up.join(2)
+
+        self.assertEqual(calls, [1])
+        self.assertIsNotNone(startup.warm_up_seconds)
+
+
+if __name__ == '__main__':
+    unittest.main()
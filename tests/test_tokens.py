@@ -0,0 +1,74 @@
+import unittest
+
+from arctic_query_quest.arctic import quiz_reply_tokens
+from arctic_query_quest.tokens import OutputBudget, TokenCounter, estimate_tokens
+
+
+class TestTokenCounter(unittest.TestCase):
+
+    def test_falls_back_to_estimate(self):
+        token_counter = TokenCounter(tokenizer_name="does-not/exist")
+
+        self.assertEqual(token_counter.count("SELECT * FROM product"), estimate_tokens("SELECT * FROM product"))
+        self.assertFalse(token_counter.exact)
+
+    def test_quiz_reply_prior(self):
+        prior = quiz_reply_tokens(TokenCounter(tokenizer_name=None))
+
+        self.assertGreater(prior, 100)
+        self.assertLess(prior, 1000)
+
+
+class TestOutputBudget(unittest.TestCase):
+
+    def test_prior_until_enough_samples(self):
+        output_budget = OutputBudget(prior=500, ceiling=7000, min_samples=3)
+
+        self.assertEqual(output_budget.limit(), 500)
+        self.assertEqual(output_budget.limit(count=3), 1500)
+
+        for tokens in (200, 180, 220):
+            output_budget.observe(tokens)
+
+        self.assertEqual(output_budget.limit(), 330)
+
+    def test_batches_are_observed_per_quiz(self):
+        output_budget = OutputBudget(prior=500, ceiling=7000, headroom=1.0, min_samples=1)
+
+        output_budget.observe(600, count=3)
+
+        self.assertEqual(output_budget.limit(count=2), 400)
+
+    def test_limited_by_ceiling(self):
+        output_budget = OutputBudget(prior=500, ceiling=1000)
+
+        self.assertEqual(output_budget.limit(count=5), 1000)
+
+    def test_truncation_widens_budget(self):
+        output_budget = OutputBudget(prior=500, ceiling=7000, min_samples=2)
+        output_budget.observe(100)
+        output_budget.observe(100)
+
+        output_budget.truncated()
+
+        # doubled from the observed budget in use, not from the prior
+        self.assertEqual(output_budget.limit(), 300)
+        self.assertEqual(output_budget.truncations, 1)
+        output_budget.truncated()
+        self.assertEqual(output_budget.limit(), 600)
+
+        # the earlier observations are kept, the new ones settle the budget
+        output_budget.observe(400)
+        output_budget.observe(500)
+        self.assertEqual(output_budget.limit(), 750)
+
+    def test_truncation_before_enough_samples(self):
+        output_budget = OutputBudget(prior=500, ceiling=800, min_samples=2)
+
+        output_budget.truncated()
+
+        self.assertEqual(output_budget.limit(), 800)
+
+
+if __name__ == '__main__':
+    unittest.main()
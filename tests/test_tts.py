@@ -0,0 +1,63 @@
+import unittest
+
+from arctic_query_quest.tts import SpeechClient, join_mp3, split_sentences
+from tests.fakes import FakeTextToSpeech, FakeTextToSpeechConfig, Latency, create_private_key
+
+
+def id3_tag(payload: bytes) -> bytes:
+    # header with a syncsafe size, followed by the tag payload
+    size = len(payload)
+    return b"ID3\x04\x00\x00" + bytes([size >> 21 & 0x7F, size >> 14 & 0x7F, size >> 7 & 0x7F, size & 0x7F]) + payload
+
+
+class TestSplitSentences(unittest.TestCase):
+
+    def test_short_sentences_are_merged(self):
+        self.assertEqual(split_sentences("One. Two! Three?", max_chars=100), ["One. Two! Three?"])
+
+    def test_long_text_is_split_at_sentence_boundaries(self):
+        text = "The first sentence is long. The second sentence is long too. A third one."
+
+        chunks = split_sentences(text, max_chars=40)
+
+        self.assertEqual(chunks, ["The first sentence is long.", "The second sentence is long too.", "A third one."])
+        self.assertEqual(" ".join(chunks), text)
+
+    def test_empty_text(self):
+        self.assertEqual(split_sentences("   "), [])
+
+
+class TestJoinMp3(unittest.TestCase):
+
+    def test_keeps_only_leading_id3_tag(self):
+        parts = [id3_tag(b"tag") + b"frames-1", id3_tag(b"other tag") + b"frames-2", b"frames-3"]
+
+        self.assertEqual(join_mp3(parts), id3_tag(b"tag") + b"frames-1frames-2frames-3")
+
+    def test_empty(self):
+        self.assertEqual(join_mp3([]), b"")
+
+
+class TestChunkedSynthesis(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.private_key = create_private_key()
+
+    def test_chunks_are_synthesized_separately_and_joined_in_order(self):
+        tts_client = SpeechClient("project", "key-id", self.private_key, "test@example.com", "1", "https://example.com")
+        self.addCleanup(tts_client.close)
+        text_to_speech = FakeTextToSpeech(FakeTextToSpeechConfig(latency=Latency(0.0)))
+        tts_client.async_client = text_to_speech.asynchronous()
+        text = " ".join(f"Sentence number {number} is here to make the text long enough." for number in range(10))
+
+        audio = tts_client.synthesize_chunked(text)
+
+        self.assertGreater(text_to_speech.calls().requests, 1)
+        self.assertTrue(audio.startswith(b"ID3"))
+        self.assertIn(b"Sentence number 0", audio)
+        self.assertLess(audio.index(b"Sentence number 0"), audio.index(b"Sentence number 9"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import time
+import unittest
+from pathlib import Path
+
+import duckdb
+
+from arctic_query_quest.arctic import ArcticQuiz
+from arctic_query_quest.verifier import QuizRejected, QuizVerifier, extract_statements
+
+MODELS = {name: Path(f"models/{name.lower()}.sql").read_text() for name in ("Shop", "Game", "Books")}
+
+
+def create_quiz(correct_answer: int = 1, answer_1: str = "`SELECT name FROM product WHERE price > 10`") -> ArcticQuiz:
+    return ArcticQuiz(
+        question="How do you list all products which cost more than 10?",
+        answer_1=answer_1,
+        answer_2="`SELECT name FROM products WHERE price > 10`",
+        answer_3="`SELECT name FROM product HAVING price > 10 LIMIT`",
+        correct_answer=correct_answer,
+        explanation="The `product` table is filtered with `WHERE`, for example ```sql\nSELECT * FROM product;\n```"
+    )
+
+
+class TestQuizVerifier(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.verifier = QuizVerifier(MODELS, pool_size=2, execute=True)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.verifier.close()
+
+    def test_extract_statements(self):
+        self.assertEqual(
+            extract_statements("Use `SELECT 1; SELECT 2;` on the `product` table, ```sql\nWITH x AS (SELECT 1) SELECT * FROM x\n```"),
+            ["SELECT 1", "SELECT 2", "WITH x AS (SELECT 1) SELECT * FROM x"]
+        )
+
+    def test_accepts_valid_marked_answer(self):
+        verification = self.verifier.verify("Shop", create_quiz())
+
+        self.assertTrue(verification.accepted)
+        self.assertEqual(len(verification.checks), 4)
+        # unknown table and syntax error in the wrong answers are expected
+        self.assertEqual([check.field for check in verification.failures], ["answer_2", "answer_3"])
+
+    def test_rejects_invalid_marked_answer(self):
+        with self.assertRaises(QuizRejected):
+            self.verifier.ensure_valid("Shop", create_quiz(correct_answer=2))
+        with self.assertRaises(QuizRejected):
+            self.verifier.ensure_valid("Shop", create_quiz(correct_answer=4))
+
+    def test_models_are_isolated(self):
+        with self.assertRaises(QuizRejected):
+            self.verifier.ensure_valid("Game", create_quiz())
+
+    def test_statements_are_not_executed(self):
+        self.verifier.ensure_valid("Shop", create_quiz(answer_1="`UPDATE product SET price = 0`"))
+
+        free_products = self.verifier.connection.execute("SELECT COUNT(*) FROM shop.product WHERE price = 0").fetchone()
+        self.assertEqual(free_products[0], 0)
+
+    def test_execution_on_sample_data(self):
+        # binds fine, but no product name is a number
+        self.assertIn("Conversion Error", self.verifier.check("Shop", "SELECT CAST(name AS INTEGER) FROM product"))
+
+    def test_external_access_is_disabled(self):
+        self.assertIn("Permission Error", self.verifier.check("Shop", "SELECT * FROM read_csv('/etc/hostname')"))
+        with self.assertRaises(duckdb.Error):
+            self.verifier.connection.execute("SET enable_external_access = true")
+
+    def test_verification_is_fast(self):
+        quiz = create_quiz()
+        started = time.perf_counter()
+        for _ in range(50):
+            self.verifier.verify("Shop", quiz)
+        self.assertLess((time.perf_counter() - started) / 50, 0.01)
+
+
+if __name__ == '__main__':
+    unittest.main()